@@ -0,0 +1,168 @@
+"""
+Timing, peak memory and baseline comparison shared by the benchmarks
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+from datetime import datetime
+import numpy as np
+
+# benchmarks are run as scripts from any directory, and import benchUtil
+# first so that the modules of the repository root are found
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.lazy_import import lazyImport
+Fore = lazyImport("colorama", "Fore")
+Style = lazyImport("colorama", "Style")
+
+def measure(func,
+            repeat:int = 5,
+            warmup:int = 1,
+            setup = None) -> dict:
+    """
+    time func and record its peak traced memory
+
+    Timings are taken without tracemalloc, which slows down allocations,
+    and the peak memory is taken from one additional traced call.
+
+    Parameters
+    ----------
+    func: callable without arguments
+    setup: callable without arguments, optional
+        called before every call of func, outside of the measurement
+
+    Return
+    ------
+    dictionary of median and min seconds, and peak_bytes
+    """
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        func()
+    seconds = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "seconds": float(np.median(seconds)),
+        "min_seconds": float(np.min(seconds)),
+        "peak_bytes": int(peak),
+    }
+
+def addThroughput(result:dict,
+                  items:int,
+                  unit:str) -> dict:
+    """
+    add items per second of the median time
+    """
+    result["items"] = int(items)
+    result["unit"] = unit
+    result["items_per_second"] = items / result["seconds"] if result["seconds"] > 0 else float("inf")
+    return result
+
+def getMeta() -> dict:
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def compareBaseline(results:dict,
+                    baseline:dict,
+                    tolerance:float = 0.2,
+                    keys:list = ["seconds", "peak_bytes"]) -> list:
+    """
+    list of regressions of results against a baseline of the same format
+
+    A metric regresses when it exceeds the baseline by more than tolerance
+    (relative). Cases missing from the baseline are not compared.
+
+    Return
+    ------
+    list of dictionaries {"name", "key", "baseline", "value", "ratio"}
+    """
+    regressions = []
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        for key in keys:
+            reference = baseline["results"][name].get(key)
+            if key not in result or not reference:
+                continue
+            ratio = result[key] / reference
+            if ratio > 1 + tolerance:
+                regressions.append({"name": name, "key": key, "baseline": reference,
+                                    "value": result[key], "ratio": ratio})
+    return regressions
+
+def getArgumentParser(description:str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--output", default=None, help="JSON file of the results")
+    parser.add_argument("--baseline", default=None, help="JSON file of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown reported as regression")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", default=None, help="run only the cases whose name contains this string")
+    return parser
+
+def runSuite(cases:dict,
+             args,
+             meta:dict = None) -> int:
+    """
+    run benchmark cases, write and compare the results
+
+    Parameters
+    ----------
+    cases: dictionary {name: callable(repeat) returning a result of measure}
+    args: namespace of getArgumentParser
+
+    Return
+    ------
+    exit code, 1 when a regression against the baseline is found
+    """
+    results = {"meta": getMeta(), "results": dict()}
+    if meta is not None:
+        results["meta"].update(meta)
+    for name, case in cases.items():
+        if args.filter is not None and args.filter not in name:
+            continue
+        result = case(args.repeat)
+        results["results"][name] = result
+        line = "{0:<40} {1:10.4f} s {2:10.1f} MiB".format(name, result["seconds"], result["peak_bytes"] / 2**20)
+        if "items_per_second" in result:
+            line += " {0:14.1f} {1}/s".format(result["items_per_second"], result["unit"])
+        print(line)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compareBaseline(results, baseline, tolerance=args.tolerance)
+        for r in regressions:
+            print(Fore.RED + "regression {0} {1}: {2:.4g} -> {3:.4g} (x{4:.2f})".format(
+                r["name"], r["key"], r["baseline"], r["value"], r["ratio"]) + Style.RESET_ALL)
+        if len(regressions) > 0:
+            return 1
+        print(Fore.GREEN + "no regression against {0}".format(args.baseline) + Style.RESET_ALL)
+    return 0
@@ -0,0 +1,112 @@
+"""
+Offline benchmark of the extraction, caching and windowing hot paths
+
+Features are produced by syntheticExtractor, so that neither media files
+nor the dlib model are needed. Shapes follow the lombard grid corpus:
+3 s utterances of 68 landmarks at 25 fps and 20 MFCC coefficients.
+
+    python benchmark/featureBenchmark.py --output result.json
+    python benchmark/featureBenchmark.py --baseline result.json
+"""
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+
+from benchUtil import measure, addThroughput, getArgumentParser, runSuite
+from featureExtractor import batchExtractor, padStack
+from syntheticExtractor import syntheticExtractor
+from mixNoise import mixNoise
+
+WINDOW_SETTINGS = [(10, 1), (20, 4), (40, 10)]
+
+def getRecipe(num_files:int) -> dict:
+    fileList = ["s{0}_utt{1}".format(i % 8, i) for i in range(num_files)]
+    return {
+        "visual": [f + ".mov" for f in fileList],
+        "audio": [f + ".wav" for f in fileList],
+    }
+
+def getCases(work_dir:str,
+             num_files:int = 64) -> dict:
+    """
+    dictionary {name: callable(repeat)} of benchmark cases
+    """
+    recipe = getRecipe(num_files)
+    cache_dir = os.path.join(work_dir, "cache") + "/"
+    # 3 s utterances at 25 fps
+    fextractor = syntheticExtractor(cache_dir=cache_dir, num_frames=75, num_frames_jitter=10, audio_extra_frames=2)
+    features = {(f, modality): fextractor._extractFeature(f, modality=modality)
+                for modality in recipe.keys() for f in recipe[modality]}
+    num_bytes = sum(f.nbytes for f in features.values())
+
+    def saveCache():
+        for (f, modality), feature in features.items():
+            fextractor.getCachePath(f, modality)
+            os.makedirs(os.path.dirname(fextractor.cachePath), exist_ok=True)
+            fextractor._saveToCache(features_list=feature)
+
+    def clearCache():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    def ensureCache():
+        if not os.path.exists(cache_dir):
+            saveCache()
+
+    def loadCache():
+        for (f, modality) in features.keys():
+            fextractor.getCachePath(f, modality)
+            fextractor._loadFromCache(f, modality=modality)
+
+    cases = dict()
+    cases["cache_save"] = lambda repeat: addThroughput(
+        measure(saveCache, repeat=repeat, setup=clearCache), num_bytes, "bytes")
+    cases["cache_load"] = lambda repeat: addThroughput(
+        measure(loadCache, repeat=repeat, setup=ensureCache), num_bytes, "bytes")
+
+    def windowCase(window_size, sample_shift):
+        be = batchExtractor(fextractor, window_size=window_size, cache_dir=cache_dir, sample_shift=sample_shift)
+        num_sample = sum(be._getNumSample(min(len(features[(v, "visual")]), len(features[(a, "audio")])))
+                         for v, a in zip(recipe["visual"], recipe["audio"]))
+
+        def run():
+            be.getCachePath("window", "")
+            be._extractFeature(recipe=recipe, isFlattened=True, isOnehot=False)
+
+        def stream():
+            for batch in be.iter_batches(recipe, batch_size=256, shuffle_buffer=1024, isFlattened=True, seed=0):
+                pass
+
+        return {
+            "window_w{0}_s{1}".format(window_size, sample_shift): lambda repeat: addThroughput(
+                measure(run, repeat=repeat, setup=ensureCache), num_sample, "samples"),
+            "iter_batches_w{0}_s{1}".format(window_size, sample_shift): lambda repeat: addThroughput(
+                measure(stream, repeat=repeat, setup=ensureCache), num_sample, "samples"),
+        }
+
+    for window_size, sample_shift in WINDOW_SETTINGS:
+        cases.update(windowCase(window_size, sample_shift))
+
+    rng = np.random.RandomState(0)
+    ragged = [rng.randn(rng.randint(50, 150), 68*2) for _ in range(num_files * 4)]
+    cases["padStack"] = lambda repeat: addThroughput(
+        measure(lambda: padStack(ragged), repeat=repeat), len(ragged), "arrays")
+
+    # 10 s of speech and 3 s of noise at 16 kHz
+    signal = (rng.randn(16000 * 10) * 3000).astype(np.int16)
+    noise = (rng.randn(16000 * 3) * 3000).astype(np.int16)
+    cases["mixNoise"] = lambda repeat: addThroughput(
+        measure(lambda: mixNoise(signal, noise, snr=0, dtype=np.int16), repeat=repeat), len(signal), "samples")
+    return cases
+
+def main(argv=None) -> int:
+    parser = getArgumentParser("benchmark of extraction, caching and windowing on synthetic data")
+    parser.add_argument("--num_files", type=int, default=64)
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as work_dir:
+        return runSuite(getCases(work_dir, num_files=args.num_files), args,
+                        meta={"num_files": args.num_files})
+
+if __name__ == "__main__":
+    sys.exit(main())
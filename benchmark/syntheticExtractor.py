@@ -0,0 +1,54 @@
+"""
+Feature extractor of landmark-like and MFCC-like arrays without any media
+file or dlib model, shared by the benchmarks and the tests
+
+The repository root is put on the path by benchUtil for the benchmark
+scripts, and by the tests themselves.
+"""
+import hashlib
+import numpy as np
+
+from featureExtractor import featureExtractor
+
+class syntheticExtractor(featureExtractor):
+    """
+    Deterministic features of a file name
+
+    Parameters
+    ----------
+    num_frames: int, optional
+        minimum number of visual frames of a file
+    num_frames_jitter: int, optional
+        up to num_frames_jitter - 1 frames are added per file
+    audio_extra_frames: int, optional
+        number of audio frames beyond the visual ones, as MFCCs of a clip
+        are slightly longer than its video
+    """
+    def __init__(self,
+                 cache_dir:str,
+                 num_frames:int = 60,
+                 num_frames_jitter:int = 40,
+                 audio_extra_frames:int = 3,
+                 **kwargs):
+        super().__init__(cache_dir=cache_dir, **kwargs)
+        self.num_frames = num_frames
+        self.num_frames_jitter = num_frames_jitter
+        self.audio_extra_frames = audio_extra_frames
+
+    def getDim(self, modality):
+        return 68*2 if modality == "visual" else 20
+
+    def _extractFeature(self,
+                        fileName:str,
+                        modality:str = "",
+                        verbose:int = 0,
+                        **kwargs):
+        seed = int(hashlib.md5(fileName.encode()).hexdigest(), 16) % 2**32
+        rng = np.random.RandomState(seed)
+        length = self.num_frames + seed % self.num_frames_jitter
+        if modality == "visual":
+            return rng.randint(-100, 100, size=(length, 68, 2))
+        elif modality == "label":
+            return rng.randint(0, 3, size=length)
+        else:
+            return rng.randn(length + self.audio_extra_frames, 20).astype(np.float32)
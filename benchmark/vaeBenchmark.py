@@ -0,0 +1,142 @@
+"""
+CPU training throughput of build_vae configurations
+
+Every configuration of the grid is built and trained with train_on_batch
+for a fixed number of steps on synthetic data, in its own process so that
+the TensorFlow thread settings apply and the peak RSS is its own.
+
+    python benchmark/vaeBenchmark.py --input_shapes 136 20x136x1 --latent_dims 2 16 \
+        --batch_sizes 64 256 --intra_op 0 4 --output vae.json
+"""
+import os
+import sys
+import io
+import json
+import time
+import argparse
+import resource
+import itertools
+import contextlib
+import subprocess
+import numpy as np
+
+from benchUtil import getArgumentParser, runSuite
+
+def parseShape(text:str) -> tuple:
+    """
+    "136" -> (136, ), "20x136x1" -> (20, 136, 1)
+    """
+    return tuple(int(d) for d in text.split("x"))
+
+def getConfigName(config:dict) -> str:
+    return "vae_{0}_z{1}_h{2}_b{3}_intra{4}_inter{5}".format("x".join(str(d) for d in config["input_shape"]),
+                                                              config["latent_dim"],
+                                                              config["intermediate_dim"],
+                                                              config["batch_size"],
+                                                              config["intra_op"],
+                                                              config["inter_op"])
+
+def trainConfig(config:dict) -> dict:
+    """
+    train one configuration in the current process, which must not have
+    run any TensorFlow operation yet
+    """
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(config["intra_op"])
+    tf.config.threading.set_inter_op_parallelism_threads(config["inter_op"])
+    # vae_loss closes over the symbolic tensors of the encoder
+    tf.compat.v1.disable_eager_execution()
+    from vae import build_vae
+
+    input_shape = tuple(config["input_shape"])
+    with contextlib.redirect_stdout(io.StringIO()):
+        vae, encoder, decoder, loss = build_vae(input_shape,
+                                                latent_dim=config["latent_dim"],
+                                                intermediate_dim=config["intermediate_dim"])
+    vae.compile(optimizer="adam", loss=loss)
+
+    rng = np.random.RandomState(0)
+    batches = [rng.rand(config["batch_size"], *input_shape).astype(np.float32) for _ in range(4)]
+    for step in range(config["warmup"]):
+        x = batches[step % len(batches)]
+        vae.train_on_batch(x, x)
+
+    latencies = []
+    for step in range(config["steps"]):
+        x = batches[step % len(batches)]
+        start = time.perf_counter()
+        vae.train_on_batch(x, x)
+        latencies.append(time.perf_counter() - start)
+
+    latencies = np.array(latencies)
+    return {
+        "seconds": float(np.median(latencies)),
+        "min_seconds": float(latencies.min()),
+        "p90_seconds": float(np.percentile(latencies, 90)),
+        "p99_seconds": float(np.percentile(latencies, 99)),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_bytes": int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024),
+        "items": int(config["batch_size"] * config["steps"]),
+        "unit": "samples",
+        "items_per_second": float(config["batch_size"] * config["steps"] / latencies.sum()),
+        "num_params": int(vae.count_params()),
+        "intra_op": tf.config.threading.get_intra_op_parallelism_threads(),
+        "inter_op": tf.config.threading.get_inter_op_parallelism_threads(),
+        "config": config,
+    }
+
+def runConfig(config:dict) -> dict:
+    """
+    trainConfig in a fresh Python process
+    """
+    env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL="2")
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--run", json.dumps(config)],
+                                     stderr=subprocess.DEVNULL, env=env)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+def getCases(args) -> dict:
+    """
+    dictionary {name: callable(repeat)} of the grid of configurations
+    """
+    cases = dict()
+    for input_shape, latent_dim, intermediate_dim, batch_size, intra_op, inter_op in itertools.product(
+            args.input_shapes, args.latent_dims, args.intermediate_dims, args.batch_sizes, args.intra_op, args.inter_op):
+        config = {
+            "input_shape": list(parseShape(input_shape)),
+            "latent_dim": latent_dim,
+            "intermediate_dim": intermediate_dim,
+            "batch_size": batch_size,
+            "intra_op": intra_op,
+            "inter_op": inter_op,
+            "steps": args.steps,
+            "warmup": args.warmup,
+        }
+        # repeat is given by steps, each step being one measurement
+        cases[getConfigName(config)] = lambda repeat, config=config: runConfig(config)
+    return cases
+
+def main(argv=None) -> int:
+    parser = getArgumentParser("CPU training throughput of build_vae configurations on synthetic data")
+    parser.add_argument("--input_shapes", nargs="+", default=["136", "20x136x1"],
+                        help="one dimensional shapes build the MLP, three dimensional ones the Conv2D model")
+    parser.add_argument("--latent_dims", nargs="+", type=int, default=[2, 16])
+    parser.add_argument("--intermediate_dims", nargs="+", type=int, default=[512])
+    parser.add_argument("--batch_sizes", nargs="+", type=int, default=[64, 256])
+    parser.add_argument("--intra_op", nargs="+", type=int, default=[0],
+                        help="TensorFlow intra-op threads, 0 lets TensorFlow choose")
+    parser.add_argument("--inter_op", nargs="+", type=int, default=[0])
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    # internal: configuration trained by a child process
+    parser.add_argument("--run", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run is not None:
+        print(json.dumps(trainConfig(json.loads(args.run))))
+        return 0
+    return runSuite(getCases(args), args, meta={"OMP_NUM_THREADS": os.environ.get("OMP_NUM_THREADS"),
+                                                 "TF_NUM_INTRAOP_THREADS": os.environ.get("TF_NUM_INTRAOP_THREADS"),
+                                                 "TF_NUM_INTEROP_THREADS": os.environ.get("TF_NUM_INTEROP_THREADS")})
+
+if __name__ == "__main__":
+    sys.exit(main())
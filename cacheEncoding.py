@@ -0,0 +1,130 @@
+"""
+Compact encodings of cached features
+
+An encoding is a string of components joined by "+", for example
+"int16+delta+deflate" for landmarks or "float16+deflate" for MFCCs.
+
+    int8, int16, int32: integer storage. The narrowest integer type holding
+        the values is used when the requested one is too narrow, and
+        non-integer features are kept as they are, so that it is lossless.
+    float16, float32: float storage, lossy below the original precision
+    delta: differences between consecutive frames of integer features,
+        which are small for landmarks of a video
+    deflate: zip deflate at compression level 1, fast to write and read
+
+The applied encoding is stored next to the features in the npz file, so
+that caches of any encoding are decoded transparently.
+"""
+import json
+import zipfile
+import numpy as np
+
+ENCODING_KEY = "encoding"
+INTEGER_DTYPES = ["int8", "int16", "int32"]
+FLOAT_DTYPES = ["float16", "float32"]
+DEFLATE_LEVEL = 1
+
+def parseEncoding(spec:str) -> dict:
+    """
+    Return
+    ------
+    dictionary {"dtype": string or None, "delta": bool, "deflate": bool}
+    """
+    encoding = {"dtype": None, "delta": False, "deflate": False}
+    for component in spec.split("+") if spec else []:
+        if component in INTEGER_DTYPES or component in FLOAT_DTYPES:
+            if encoding["dtype"] is not None:
+                raise ValueError("more than one dtype in encoding: {0}".format(spec))
+            encoding["dtype"] = component
+        elif component in ["delta", "deflate"]:
+            encoding[component] = True
+        else:
+            raise ValueError("unknown cache encoding: {0}".format(component))
+    return encoding
+
+def _isInteger(array:np.ndarray) -> bool:
+    if np.issubdtype(array.dtype, np.integer):
+        return True
+    return np.issubdtype(array.dtype, np.floating) and bool(np.all(np.mod(array, 1) == 0))
+
+def _fitInteger(array:np.ndarray,
+                dtype:str) -> np.dtype:
+    """
+    narrowest integer dtype, at least as wide as dtype, holding the values
+    """
+    if array.size == 0:
+        return np.dtype(dtype)
+    low, high = array.min(), array.max()
+    for candidate in INTEGER_DTYPES[INTEGER_DTYPES.index(dtype):] + ["int64"]:
+        info = np.iinfo(candidate)
+        if info.min <= low and high <= info.max:
+            return np.dtype(candidate)
+    raise OverflowError("values do not fit into int64")
+
+def encodeArray(array:np.ndarray,
+                spec:str):
+    """
+    Return
+    ------
+    stored array and metadata dictionary {"dtype", "stored", "delta", "deflate"}
+    """
+    encoding = parseEncoding(spec)
+    array = np.asarray(array)
+    meta = {"dtype": array.dtype.str, "stored": array.dtype.str, "delta": False, "deflate": encoding["deflate"]}
+    if array.dtype == object:
+        return array, meta
+
+    stored = array
+    if encoding["dtype"] in INTEGER_DTYPES or (encoding["delta"] and encoding["dtype"] is None):
+        if not _isInteger(array):
+            # delta and integer storage of real values would not be lossless
+            return stored, meta
+        if encoding["delta"] and len(array) > 0:
+            stored = np.diff(array.astype(np.int64), axis=0, prepend=np.zeros_like(array[:1], dtype=np.int64))
+            meta["delta"] = True
+        storedDtype = _fitInteger(stored, encoding["dtype"] or "int8")
+        # never wider than the original integers
+        if np.issubdtype(array.dtype, np.integer) and storedDtype.itemsize > array.dtype.itemsize and not meta["delta"]:
+            storedDtype = array.dtype
+        stored = stored.astype(storedDtype)
+    elif encoding["dtype"] in FLOAT_DTYPES:
+        stored = array.astype(encoding["dtype"])
+    meta["stored"] = stored.dtype.str
+    return stored, meta
+
+def decodeArray(stored:np.ndarray,
+                meta:dict) -> np.ndarray:
+    """
+    vectorized inverse of encodeArray
+    """
+    dtype = np.dtype(meta["dtype"])
+    if meta["delta"]:
+        return np.cumsum(stored, axis=0, dtype=np.int64).astype(dtype, copy=False)
+    return stored.astype(dtype, copy=False)
+
+def readEncoding(zf:zipfile.ZipFile) -> dict:
+    """
+    encoding metadata of an opened npz file, None when it is not encoded
+    """
+    if ENCODING_KEY + ".npy" not in zf.namelist():
+        return None
+    with zf.open(ENCODING_KEY + ".npy") as fp:
+        return json.loads(str(np.lib.format.read_array(fp)))
+
+def saveEncoded(path:str,
+                features,
+                spec:str,
+                **arrays):
+    """
+    save features encoded with spec and additional arrays as a npz file,
+    readable by np.load
+    """
+    stored, meta = encodeArray(features, spec)
+    members = dict(features=stored, **arrays)
+    members[ENCODING_KEY] = np.array(json.dumps(meta))
+    compression = zipfile.ZIP_DEFLATED if meta["deflate"] else zipfile.ZIP_STORED
+    with zipfile.ZipFile(path, "w", compression=compression, compresslevel=DEFLATE_LEVEL) as zf:
+        for name, value in members.items():
+            with zf.open(name + ".npy", "w", force_zip64=True) as fp:
+                np.lib.format.write_array(fp, np.asanyarray(value), allow_pickle=True)
+    return meta
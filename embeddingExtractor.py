@@ -0,0 +1,237 @@
+import os
+import hashlib
+from os.path import exists
+import numpy as np
+
+from featureExtractor import featureExtractor, batchExtractor, Fore, Style
+from raggedArray import raggedArray
+
+def getModelFingerprint(encoder) -> str:
+    """
+    md5 of the weights of a keras encoder or a vaeNumpy.numpyVae
+    """
+    md5 = hashlib.md5()
+    if hasattr(encoder, "encode"):
+        # same order as keras get_weights: kernel and bias of each layer
+        weights = []
+        for layer in encoder.encoder + [encoder.heads["z_mean"], encoder.heads["z_log_var"]]:
+            if hasattr(layer, "kernel"):
+                weights += [layer.kernel, layer.bias]
+    else:
+        weights = encoder.get_weights()
+    for w in weights:
+        md5.update(np.ascontiguousarray(w, dtype=np.float32).tobytes())
+    return md5.hexdigest()
+
+def getLatentDim(encoder) -> int:
+    """
+    dimension of z_mean of a keras encoder or a vaeNumpy.numpyVae
+    """
+    if hasattr(encoder, "encode"):
+        return int(encoder.latent_dim)
+    return int(encoder.outputs[0].shape[-1])
+
+class embeddingExtractor(featureExtractor):
+    """
+    Decorator pattern embeddingExtractor
+
+    Windows of one modality produced by a batchExtractor are encoded into
+    z_mean by a trained build_vae encoder, and cached per file. The cache
+    directory is keyed by the model weights fingerprint, and each cache
+    file records the key of the source feature cache, so only new or
+    changed files are encoded again.
+    """
+    DEFAULT_CACHE_PATH = "./cache/"
+
+    def __init__(self,
+                 batch_extractor:batchExtractor,
+                 encoder,
+                 modality:str = "visual",
+                 isFlattened:bool = True,
+                 scaler = None,
+                 batch_size:int = 4096,
+                 cache_dir:str = DEFAULT_CACHE_PATH):
+        """
+        encoder: keras Model, required
+            encoder of build_vae, or a vaeNumpy.numpyVae to encode without tensorflow
+        modality: string, optional
+            modality of the recipe fed to the encoder
+        isFlattened: bool, optional
+            whether the encoder takes flattened windows
+        scaler: util.cv_util.groupedNorm, optional
+            normalization applied to the per-frame features before windowing
+        batch_size: int, optional
+            number of windows encoded at once across files
+        """
+        super().__init__(cache_dir=cache_dir)
+        self.batch_extractor = batch_extractor
+        self.encoder = encoder
+        self.modality = modality
+        self.isFlattened = isFlattened
+        self.scaler = scaler
+        self.batch_size = batch_size
+        self.fingerprint = getModelFingerprint(encoder)
+
+    def getCacheTag(self,
+                    modality:str = "") -> str:
+        return "_" + self.fingerprint[:12]
+
+    def _getSourceKey(self,
+                      fileName:str,
+                      min_length:int) -> str:
+        """
+        key of the source feature cache and of the windowing settings
+        """
+        singleFileExtractor = self.batch_extractor.singleFileExtractor
+        sourcePath = singleFileExtractor.makeCachePath(fileName, self.modality)
+        stat = os.stat(sourcePath)
+        key = [sourcePath, stat.st_size, stat.st_mtime_ns, min_length,
+               self.batch_extractor.window_size, self.batch_extractor.sample_shift, self.isFlattened]
+        if self.batch_extractor.align != "truncate":
+            key += [self.batch_extractor.align, self.batch_extractor.align_rate]
+        if self.scaler is not None:
+            key += [self.scaler.min.tobytes(), self.scaler.max.tobytes(), self.scaler.mean.tobytes()]
+        return hashlib.md5(str(key).encode()).hexdigest()
+
+    def _loadEmbedding(self,
+                       cachePath:str,
+                       sourceKey:str):
+        if not exists(cachePath):
+            return None
+        with np.load(cachePath, allow_pickle=True) as data:
+            if "source_key" not in data.files or str(data["source_key"]) != sourceKey:
+                return None
+            return data["features"]
+
+    def _encode(self,
+                windows):
+        if hasattr(self.encoder, "encode"):
+            z_mean, _ = self.encoder.encode(windows, batch_size=self.batch_size)
+        else:
+            z_mean, _, _ = self.encoder.predict(windows, batch_size=min(self.batch_size, 1024), verbose=0)
+        return np.asarray(z_mean, dtype=np.float32)
+
+    def getXy(self,
+              recipe:dict,
+              useCache:bool = True,
+              verbose:int = 0,
+              **kwargs):
+        """
+        z_mean of every window of the recipe
+
+        Return
+        ------
+        raggedArray of z_mean per file. Its values are aligned with the
+        samples of batchExtractor.getXy for the same recipe.
+        """
+        plan = self.batch_extractor.planRecipe(recipe, verbose=verbose)
+        fileList = recipe[self.modality]
+        embeddings = [None] * len(fileList)
+
+        # files whose embedding is not cached or is out of date
+        pending = []
+        for fileIdx, fileName in enumerate(fileList):
+            sourceKey = self._getSourceKey(fileName, plan["min_length"][fileIdx])
+            if useCache:
+                embeddings[fileIdx] = self._loadEmbedding(self.makeCachePath(fileName, self.modality), sourceKey)
+            if embeddings[fileIdx] is None:
+                pending.append((fileIdx, sourceKey))
+        if verbose > 0:
+            print(Fore.CYAN + "{0} of {1} files to be encoded".format(len(pending), len(fileList)) + Style.RESET_ALL)
+
+        # windows of several files are encoded together in large batches
+        queued, queuedWindows, num_queued = [], [], 0
+        for i, (fileIdx, sourceKey) in enumerate(pending):
+            features = self.batch_extractor.singleFileExtractor.getXy(fileName=fileList[fileIdx],
+                                                                      modality=self.modality,
+                                                                      verbose=verbose)
+            features = self.batch_extractor.alignFeatures(features,
+                                                          self.modality,
+                                                          plan["min_length"][fileIdx],
+                                                          plan["frame_rate"][fileIdx])
+            if self.scaler is not None:
+                features = self.scaler.transform(features)
+            windows = self.batch_extractor._windowFile(features,
+                                                       modality=self.modality,
+                                                       num_sample=plan["num_sample"][fileIdx],
+                                                       isFlattened=self.isFlattened)
+            queued.append((fileIdx, sourceKey))
+            queuedWindows.append(windows)
+            num_queued += len(windows)
+
+            if num_queued >= self.batch_size or i == len(pending) - 1:
+                if num_queued > 0:
+                    z_mean = self._encode(np.concatenate(queuedWindows))
+                else:
+                    # files shorter than a window have no embedding
+                    z_mean = np.zeros((0, getLatentDim(self.encoder)), dtype=np.float32)
+                shift = 0
+                for (queuedIdx, queuedKey), queuedWindow in zip(queued, queuedWindows):
+                    embeddings[queuedIdx] = z_mean[shift:shift + len(queuedWindow)]
+                    shift += len(queuedWindow)
+                    self.getCachePath(fileList[queuedIdx], self.modality)
+                    os.makedirs(os.path.dirname(self.cachePath), exist_ok=True)
+                    self._saveToCache(embeddings[queuedIdx], verbose=verbose, source_key=np.array(queuedKey))
+                queued, queuedWindows, num_queued = [], [], 0
+
+        return raggedArray.fromList(embeddings)
+
+    def getIndex(self,
+                 recipe:dict,
+                 verbose:int = 0):
+        """
+        latentIndex over the embeddings of a recipe
+        """
+        return latentIndex(self.getXy(recipe, verbose=verbose), fileList=recipe[self.modality])
+
+class latentIndex():
+    """
+    Brute-force similarity search over cached latent vectors, NumPy only
+    """
+    def __init__(self,
+                 embeddings:raggedArray,
+                 fileList:list = None):
+        self.embeddings = embeddings
+        self.fileList = fileList
+        self.vectors = np.asarray(embeddings.values, dtype=np.float32)
+        norms = np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        self.normalized = self.vectors / np.maximum(norms, 1e-12)
+        # file index and window index of every vector
+        self.fileIdx = np.repeat(np.arange(len(embeddings)), embeddings.lengths)
+        self.windowIdx = np.arange(len(self.vectors)) - embeddings.offsets[self.fileIdx]
+
+    def query(self,
+              vectors,
+              k:int = 10,
+              metric:str = "cosine"):
+        """
+        k nearest windows of each query vector
+
+        metric: string, optional, default="cosine"
+            "cosine" similarity or "euclidean" distance
+
+        Return
+        ------
+        (indices, scores) of shape (queries, k), best first. indices point
+        into the concatenated embeddings, and fileIdx / windowIdx map them
+        back to files and windows.
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        k = min(k, len(self.vectors))
+        if metric == "cosine":
+            queries = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            scores = queries @ self.normalized.T
+        elif metric == "euclidean":
+            # negative squared distance so that larger is closer
+            scores = 2 * vectors @ self.vectors.T - np.square(self.vectors).sum(axis=1) - np.square(vectors).sum(axis=1, keepdims=True)
+        else:
+            raise ValueError("unknown metric: {0}".format(metric))
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        indices = np.take_along_axis(top, order, axis=1)
+        scores = np.take_along_axis(top_scores, order, axis=1)
+        if metric == "euclidean":
+            scores = np.sqrt(np.maximum(-scores, 0))
+        return indices, scores
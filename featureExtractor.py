@@ -6,46 +6,192 @@ import numpy as np
 from datetime import datetime
 import hashlib
 import itertools
-import scipy.stats as stats
+import json
+import zipfile
+import struct
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-import cv2
-from tqdm import tqdm
-from colorama import *
+from util.lazy_import import lazyImport
+tqdm = lazyImport("tqdm", "tqdm")
+Fore = lazyImport("colorama", "Fore")
+Style = lazyImport("colorama", "Style")
+
+from fileSelector import getShardIndex, getFileKey
+from slidingWindow import slidingReduce, REDUCTIONS
+from raggedArray import raggedArray
+from profiler import NULL_PROFILER
+from cacheEncoding import ENCODING_KEY, decodeArray, readEncoding, saveEncoded
+from frameAlignment import ALIGN_METHODS, getAlignedLength, resampleFrames, getWordIndex, getContextIndex
 
 class featureExtractor():
     DEFAULT_CACHE_PATH = "./cache/"
     DEFAULT_CACHE_EXT = ".npz"
+    CATALOG_NAME = "catalog.jsonl"
+    _catalogLock = threading.Lock()
 
     def __init__(self,
-                 cache_dir:str = DEFAULT_CACHE_PATH):
+                 cache_dir:str = DEFAULT_CACHE_PATH,
+                 mmap_mode:str = None,
+                 cache_encoding = None):
+        """
+        mmap_mode: If "r", features of uncompressed cache files are memory-mapped
+            instead of being read into memory
+        cache_encoding: string or dictionary {modality: string}, optional
+            encoding of cached features such as "int16+delta+deflate", see
+            cacheEncoding. Caches of any encoding are read transparently.
+        """
         self.cache_dir = cache_dir
+        self.mmap_mode = mmap_mode
+        self.cache_encoding = cache_encoding
+        self.cacheModality = ""
+        self._catalogs = dict()
+        self.profiler = NULL_PROFILER
+
+    def setProfiler(self,
+                    profiler):
+        """
+        profiler: profiler.stageProfiler collecting the stages of this
+            extractor, or profiler.NULL_PROFILER to disable profiling
+        """
+        self.profiler = profiler
 
     def _loadFromCache(self,
                       fileName:str,
                       modality:str = "",
                       verbose:int = 0):
-        if not exists(self.cache_dir + modality):
-            os.makedirs(self.cache_dir + modality)
+        os.makedirs(os.path.dirname(self.cachePath), exist_ok=True)
 
-        if exists(self.cachePath):
-            data = np.load(self.cachePath, allow_pickle=True)
-            if verbose > 0:
-                print(Fore.CYAN + "cache file has been loaded :{0}".format(self.cachePath))
-                print("{0}".format(data["features"].shape) + Style.RESET_ALL)
-            return data["features"]
+        features = self.loadCacheFile(self.cachePath)
+        if verbose > 0:
+            print(Fore.CYAN + "cache file has been loaded :{0}".format(self.cachePath))
+            print("{0}".format(np.shape(features)) + Style.RESET_ALL)
+        return features
+
+    def loadCacheFile(self,
+                      cachePath:str):
+        """
+        load features from a cache path without touching the state of
+        the extractor, so that it can be called from worker threads
+        """
+        if exists(cachePath):
+            if self.mmap_mode is not None:
+                features = readCacheMemmap(cachePath, mode=self.mmap_mode)
+                if features is not None:
+                    return features
+            with np.load(cachePath, allow_pickle=True) as data:
+                if ENCODING_KEY in data.files:
+                    return decodeArray(data["features"], json.loads(str(data[ENCODING_KEY])))
+                return data["features"]
         else:
             raise FileNotFoundError
 
+    def getCacheEncoding(self,
+                         modality:str = "") -> str:
+        """
+        encoding of the cached features of a modality, None for plain npz
+        """
+        if isinstance(self.cache_encoding, dict):
+            return self.cache_encoding.get(modality)
+        return self.cache_encoding
+
     def _saveToCache(self,
                     features_list: list,
-                    verbose:int = 0):
+                    verbose:int = 0,
+                    **arrays):
+        """
+        arrays: additional arrays stored next to features in the cache file
+
+        The cache is written to a temporary file renamed over cachePath, so
+        that an interrupted or failed save never leaves a truncated cache
+        and never removes a previous complete one.
+        """
+        tmpPath = splitext(self.cachePath)[0] + ".{0}.{1}.tmp".format(os.getpid(), threading.get_ident()) \
+                  + self.DEFAULT_CACHE_EXT
+        encoding = self.getCacheEncoding(self.cacheModality)
         try:
-            np.savez(self.cachePath, features=features_list, allow_pickle=True)
+            if encoding is not None and isinstance(features_list, np.ndarray):
+                saveEncoded(tmpPath, features_list, encoding, **arrays)
+            else:
+                np.savez(tmpPath, features=features_list, allow_pickle=True, **arrays)
+            os.replace(tmpPath, self.cachePath)
         except OverflowError as error:
             # Output expected OverflowErrors.
             print(Fore.RED + str(error) + Style.RESET_ALL)
-            if exists(self.cachePath):
-                os.remove(self.cachePath)
+            return
+        finally:
+            if exists(tmpPath):
+                os.remove(tmpPath)
+        self._updateCatalog(self.cachePath, readCacheHeader(self.cachePath))
+
+    def _getCatalogPath(self,
+                        cachePath:str) -> str:
+        return os.path.join(os.path.dirname(cachePath), self.CATALOG_NAME)
+
+    def loadCatalog(self,
+                    modality:str = "") -> dict:
+        """
+        catalog of a cache directory: {cache file name: {"dtype", "shape", "length"}},
+        and "frame_rate" of frame-wise features
+        """
+        catalogPath = self._getCatalogPath(self.makeCachePath("", modality))
+        if not exists(catalogPath):
+            return dict()
+        # parse only the lines appended since the last call
+        offset, catalog = self._catalogs.get(catalogPath, (0, dict()))
+        if os.path.getsize(catalogPath) < offset:
+            offset, catalog = 0, dict()
+        with open(catalogPath) as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    # line being written by another process
+                    break
+                offset += len(line.encode())
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # a line broken by a crash is recovered by getCacheInfo
+                    continue
+                catalog[entry.pop("name")] = entry
+        self._catalogs[catalogPath] = (offset, catalog)
+        return catalog
+
+    def _updateCatalog(self,
+                       cachePath:str,
+                       entry:dict):
+        """
+        record the metadata of a cache file into the catalog of its directory
+
+        The catalog is an append-only json lines file where the last entry
+        of a name wins, so that a save costs one short append and several
+        processes can share a cache directory.
+        """
+        line = json.dumps(dict(name=basename(cachePath), **entry)) + "\n"
+        with self._catalogLock:
+            with open(self._getCatalogPath(cachePath), "a") as f:
+                f.write(line)
+
+    def getCacheInfo(self,
+                     fileName:str,
+                     modality:str = "") -> dict:
+        """
+        dtype, shape and length of a cached feature without loading it
+
+        Return
+        ------
+        dictionary {"dtype", "shape", "length"}, or None if the file is not cached yet
+        """
+        cachePath = self.makeCachePath(fileName, modality)
+        if not exists(cachePath):
+            return None
+        entry = self.loadCatalog(modality).get(basename(cachePath))
+        if entry is None or os.path.getmtime(cachePath) > os.path.getmtime(self._getCatalogPath(cachePath)):
+            entry = readCacheHeader(cachePath)
+            self._updateCatalog(cachePath, entry)
+        return entry
 
     def clearCache(self):
         if exists(self.cache_dir):
@@ -62,12 +208,61 @@ class featureExtractor():
         get and set cache file path from file base name and modality
         """
         # set cache path
+        self.cachePath = self.makeCachePath(fileName, modality)
+        self.cacheModality = modality
+        return self.cachePath
+
+    def makeCachePath(self,
+                      fileName:str,
+                      modality:str = ""):
+        """
+        cache file path from file base name and modality without setting it
+        """
+        cacheDir = self.cache_dir + modality + self.getCacheTag(modality) + "/"
         if isinstance(fileName, str):
-            self.cachePath = self.cache_dir + modality + "/" + splitext(basename(fileName))[0] + self.DEFAULT_CACHE_EXT
+            return cacheDir + splitext(basename(fileName))[0] + self.DEFAULT_CACHE_EXT
         else:
-            self.cachePath = self.cache_dir + modality + "/" + str(datetime.now()) + self.DEFAULT_CACHE_EXT
+            return cacheDir + str(datetime.now()) + self.DEFAULT_CACHE_EXT
 
-        return self.cachePath
+    def getCacheTag(self,
+                    modality:str = "") -> str:
+        """
+        suffix of the cache directory of a modality, which distinguishes
+        caches extracted with different settings
+        """
+        return ""
+
+    def getFrameRate(self,
+                     fileName:str,
+                     modality:str = "") -> float:
+        """
+        number of feature frames per second extracted from a source file,
+        None when the features are not frame-wise or the rate is unknown.
+        It is recorded into the cache file and the catalog on extraction.
+        """
+        return None
+
+    def getWordTimings(self,
+                       fileName:str,
+                       modality:str = "text"):
+        """
+        start times in seconds of the words of a text file, of shape
+        (num_words, ) or (num_words, 2) with start and end times, None when
+        they are unknown
+        """
+        return None
+
+    def getFeatureRate(self,
+                       fileName:str,
+                       modality:str = "") -> float:
+        """
+        frame rate of the cached features of a file, read from the catalog,
+        or from the source file for caches written without it
+        """
+        info = self.getCacheInfo(fileName, modality)
+        if info is not None and info.get("frame_rate") is not None:
+            return info["frame_rate"]
+        return self.getFrameRate(fileName, modality)
 
     def getXy(self,
              fileName:str,
@@ -75,6 +270,10 @@ class featureExtractor():
              useCache:bool = True,
              verbose:int = 0,
              **kwargs):
+        if not isinstance(fileName, str):
+            # live streams such as a camera are not cached
+            return self._extractFeature(fileName=fileName, modality=modality, verbose=verbose, **kwargs)
+        profiler = self.profiler
         try:
             self.getCachePath(fileName, modality)
 
@@ -82,10 +281,21 @@ class featureExtractor():
                 raise FileNotFoundError
             if verbose > 0:
                 print(Fore.CYAN + "trying to load : {0}".format(fileName) + Style.RESET_ALL)
-            features_list = self._loadFromCache(fileName=fileName, modality=modality, verbose=verbose)
+            with profiler.stage("cache_load", modality=modality):
+                features_list = self._loadFromCache(fileName=fileName, modality=modality, verbose=verbose)
+            profiler.count("cache_hits")
         except FileNotFoundError:
-            features_list = self._extractFeature(fileName=fileName, modality=modality, verbose=verbose, **kwargs)
-            self._saveToCache(features_list=features_list, verbose=verbose)
+            profiler.count("cache_misses")
+            with profiler.stage("extract", modality=modality, fileName=fileName):
+                features_list = self._extractFeature(fileName=fileName, modality=modality, verbose=verbose, **kwargs)
+            arrays = dict()
+            frame_rate = self.getFrameRate(fileName, modality)
+            if frame_rate is not None:
+                arrays["frame_rate"] = np.float64(frame_rate)
+            with profiler.stage("cache_save", modality=modality):
+                self._saveToCache(features_list=features_list, verbose=verbose, **arrays)
+            if profiler.enabled and exists(self.cachePath):
+                profiler.count("cache_bytes_written", os.path.getsize(self.cachePath))
 
         return features_list
 
@@ -105,11 +315,224 @@ class featureExtractor():
         """
         raise NotImplemented
 
+def readCacheHeader(cachePath:str,
+                    key:str = "features") -> dict:
+    """
+    read dtype and shape of an array stored in a npz file from its npy
+    header, without reading the array itself
+    """
+    with zipfile.ZipFile(cachePath) as zf:
+        with zf.open(key + ".npy") as fp:
+            version = np.lib.format.read_magic(fp)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fp)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fp)
+        encoding = readEncoding(zf)
+        frame_rate = None
+        if "frame_rate.npy" in zf.namelist():
+            with zf.open("frame_rate.npy") as fp:
+                frame_rate = float(np.lib.format.read_array(fp))
+    header = {
+        "dtype": dtype.str,
+        "shape": list(shape),
+        "length": shape[0] if len(shape) > 0 else None,
+    }
+    if frame_rate is not None:
+        header["frame_rate"] = frame_rate
+    if encoding is not None:
+        # dtype of the decoded features, as returned by loadCacheFile
+        header["dtype"] = encoding["dtype"]
+        header["encoding"] = encoding
+    return header
+
+def readCacheMemmap(cachePath:str,
+                    key:str = "features",
+                    mode:str = "r"):
+    """
+    memory-map an array stored in a npz file
+
+    np.load ignores mmap_mode for npz files. For a member stored without
+    compression (np.savez), the npy data is a contiguous range of the zip
+    file, so its offset is computed from the local file header and the
+    array is mapped with np.memmap. Returns None for compressed members,
+    encoded features and object arrays, which have to be read with np.load.
+    """
+    with zipfile.ZipFile(cachePath) as zf:
+        info = zf.getinfo(key + ".npy")
+        encoded = readEncoding(zf) is not None
+    if info.compress_type != zipfile.ZIP_STORED or encoded:
+        return None
+    with open(cachePath, "rb") as fp:
+        # local file header: 30 bytes followed by file name and extra field
+        fp.seek(info.header_offset)
+        header = fp.read(30)
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        fp.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(fp)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fp)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fp)
+        offset = fp.tell()
+    if dtype.hasobject:
+        return None
+    return np.memmap(cachePath, dtype=dtype, mode=mode, shape=shape,
+                     order="F" if fortran_order else "C", offset=offset)
+
+class cachePrefetcher():
+    """
+    Thread-pool scheduler of per-file cache reads
+
+    The cache loads of upcoming files are issued to a thread pool, keeping
+    at most lookahead files in flight, so that disk or network latency
+    overlaps with the work done on the current file. Files whose cache
+    does not exist yet are extracted on the calling thread.
+    """
+    def __init__(self,
+                 extractor:featureExtractor,
+                 num_workers:int = 4,
+                 lookahead:int = 8):
+        self.extractor = extractor
+        self.num_workers = num_workers
+        self.lookahead = max(1, lookahead)
+
+    def _load(self,
+              fileName:str,
+              modality:str):
+        profiler = self.extractor.profiler
+        try:
+            with profiler.stage("cache_load", modality=modality):
+                features = self.extractor.loadCacheFile(self.extractor.makeCachePath(fileName, modality))
+            profiler.count("cache_hits")
+            return features
+        except FileNotFoundError:
+            return None
+
+    def iterate(self,
+                recipe:dict,
+                verbose:int = 0):
+        """
+        generator of (fileIdx, {modality: features}) in recipe order
+        """
+        num_files = len(recipe[list(recipe.keys())[0]])
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            pending = deque()
+            nextIdx = 0
+            try:
+                for fileIdx in range(num_files):
+                    while nextIdx < num_files and len(pending) < self.lookahead:
+                        pending.append({modality: executor.submit(self._load, recipe[modality][nextIdx], modality)
+                                        for modality in recipe.keys()})
+                        nextIdx += 1
+
+                    features = dict()
+                    for modality, future in pending.popleft().items():
+                        features[modality] = future.result()
+                        if features[modality] is None:
+                            features[modality] = self.extractor.getXy(fileName=recipe[modality][fileIdx],
+                                                                      modality=modality,
+                                                                      verbose=verbose)
+                    yield fileIdx, features
+            finally:
+                for futures in pending:
+                    for future in futures.values():
+                        future.cancel()
+
+def shardRecipe(recipe:dict,
+                index:int,
+                num_shards:int,
+                keyFunc = getFileKey) -> dict:
+    """
+    select the files of one shard from a recipe
+
+    The shard of each file index is decided by the file of the first
+    modality, and the same files are kept on all the other modalities so
+    that the modalities stay aligned.
+    """
+    if not 0 <= index < num_shards:
+        raise ValueError("shard index {0} is out of range [0, {1})".format(index, num_shards))
+    modalities = list(recipe.keys())
+    keep = [i for i, fileName in enumerate(recipe[modalities[0]])
+            if getShardIndex(keyFunc(fileName), num_shards) == index]
+    return {modality: [recipe[modality][i] for i in keep] for modality in modalities}
+
+class batchCheckpoint():
+    """
+    Per-file segments of a batch build being written
+
+    The windows of every finished file are saved as one segment file in a
+    .partial directory next to the batch cache, then the file index is
+    appended to a progress marker. A build restarted after a crash reads
+    the segments listed in the marker instead of windowing the files
+    again. The marker starts with the settings of the build, and segments
+    of another setting are discarded.
+    """
+    PROGRESS_NAME = "progress.jsonl"
+
+    def __init__(self,
+                 path:str,
+                 meta:dict):
+        self.path = path
+        self.meta = meta
+        self.done = set()
+        progressPath = os.path.join(path, self.PROGRESS_NAME)
+        if exists(progressPath):
+            with open(progressPath) as f:
+                lines = f.read().split("\n")
+            try:
+                valid = json.loads(lines[0]) == {"meta": meta}
+            except ValueError:
+                valid = False
+            if valid:
+                for line in lines[1:]:
+                    try:
+                        fileIdx = json.loads(line)["file"]
+                    except (ValueError, KeyError, TypeError):
+                        # line truncated by a crash
+                        continue
+                    if exists(self.getSegmentPath(fileIdx)):
+                        self.done.add(fileIdx)
+            else:
+                shutil.rmtree(path)
+        if not exists(progressPath):
+            os.makedirs(path, exist_ok=True)
+            with open(progressPath, "w") as f:
+                f.write(json.dumps({"meta": meta}) + "\n")
+        self._progress = open(progressPath, "a")
+
+    def getSegmentPath(self,
+                       fileIdx:int) -> str:
+        return os.path.join(self.path, "{0:06d}.npz".format(fileIdx))
+
+    def load(self,
+             fileIdx:int) -> dict:
+        with np.load(self.getSegmentPath(fileIdx), allow_pickle=True) as data:
+            return {modality: data[modality] for modality in data.files}
+
+    def save(self,
+             fileIdx:int,
+             windows:dict):
+        """
+        write the segment atomically, then mark the file as done
+        """
+        segmentPath = self.getSegmentPath(fileIdx)
+        tmpPath = splitext(segmentPath)[0] + ".tmp.npz"
+        np.savez(tmpPath, **windows)
+        os.replace(tmpPath, segmentPath)
+        self._progress.write(json.dumps({"file": int(fileIdx)}) + "\n")
+        self._progress.flush()
+        self.done.add(fileIdx)
+
+    def close(self):
+        self._progress.close()
+
+    def remove(self):
+        self.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
 def padStack(a):
-    b = np.zeros([len(a), len(max(a, key = lambda x: len(x)))])
-    for i, j in enumerate(a):
-        b[i][:len(j)] = j
-    return b
+    return raggedArray.fromList(a).toPadded(dtype=np.float64)
 
 class batchExtractor(featureExtractor):
     """
@@ -118,23 +541,442 @@ class batchExtractor(featureExtractor):
     """
     DEFAULT_CACHE_PATH = "./cache/"
     DEFAULT_CACHE_EXT = ".npz"
+    DEFAULT_DTYPE = np.float64
+    # dlib landmark offsets are small integers and MFCCs are float32
+    COMPACT_DTYPE_POLICY = {
+        "visual": np.int16,
+        "audio": np.float32,
+        "text": np.float32,
+        "ref": np.int16,
+        "label": np.int16,
+    }
 
     def __init__(self,
                  singleFileExtractor:featureExtractor,
                  window_size:int,
                  cache_dir:str = DEFAULT_CACHE_PATH,
-                 sample_shift:int = 0):
+                 sample_shift:int = 0,
+                 num_workers:int = 0,
+                 lookahead:int = 8,
+                 dtype = None,
+                 memory_budget:int = None,
+                 on_budget:str = "raise",
+                 label_reduction:str = "mode",
+                 label_threshold:float = 0.5,
+                 checkpoint:bool = False,
+                 align:str = "truncate",
+                 align_rate:float = None):
         """
         sample_shift: int, optional
             If this argument is positive value, all the features of selected
             files will be sliced at interval of sample_shift. This value is
             NOT saved into cache file, thus client codes have to manage whether
             loaded cache data have file dimension by your own.
+        num_workers: int, optional
+            If positive, per-file cache reads are issued to a thread pool
+            of this size ahead of windowing. See cachePrefetcher.
+        lookahead: int, optional
+            maximum number of files loaded ahead by the thread pool
+        dtype: dtype or dictionary, optional
+            dtype of the windowed samples, or a dictionary of dtype per
+            modality such as COMPACT_DTYPE_POLICY. Unspecified modalities
+            are allocated in DEFAULT_DTYPE.
+        memory_budget: int, optional
+            maximum number of bytes of the windowed samples
+        on_budget: string, optional, default="raise"
+            behavior when the plan exceeds memory_budget.
+            "raise" raises MemoryError before allocating anything and
+            "memmap" allocates the samples as .npy files next to the cache.
+        label_reduction: string, optional, default="mode"
+            reduction of the frames of a window on ref and label modalities,
+            one of mode, majority, mean and max. See slidingWindow.
+        label_threshold: float, optional
+            minimum ratio of the mode in a window for "majority" reduction
+        checkpoint: bool, optional
+            If True, the windows of every file are flushed to a partial cache
+            while the batch is built, so that a build restarted after a crash
+            skips the files already done. See batchCheckpoint.
+        align: string, optional, default="truncate"
+            alignment of the modalities of a file. "truncate" cuts every
+            modality to the shortest one. "nearest" and "linear" resample
+            them onto a common timeline from the frame rates recorded by
+            singleFileExtractor.getFrameRate, see frameAlignment. ref and
+            label modalities are always resampled with "nearest". Modalities
+            without frame rate, such as labels of the landmarksExtractor, are
+            taken to be at the rate of the timeline and truncated. Files
+            without any frame rate are truncated.
+        align_rate: float, optional
+            frame rate of the common timeline. By default, the rate of the
+            first modality of the recipe with a frame rate.
         """
         super().__init__(cache_dir)
         self.singleFileExtractor = singleFileExtractor
         self.sample_shift = sample_shift
         self.window_size = window_size
+        self.num_workers = num_workers
+        self.lookahead = lookahead
+        self.dtype = dtype
+        self.memory_budget = memory_budget
+        if on_budget not in ["raise", "memmap"]:
+            raise ValueError("on_budget must be raise or memmap: {0}".format(on_budget))
+        self.on_budget = on_budget
+        if label_reduction not in REDUCTIONS:
+            raise ValueError("unknown label_reduction: {0}".format(label_reduction))
+        self.label_reduction = label_reduction
+        self.label_reduction_args = {"threshold": label_threshold} if label_reduction == "majority" else dict()
+        self.checkpoint = checkpoint
+        self._checkpoint = None
+        if align not in ALIGN_METHODS:
+            raise ValueError("unknown align: {0}".format(align))
+        self.align = align
+        self.align_rate = align_rate
+
+    def setProfiler(self,
+                    profiler):
+        """
+        profile the windowing of this extractor and the loads of singleFileExtractor
+        """
+        super().setProfiler(profiler)
+        self.singleFileExtractor.setProfiler(profiler)
+
+    def getFrameRates(self,
+                      recipe:dict,
+                      fileIdx:int) -> dict:
+        """
+        frame rate of the cached features of every modality of a file,
+        empty when the modalities are truncated
+        """
+        if self.align == "truncate":
+            return dict()
+        return {modality: self.singleFileExtractor.getFeatureRate(recipe[modality][fileIdx], modality)
+                for modality in recipe.keys() if modality != "text"}
+
+    def _getTimelineRate(self,
+                         frame_rates:dict) -> float:
+        """
+        frame rate of the common timeline of a file, None to truncate
+        """
+        rates = [rate for rate in frame_rates.values() if rate is not None]
+        if len(rates) == 0:
+            return None
+        if self.align_rate is not None:
+            return self.align_rate
+        return rates[0]
+
+    def getAlignedLength(self,
+                         lengths:dict,
+                         frame_rates:dict = None) -> int:
+        """
+        number of frames of a file once its modalities are aligned
+
+        lengths: dictionary {modality: number of frames}, text excluded
+        """
+        rate = self._getTimelineRate(frame_rates or dict())
+        if rate is None:
+            return min(lengths.values(), default=sys.maxsize)
+        modalities = list(lengths.keys())
+        # modalities without frame rate are at the rate of the timeline
+        return getAlignedLength([lengths[modality] for modality in modalities],
+                                [frame_rates.get(modality) or rate for modality in modalities],
+                                rate)
+
+    def alignFeatures(self,
+                      features_per_modality,
+                      modality:str,
+                      length:int,
+                      frame_rates:dict = None):
+        """
+        features of one modality of a file on the timeline of getAlignedLength
+        """
+        if modality == "text":
+            return features_per_modality
+        rate = self._getTimelineRate(frame_rates or dict())
+        if rate is None or frame_rates.get(modality) in [None, rate]:
+            # same frames as the timeline, kept as a view
+            return features_per_modality[:length]
+        how = "nearest" if modality in ["ref", "label"] else self.align
+        return resampleFrames(features_per_modality, frame_rates[modality], rate, length, how=how)
+
+    def getWordStarts(self,
+                      recipe:dict,
+                      fileIdx:int,
+                      frame_rates:dict = None):
+        """
+        start of every word of the text of a file in frames of the aligned
+        timeline, None to map windows to words proportionally
+        """
+        if "text" not in recipe.keys():
+            return None
+        timings = self.singleFileExtractor.getWordTimings(recipe["text"][fileIdx], "text")
+        if timings is None:
+            return None
+        rate = self._getTimelineRate(frame_rates or dict())
+        if rate is None:
+            # truncated modalities keep the frames of the first one
+            base = [modality for modality in recipe.keys() if modality != "text"]
+            if len(base) == 0:
+                return None
+            rate = self.singleFileExtractor.getFeatureRate(recipe[base[0]][fileIdx], base[0])
+            if rate is None:
+                return None
+        timings = np.asarray(timings, dtype=np.float64)
+        starts = timings[:, 0] if timings.ndim == 2 else timings
+        return starts * rate
+
+    def _getNumSample(self,
+                      length:int) -> int:
+        """
+        number of windows sliced from a file of the given length
+        """
+        return max(0, int( (length - self.window_size) / self.sample_shift))
+
+    def _windowFile(self,
+                    features_per_file,
+                    modality:str,
+                    num_sample:int,
+                    isFlattened:bool = False,
+                    num_word:int = 1,
+                    word_starts = None):
+        """
+        slice the features of a single file into num_sample windows
+
+        num_word: int, optional
+            number of consecutive words of each text sample
+        word_starts: array, optional
+            getWordStarts of the file, to map windows to words
+
+        Return
+        ------
+        Array of shape (num_sample, window_size, ...), (num_sample, window_size * dim)
+        if isFlattened, or (num_sample, ...) for ref and label modalities.
+        Text samples are of shape (num_sample, ...) for a single word, and
+        (num_sample, num_word, ...) or (num_sample, num_word * dim) otherwise.
+        """
+        features_per_file = np.asarray(features_per_file)
+        if num_sample == 0:
+            shape = self._getSampleShape(modality, features_per_file.shape[1:], isFlattened, num_word)
+            return np.zeros((0, ) + shape, dtype=features_per_file.dtype)
+
+        if modality == "text":
+            # one gather of the words of all the windows
+            num_words = len(features_per_file)
+            wordIndex = getWordIndex(num_sample, num_words, self.window_size, self.sample_shift, word_starts)
+            if num_word == 1:
+                return features_per_file[wordIndex]
+            samples = features_per_file[getContextIndex(wordIndex, num_word, num_words)]
+            if isFlattened:
+                samples = samples.reshape(num_sample, -1)
+            return samples
+
+        if modality == "ref" or modality == "label":
+            return slidingReduce(features_per_file,
+                                 self.window_size,
+                                 self.sample_shift,
+                                 how=self.label_reduction,
+                                 num_sample=num_sample,
+                                 **self.label_reduction_args)
+
+        # windows are views of the source array until they are copied by reshape or the caller
+        windows = np.lib.stride_tricks.sliding_window_view(features_per_file[:(num_sample - 1) * self.sample_shift + self.window_size],
+                                                           self.window_size, axis=0)[::self.sample_shift][:num_sample]
+        windows = np.moveaxis(windows, -1, 1)
+        if isFlattened:
+            windows = windows.reshape(num_sample, -1)
+        return windows
+
+    def _loadFiles(self,
+                   recipe:dict,
+                   verbose:int = 0):
+        """
+        generator of (fileIdx, {modality: features}) in recipe order
+        """
+        if self.num_workers > 0:
+            prefetcher = cachePrefetcher(self.singleFileExtractor,
+                                         num_workers=self.num_workers,
+                                         lookahead=self.lookahead)
+            yield from prefetcher.iterate(recipe, verbose=verbose)
+            return
+
+        num_files = len(recipe[list(recipe.keys())[0]])
+        for fileIdx in range(num_files):
+            yield fileIdx, {modality: self.singleFileExtractor.getXy(fileName=recipe[modality][fileIdx],
+                                                                     modality=modality,
+                                                                     verbose=verbose)
+                            for modality in recipe.keys()}
+
+    def _prefetchFiles(self,
+                       recipe:dict,
+                       prefetch:int = 2,
+                       verbose:int = 0):
+        """
+        _loadFiles running on a background thread, which keeps up to prefetch
+        files loaded ahead of the consumer
+        """
+        fileQueue = queue.Queue(maxsize=max(1, prefetch))
+        stop = threading.Event()
+        end = object()
+
+        def worker():
+            try:
+                for item in self._loadFiles(recipe, verbose=verbose):
+                    while not stop.is_set():
+                        try:
+                            fileQueue.put(item, timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+                    if stop.is_set():
+                        return
+                item = end
+            except BaseException as error:
+                item = error
+            while not stop.is_set():
+                try:
+                    fileQueue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = fileQueue.get()
+                if item is end:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join()
+
+    def iter_batches(self,
+                     recipe:dict,
+                     batch_size:int,
+                     shuffle_buffer:int = 0,
+                     isFlattened:bool = False,
+                     drop_last:bool = False,
+                     prefetch:int = 2,
+                     seed:int = None,
+                     scalers:dict = None,
+                     scale_how:str = "minmax",
+                     num_word:int = 1,
+                     verbose:int = 0):
+        """
+        Streaming version of getXy
+
+        Files are loaded through singleFileExtractor on a background thread,
+        aligned and windowed one by one, and the windows are emitted as
+        fixed-size minibatches. Memory stays proportional to shuffle_buffer
+        and prefetch instead of the whole recipe.
+
+        Parameters
+        ----------
+        recipe: dictionary, required
+            same as getXy
+        batch_size: int, required
+            number of samples per minibatch
+        shuffle_buffer: int, optional, default=0
+            If positive, samples of consecutive files are drawn at random
+            from a buffer of this size. 0 keeps the file order.
+        drop_last: bool, optional
+            drop the last incomplete minibatch. Samples keep the cached
+            dtype unless a dtype policy is given to the constructor.
+        prefetch: int, optional
+            number of files loaded ahead of windowing
+        scalers: dictionary, optional
+            {modality: util.cv_util.groupedNorm} fitted on per-frame features,
+            e.g. with fitCache. Each file is normalized before windowing.
+        scale_how: string, optional
+            normalization passed to groupedNorm.transform
+        num_word: int, optional
+            number of consecutive words of each text sample
+
+        Return
+        ------
+        generator of dictionary {modality: array of batch_size samples}
+        """
+        if self.sample_shift <= 0:
+            raise ValueError("iter_batches requires a positive sample_shift")
+        rng = np.random.RandomState(seed)
+        pool = None
+        pool_size = max(shuffle_buffer, 0) + batch_size
+
+        def draw(pool, size):
+            num_pool = len(next(iter(pool.values())))
+            if shuffle_buffer > 0:
+                idx = rng.choice(num_pool, size, replace=False)
+                keep = np.ones(num_pool, dtype=bool)
+                keep[idx] = False
+                batch = {modality: samples[idx] for modality, samples in pool.items()}
+                pool = {modality: samples[keep] for modality, samples in pool.items()}
+            else:
+                batch = {modality: samples[:size] for modality, samples in pool.items()}
+                pool = {modality: samples[size:] for modality, samples in pool.items()}
+            return batch, pool
+
+        for fileIdx, features_per_file in self._prefetchFiles(recipe, prefetch=prefetch, verbose=verbose):
+            frame_rates = self.getFrameRates(recipe, fileIdx)
+            windows = self.windowFiles(features_per_file, isFlattened=isFlattened, scalers=scalers, scale_how=scale_how,
+                                       frame_rates=frame_rates,
+                                       num_word=num_word,
+                                       word_starts=self.getWordStarts(recipe, fileIdx, frame_rates))
+            if pool is None:
+                pool = windows
+            else:
+                pool = {modality: np.concatenate([pool[modality], windows[modality]]) for modality in pool.keys()}
+
+            while len(next(iter(pool.values()))) >= pool_size:
+                batch, pool = draw(pool, batch_size)
+                yield batch
+
+        if pool is None:
+            return
+        while len(next(iter(pool.values()))) > 0:
+            num_pool = len(next(iter(pool.values())))
+            if num_pool < batch_size and drop_last:
+                break
+            batch, pool = draw(pool, min(batch_size, num_pool))
+            yield batch
+
+    def windowFiles(self,
+                    features_per_file:dict,
+                    isFlattened:bool = False,
+                    scalers:dict = None,
+                    scale_how:str = "minmax",
+                    frame_rates:dict = None,
+                    num_word:int = 1,
+                    word_starts = None) -> dict:
+        """
+        windows of the features of one file of every modality
+
+        The modalities are aligned with alignFeatures, normalized with
+        scalers and windowed. Samples keep the cached dtype unless a dtype
+        policy is given to the constructor.
+
+        frame_rates: dictionary, optional
+            getFrameRates of the file, required to resample the modalities
+        num_word, word_starts: optional
+            windowing of the text modality, see _windowFile
+        """
+        length = self.getAlignedLength({modality: len(f) for modality, f in features_per_file.items() if modality != "text"},
+                                       frame_rates)
+        num_sample = self._getNumSample(length)
+        windows = dict()
+        for modality, f in features_per_file.items():
+            f = self.alignFeatures(f, modality, length, frame_rates)
+            if scalers is not None and modality in scalers:
+                f = scalers[modality].transform(f, how=scale_how)
+            windows[modality] = self._windowFile(f,
+                                                 modality=modality,
+                                                 num_sample=num_sample,
+                                                 isFlattened=isFlattened,
+                                                 num_word=num_word,
+                                                 word_starts=word_starts)
+            if self.dtype is not None:
+                windows[modality] = windows[modality].astype(self.getDtype(modality), copy=False)
+        return windows
 
     def getCachePathList(self,
                          recipe:dict) -> dict:
@@ -149,6 +991,8 @@ class batchExtractor(featureExtractor):
               recipe:dict(),
               useCache:bool = True,
               verbose:int = 0,
+              shard:tuple = None,
+              shardKey = getFileKey,
               **kwargs):
         """
         Get feature of multiple modalities
@@ -161,27 +1005,63 @@ class batchExtractor(featureExtractor):
                 "audio": list of audio modality source files
             }
             Acceptable modalities are visual, audio, text, ref and label
+        isRagged: bool, optional
+            If True and sample_shift is not positive, the features of each
+            modality are returned as a raggedArray instead of a list of files.
+        shard: tuple, optional
+            (index, num_shards) to extract only one shard of the recipe.
+            Each node can build its part of the cache without coordination.
+        shardKey: function, optional
+            maps a file path to its shard key. Pass
+            lombardFileSelector.getSpeaker to keep speakers in one shard.
         """
+        if shard is not None:
+            recipe = shardRecipe(recipe, *shard, keyFunc=shardKey)
         allmodalConcatFile = "".join(list(itertools.chain.from_iterable(recipe.values())))
+        if self.dtype is not None:
+            # samples of another dtype policy are cached separately
+            allmodalConcatFile += str({modality: self.getDtype(modality).str for modality in recipe.keys()})
+        if kwargs.get("isRagged", False):
+            allmodalConcatFile += "ragged"
+        if self.align != "truncate":
+            allmodalConcatFile += "align_{0}_{1}".format(self.align, self.align_rate)
         concatCachePath = self.singleFileExtractor.cache_dir + hashlib.md5(allmodalConcatFile.encode()).hexdigest() + ".npz"
 
         feature = super().getXy(fileName=concatCachePath, recipe=recipe, useCache=useCache, verbose=verbose, **kwargs)
+        return feature
 
-        # savez method dictionary as ndarray
-        if type(feature)==np.ndarray:
-            feature = feature.item()
+    def loadCacheFile(self,
+                      cachePath:str):
+        """
+        load the dictionary of features of all the modalities, and reopen
+        samples stored out of the pickled dictionary
+        """
+        if not exists(cachePath):
+            raise FileNotFoundError
+        with np.load(cachePath, allow_pickle=True) as data:
+            feature = data["features"]
+            # savez method dictionary as ndarray
+            if type(feature)==np.ndarray and feature.dtype == object and feature.shape == ():
+                feature = feature.item()
+            if isinstance(feature, dict):
+                for modality, samples in feature.items():
+                    if isinstance(samples, tuple) and samples[0] == "memmap":
+                        feature[modality] = np.load(samples[1], mmap_mode="r")
+                    elif isinstance(samples, tuple) and samples[0] == "ragged":
+                        feature[modality] = raggedArray(data[samples[1] + "_values"], data[samples[1] + "_offsets"])
         return feature
 
     def _extractFeature(self,
-                        baseModality: str = "audio",
                         num_word: int = 1,
                         verbose:int = 0,
                         **kwargs):
         """
-        recipe: dictionary, required
+        recipe: dictionary, required, passed by getXy in kwargs
             file list to extract feature on each modality
-        baseModality: string, optional, default="audio"
-            base file length for aligning all the other modalities
+        isFlattened, isOnehot: bool, required, passed by getXy in kwargs
+        num_word: int, optional, default=1
+            number of consecutive words of each text sample, centered on
+            the word of the window
         """
         # check arguments
         recipe = kwargs["recipe"]
@@ -190,91 +1070,275 @@ class batchExtractor(featureExtractor):
 
         # extract feature from each file
         self.num_files = len(recipe[list(recipe.keys())[0]])
+
+        if self.sample_shift <= 0:
+            fileIterator = self._loadFiles(recipe, verbose=verbose)
+            if verbose > 0:
+                fileIterator = tqdm(fileIterator, total=self.num_files, ascii=True, desc="extracting")
+            features = {modality: [] for modality in recipe.keys()}
+            for fileIdx, features_per_file in fileIterator:
+                frame_rates = self.getFrameRates(recipe, fileIdx)
+                length = self.getAlignedLength({modality: len(f) for modality, f in features_per_file.items()
+                                                if modality != "text"}, frame_rates)
+
+                # align length of each modality
+                for modality in recipe.keys():
+                    features[modality].append(self.alignFeatures(features_per_file[modality], modality, length, frame_rates))
+            if kwargs.get("isRagged", False):
+                features = {modality: raggedArray.fromList(features[modality]) for modality in features.keys()}
+            return features
+
+        # the output size is known from the catalog before loading any feature
+        profiler = self.profiler
+        with profiler.stage("plan"):
+            plan = self.planRecipe(recipe, verbose=verbose)
+        feature_shape = plan["feature_shape"]
+        num_total_sample = plan["num_total_sample"]
+        print("feature_shape: {0}".format(feature_shape))
+        print("num_total_sample: {0}".format(num_total_sample))
+
+        with profiler.stage("allocate"):
+            features = self._allocateSamples(self.planMemory(plan=plan, isFlattened=isFlattened, num_word=num_word),
+                                             verbose=verbose)
+
+        file_shifts = np.concatenate([[0], np.cumsum(plan["num_sample"])]).astype(int)
+        pending = list(range(self.num_files))
+        if self.checkpoint:
+            if self._checkpoint is not None:
+                # left open by a build interrupted by an exception
+                self._checkpoint.close()
+            self._checkpoint = self._openCheckpoint(plan, isFlattened=isFlattened, isOnehot=isOnehot,
+                                                    num_word=num_word)
+            with profiler.stage("checkpoint_load"):
+                for fileIdx in sorted(self._checkpoint.done):
+                    segment = self._checkpoint.load(fileIdx)
+                    for modality in recipe.keys():
+                        features[modality][file_shifts[fileIdx]:file_shifts[fileIdx + 1]] = segment[modality]
+            pending = [fileIdx for fileIdx in pending if fileIdx not in self._checkpoint.done]
+            if verbose > 0:
+                print(Fore.CYAN + "{0} files restored from {1}".format(self.num_files - len(pending),
+                                                                       self._checkpoint.path) + Style.RESET_ALL)
+
+        fileIterator = self._loadFiles({modality: [recipe[modality][fileIdx] for fileIdx in pending]
+                                        for modality in recipe.keys()}, verbose=verbose)
         if verbose > 0:
-            fileIdxIterator = tqdm(np.arange(self.num_files), ascii=True, desc="extracting")
+            fileIterator = tqdm(fileIterator, total=len(pending), ascii=True, desc="extracting")
+        for pendingIdx, features_per_file in fileIterator:
+            fileIdx = pending[pendingIdx]
+            num_sample = plan["num_sample"][fileIdx]
+            file_shift = file_shifts[fileIdx]
+            word_starts = self.getWordStarts(recipe, fileIdx, plan["frame_rate"][fileIdx])
+            for modality in recipe.keys():
+                # align length of each modality
+                features_per_modality = self.alignFeatures(features_per_file[modality],
+                                                           modality,
+                                                           plan["min_length"][fileIdx],
+                                                           plan["frame_rate"][fileIdx])
+                with profiler.stage("window", modality=modality):
+                    features[modality][file_shift:file_shift + num_sample] = self._windowFile(features_per_modality,
+                                                                                              modality=modality,
+                                                                                              num_sample=num_sample,
+                                                                                              isFlattened=isFlattened,
+                                                                                              num_word=num_word,
+                                                                                              word_starts=word_starts)
+            profiler.count("samples", num_sample)
+            if self._checkpoint is not None:
+                with profiler.stage("checkpoint_save"):
+                    self._checkpoint.save(fileIdx, {modality: features[modality][file_shift:file_shift + num_sample]
+                                                    for modality in recipe.keys()})
+        return features
+
+    def _openCheckpoint(self,
+                        plan:dict,
+                        **settings) -> batchCheckpoint:
+        """
+        checkpoint of the batch cache being built, in a .partial directory
+        next to it
+        """
+        meta = dict(settings,
+                    window_size=self.window_size,
+                    sample_shift=self.sample_shift,
+                    label_reduction=self.label_reduction,
+                    label_reduction_args=self.label_reduction_args,
+                    align=self.align,
+                    align_rate=self.align_rate,
+                    dtype={modality: self.getDtype(modality).str for modality in plan["feature_shape"].keys()},
+                    num_sample=[int(n) for n in plan["num_sample"]])
+        return batchCheckpoint(splitext(self.cachePath)[0] + ".partial", meta)
+
+    def getDtype(self,
+                 modality:str):
+        """
+        dtype of the windowed samples of a modality
+        """
+        if isinstance(self.dtype, dict):
+            return np.dtype(self.dtype.get(modality, self.DEFAULT_DTYPE))
+        elif self.dtype is not None:
+            return np.dtype(self.dtype)
+        return np.dtype(self.DEFAULT_DTYPE)
+
+    def _getSampleShape(self,
+                        modality:str,
+                        feature_shape:tuple,
+                        isFlattened:bool,
+                        num_word:int = 1) -> tuple:
+        if modality == "text":
+            if num_word == 1:
+                return feature_shape
+            elif isFlattened:
+                return (num_word * int(np.prod(feature_shape)), )
+            return (num_word, ) + feature_shape
+        elif modality == "ref" or modality == "label":
+            return feature_shape
+        elif isFlattened:
+            return (self.window_size * int(np.prod(feature_shape)), )
         else:
-            fileIdxIterator = np.arange(self.num_files)
+            return (self.window_size, ) + feature_shape
+
+    def planMemory(self,
+                   recipe:dict = None,
+                   isFlattened:bool = False,
+                   num_word:int = 1,
+                   plan:dict = None,
+                   verbose:int = 0) -> dict:
+        """
+        Dry-run of the allocation of windowed samples
 
-        features = dict()
-        for fileIdx in fileIdxIterator:
-            min_length = sys.maxsize
+        Parameters
+        ----------
+        recipe: dictionary, optional
+            recipe to be planned with planRecipe
+        plan: dictionary, optional
+            output of planRecipe, used instead of recipe
+
+        Return
+        ------
+        dictionary {modality: {"shape", "dtype", "nbytes"}} and "total" bytes
+        """
+        if plan is None:
+            plan = self.planRecipe(recipe)
+        report = dict()
+        total = 0
+        for modality, feature_shape in plan["feature_shape"].items():
+            shape = (plan["num_total_sample"][modality], ) + self._getSampleShape(modality, feature_shape,
+                                                                                  isFlattened, num_word)
+            dtype = self.getDtype(modality)
+            nbytes = int(np.prod(shape)) * dtype.itemsize
+            report[modality] = {"shape": shape, "dtype": dtype, "nbytes": nbytes}
+            total += nbytes
+        report["total"] = total
+
+        if verbose > 0:
+            for modality, entry in report.items():
+                if modality != "total":
+                    print("{0}: {1} {2} {3:.1f} MB".format(modality, entry["shape"], entry["dtype"], entry["nbytes"] / 2**20))
+            print("total: {0:.1f} MB".format(total / 2**20))
+        return report
+
+    def _allocateSamples(self,
+                         report:dict,
+                         verbose:int = 0) -> dict:
+        """
+        allocate the arrays planned by planMemory within memory_budget
+        """
+        modalities = [modality for modality in report.keys() if modality != "total"]
+        if self.memory_budget is None or report["total"] <= self.memory_budget:
+            return {modality: np.zeros(report[modality]["shape"], dtype=report[modality]["dtype"])
+                    for modality in modalities}
+
+        message = "windowed samples need {0} bytes over the memory budget of {1} bytes".format(report["total"], self.memory_budget)
+        if self.on_budget == "raise":
+            raise MemoryError(message)
+
+        # disk-backed output next to the batch cache file
+        if verbose > 0:
+            print(Fore.YELLOW + message + ", falling back to memmap" + Style.RESET_ALL)
+        samples = dict()
+        for modality in modalities:
+            samples[modality] = np.lib.format.open_memmap(splitext(self.cachePath)[0] + ".{0}.npy".format(modality),
+                                                          mode="w+",
+                                                          dtype=report[modality]["dtype"],
+                                                          shape=report[modality]["shape"])
+        return samples
+
+    def _saveToCache(self,
+                     features_list,
+                     verbose:int = 0):
+        """
+        memmap samples are stored in their own .npy files, thus only their
+        pathes are saved into the cache file. raggedArray are stored as
+        plain values and offsets arrays instead of pickled objects.
+        """
+        arrays = dict()
+        if isinstance(features_list, dict):
+            features_list = dict(features_list)
+            for modality, samples in features_list.items():
+                if isinstance(samples, np.memmap):
+                    samples.flush()
+                    features_list[modality] = ("memmap", samples.filename)
+                elif isinstance(samples, raggedArray):
+                    arrays["ragged_{0}_values".format(modality)] = samples.values
+                    arrays["ragged_{0}_offsets".format(modality)] = samples.offsets
+                    features_list[modality] = ("ragged", "ragged_{0}".format(modality))
+        super()._saveToCache(features_list=features_list, verbose=verbose, **arrays)
+
+        # the checkpoint is kept when the batch cache could not be written
+        if self._checkpoint is not None:
+            if exists(self.cachePath):
+                self._checkpoint.remove()
+            else:
+                self._checkpoint.close()
+            self._checkpoint = None
+
+    def planRecipe(self,
+                   recipe:dict,
+                   verbose:int = 0) -> dict:
+        """
+        Plan the windowing of a recipe without loading the features
+
+        Lengths and shapes are read from the cache catalog of the single
+        file extractor. Files which are not cached yet are extracted first.
+
+        Return
+        ------
+        dictionary with the following keys:
+            "min_length": aligned length of each file
+            "frame_rate": getFrameRates of each file
+            "num_sample": number of windows of each file
+            "num_total_sample": number of windows of each modality
+            "feature_shape": per-frame shape of each modality
+            "dtype": cached dtype of each modality
+        """
+        num_files = len(recipe[list(recipe.keys())[0]])
+        plan = {"min_length": [], "frame_rate": [], "num_sample": [], "num_total_sample": dict(),
+                "feature_shape": dict(), "dtype": dict()}
+        for fileIdx in range(num_files):
+            lengths = dict()
             for modality in recipe.keys():
-                features_per_file = self.singleFileExtractor.getXy(fileName=recipe[modality][fileIdx],
-                                                          modality=modality,
-                                                          verbose=verbose)
-                if modality in features.keys():
-                    features[modality].append(features_per_file)
-                else:
-                    features[modality] = [features_per_file]
+                fileName = recipe[modality][fileIdx]
+                info = self.singleFileExtractor.getCacheInfo(fileName, modality)
+                if info is None:
+                    features_per_file = np.asarray(self.singleFileExtractor.getXy(fileName=fileName,
+                                                                                  modality=modality,
+                                                                                  verbose=verbose))
+                    info = {"dtype": features_per_file.dtype.str,
+                            "shape": list(features_per_file.shape),
+                            "length": len(features_per_file)}
+
+                # store the shapes in each modalities
+                if modality not in plan["feature_shape"].keys():
+                    plan["feature_shape"][modality] = tuple(info["shape"][1:])
+                    plan["dtype"][modality] = np.dtype(info["dtype"])
                 if modality != "text":
-                    min_length = min(min_length, len(features_per_file))
+                    lengths[modality] = info["length"]
 
-            # align length of each modality
-            for modality in recipe.keys():
-                features[modality][fileIdx] = features[modality][fileIdx][:min_length]
-
-        if self.sample_shift > 0:
-            feature_shape = dict()
-            num_total_sample = dict()
-            for modality in features.keys():
-                for features_per_file in features[modality]:
-                    # store the shapes in each modalities
-                    if modality not in feature_shape.keys():
-                        feature_shape[modality] = features_per_file[0].shape
-
-                    # store the length in each modalities
-                    if modality not in num_total_sample.keys():
-                        num_total_sample[modality] = int( (len(features_per_file) - self.window_size) / self.sample_shift)
-                    else:
-                        num_total_sample[modality] += int( (len(features_per_file) - self.window_size) / self.sample_shift)
-
-            print("feature_shape: {0}".format(feature_shape))
-            print("num_total_sample: {0}".format(num_total_sample))
-            base_num_sample = []
-            for modality in features.keys():
-                if verbose > 0:
-                    print("sampling... modality:{0}".format(modality))
-
-                # create empty array for samples per one modality
-                if modality == "text":
-                    samples = np.zeros((num_total_sample[baseModality], ) + num_word * feature_shape[modality])
-                elif modality == "ref" or modality == "label":
-                    samples = np.zeros((num_total_sample[modality], ) + feature_shape[modality])
-                else:
-                    if isFlattened:
-                        samples = np.zeros((num_total_sample[modality], self.window_size * np.prod(feature_shape[modality])))
-                    else:
-                        samples = np.zeros((num_total_sample[modality], self.window_size) + feature_shape[modality])
-
-                file_shift = 0
-                for fileIdx, features_per_file in enumerate(features[modality]):
-                    if modality == "text":
-                        num_sample = base_num_sample[fileIdx]
-                        num_word_per_file = len(features_per_file)
-                    else:
-                        num_sample = int( (len(features_per_file) - self.window_size) / self.sample_shift)
-
-                    # store number of samples at each file on base modality
-                    if modality == baseModality:
-                        base_num_sample.append(num_sample)
-
-                    for sampleIdx in range(num_sample):
-                        if modality == "text":
-                            start = int(sampleIdx / num_sample * num_word_per_file)
-                            end = int(sampleIdx / num_sample * num_word_per_file) + 1
-                        else:
-                            start = sampleIdx * self.sample_shift
-                            end = sampleIdx * self.sample_shift + self.window_size
-
-                        if modality == "ref" or modality == "label":
-                            mode_val, mode_num = stats.mode(features_per_file[start:end])
-                            sample = mode_val
-                        else:
-                            if isFlattened:
-                                sample = np.array(features_per_file[start:end]).flatten()
-                            else:
-                                sample = np.array(features_per_file[start:end])
-                        samples[file_shift + sampleIdx] = sample
-                    file_shift += num_sample
-                features[modality] = samples
-        return features
\ No newline at end of file
+            frame_rates = self.getFrameRates(recipe, fileIdx)
+            min_length = self.getAlignedLength(lengths, frame_rates)
+            num_sample = self._getNumSample(min_length) if min_length != sys.maxsize else 0
+            plan["min_length"].append(min_length)
+            plan["frame_rate"].append(frame_rates)
+            plan["num_sample"].append(num_sample)
+
+        # all the modalities are aligned, thus share the number of windows
+        plan["num_total_sample"] = {modality: sum(plan["num_sample"]) for modality in recipe.keys()}
+        return plan
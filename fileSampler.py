@@ -0,0 +1,158 @@
+"""
+File-local sampling of windowed samples for data loader workers
+
+Instead of shuffling samples over the whole dataset, which makes every
+worker random-access every cache file, the order of files (or of groups of
+files such as speakers) is shuffled every epoch, each worker reads its own
+subset of the files sequentially, and samples are mixed in a bounded
+shuffle buffer. Memory per worker is one file and the buffer, whatever the
+size of the dataset.
+"""
+import numpy as np
+
+def getEpochSeed(seed:int,
+                 epoch:int,
+                 worker_id:int = 0) -> int:
+    """
+    seed of a worker at an epoch, independent of the process and the Python hash seed
+    """
+    return int(np.random.SeedSequence([seed, epoch, worker_id]).generate_state(1)[0])
+
+def getFileOrder(num_files:int,
+                 epoch:int = 0,
+                 seed:int = 0,
+                 shuffle:bool = True,
+                 groups:list = None) -> np.ndarray:
+    """
+    order of the files for an epoch
+
+    Parameters
+    ----------
+    groups: list, optional
+        group key of each file, e.g. the speaker. Groups are shuffled as a
+        whole and keep the order of their files, so that the files of a
+        group, often stored together, are read in sequence.
+    """
+    if not shuffle:
+        return np.arange(num_files)
+    rng = np.random.RandomState(getEpochSeed(seed, epoch))
+    if groups is None:
+        return rng.permutation(num_files)
+    keys, inverse = np.unique(np.asarray(groups), return_inverse=True)
+    rank = rng.permutation(len(keys))[inverse]
+    return np.argsort(rank, kind="stable")
+
+def getWorkerFiles(order:np.ndarray,
+                   worker_id:int = 0,
+                   num_workers:int = 1) -> np.ndarray:
+    """
+    files read by one worker: contiguous blocks of the epoch order, so that
+    a group of files stays in one worker
+    """
+    return np.array_split(np.asarray(order), num_workers)[worker_id]
+
+def shuffleBuffer(samples,
+                  buffer_size:int,
+                  rng:np.random.RandomState):
+    """
+    generator drawing at random from a buffer of at most buffer_size
+    samples of an iterable. 0 keeps the order.
+    """
+    if buffer_size <= 0:
+        yield from samples
+        return
+    buffer = []
+    for sample in samples:
+        if len(buffer) < buffer_size:
+            buffer.append(sample)
+            continue
+        idx = rng.randint(buffer_size)
+        yield buffer[idx]
+        buffer[idx] = sample
+    rng.shuffle(buffer)
+    yield from buffer
+
+class fileSampler():
+    """
+    Stream of windowed samples of a recipe for one epoch and one worker
+
+    Parameters
+    ----------
+    batch_extractor: featureExtractor.batchExtractor with positive sample_shift
+        Files are read through its singleFileExtractor and windowed with windowFiles.
+    recipe: dictionary
+        same as batchExtractor.getXy
+    shuffle: bool, optional
+        shuffle the files every epoch, and the samples in shuffle_buffer
+    shuffle_buffer: int, optional
+        number of samples mixed across consecutive files of a worker
+    groups: list, optional
+        group key of each file shuffled as a whole, see getFileOrder
+    seed: int, optional
+        base seed, the order depends only on seed, epoch and worker
+    scalers: dictionary, optional
+        {modality: util.cv_util.groupedNorm} applied before windowing
+    num_word: int, optional
+        number of consecutive words of each text sample
+    """
+    def __init__(self,
+                 batch_extractor,
+                 recipe:dict,
+                 isFlattened:bool = False,
+                 shuffle:bool = True,
+                 shuffle_buffer:int = 1024,
+                 groups:list = None,
+                 seed:int = 0,
+                 scalers:dict = None,
+                 scale_how:str = "minmax",
+                 num_word:int = 1):
+        if batch_extractor.sample_shift <= 0:
+            raise ValueError("fileSampler requires a positive sample_shift")
+        self.batch_extractor = batch_extractor
+        self.recipe = recipe
+        self.isFlattened = isFlattened
+        self.shuffle = shuffle
+        self.shuffle_buffer = shuffle_buffer if shuffle else 0
+        self.groups = groups
+        self.seed = seed
+        self.scalers = scalers
+        self.scale_how = scale_how
+        self.num_word = num_word
+        self.num_files = len(recipe[list(recipe.keys())[0]])
+
+    def getWorkerFiles(self,
+                       epoch:int = 0,
+                       worker_id:int = 0,
+                       num_workers:int = 1) -> np.ndarray:
+        order = getFileOrder(self.num_files, epoch=epoch, seed=self.seed, shuffle=self.shuffle, groups=self.groups)
+        return getWorkerFiles(order, worker_id, num_workers)
+
+    def _iterFileSamples(self,
+                         fileIndices:np.ndarray):
+        extractor = self.batch_extractor.singleFileExtractor
+        for fileIdx in fileIndices:
+            features_per_file = {modality: extractor.getXy(fileName=self.recipe[modality][fileIdx], modality=modality)
+                                 for modality in self.recipe.keys()}
+            frame_rates = self.batch_extractor.getFrameRates(self.recipe, fileIdx)
+            windows = self.batch_extractor.windowFiles(features_per_file,
+                                                       isFlattened=self.isFlattened,
+                                                       scalers=self.scalers,
+                                                       scale_how=self.scale_how,
+                                                       frame_rates=frame_rates,
+                                                       num_word=self.num_word,
+                                                       word_starts=self.batch_extractor.getWordStarts(self.recipe, fileIdx,
+                                                                                                       frame_rates))
+            num_sample = len(next(iter(windows.values())))
+            for i in range(num_sample):
+                yield {modality: samples[i] for modality, samples in windows.items()}
+
+    def iterate(self,
+                epoch:int = 0,
+                worker_id:int = 0,
+                num_workers:int = 1):
+        """
+        generator of dictionaries {modality: one sample}
+        """
+        rng = np.random.RandomState(getEpochSeed(self.seed, epoch, worker_id + 1))
+        fileIndices = self.getWorkerFiles(epoch, worker_id, num_workers)
+        yield from shuffleBuffer(self._iterFileSamples(fileIndices), self.shuffle_buffer, rng)
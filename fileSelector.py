@@ -1,7 +1,28 @@
+import hashlib
 from glob import glob
+from os.path import splitext, basename
 
 BASE_DIR = "./"
 
+def getShardIndex(key:str,
+                  num_shards:int) -> int:
+    """
+    Stable shard assignment of a key
+
+    The key is hashed with md5 so that the assignment does not depend on
+    the Python hash seed, the glob order or the other files of the corpus.
+    Adding a file never moves the files already assigned to a shard.
+    """
+    digest = hashlib.md5(key.encode()).hexdigest()
+    return int(digest, 16) % num_shards
+
+def getFileKey(fileName:str) -> str:
+    """
+    default shard key: file base name without extension, which is shared
+    by the files of the same utterance across modalities
+    """
+    return splitext(basename(fileName))[0]
+
 class fileSelector:
     def __init__(self,
                  base_dir:str = BASE_DIR) -> list:
@@ -9,4 +30,36 @@ class fileSelector:
 
     def getFileList(self):
         path = self.base_dir + "/*"
-        return glob(path)
\ No newline at end of file
+        return glob(path)
+
+    def getGroupKey(self,
+                    fileName:str) -> str:
+        """
+        key used to keep related files in the same shard
+        """
+        return getFileKey(fileName)
+
+    def shard(self,
+              fileList:list,
+              index:int,
+              num_shards:int,
+              groupBySpeaker:bool = False) -> list:
+        """
+        select the files assigned to shard index out of num_shards
+
+        Parameters
+        ----------
+        fileList: list, required
+            file pathes to be split, e.g. the output of getFileList
+        index: int, required
+            shard index in [0, num_shards)
+        num_shards: int, required
+            total number of shards
+        groupBySpeaker: bool, optional
+            If True, all the files of one speaker are assigned to the same
+            shard, so that no speaker leaks across splits.
+        """
+        if not 0 <= index < num_shards:
+            raise ValueError("shard index {0} is out of range [0, {1})".format(index, num_shards))
+        keyFunc = self.getGroupKey if groupBySpeaker else getFileKey
+        return [f for f in fileList if getShardIndex(keyFunc(f), num_shards) == index]
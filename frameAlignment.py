@@ -0,0 +1,101 @@
+"""
+Alignment of frame-wise features extracted at different frame rates
+
+Every modality of a file covers the same clip with its own number of frames
+per second, e.g. landmarks at the FPS of the video and MFCCs at the sample
+rate divided by the hop length. Instead of cutting every stream to the
+shortest one, which lets a rate mismatch drift across the clip, frames are
+gathered on a common timeline: frame t of the timeline is at time t / rate,
+and is read from each stream at index t * stream_rate / rate, either from
+the nearest frame or interpolated linearly between the two around it.
+
+Text features are one vector per word instead of per frame. Windows are
+mapped to words with getWordIndex, from word start times when they are
+known and proportionally otherwise.
+"""
+import numpy as np
+
+ALIGN_METHODS = ["truncate", "nearest", "linear"]
+
+def getAlignedLength(lengths:list,
+                     rates:list,
+                     rate:float) -> int:
+    """
+    number of frames of the timeline at rate covered by all the streams
+    """
+    duration = min(length / stream_rate for length, stream_rate in zip(lengths, rates))
+    # tolerance for durations which are exact multiples of the frame period
+    return max(0, int(np.floor(duration * rate + 1e-6)))
+
+def getSourcePosition(length:int,
+                      stream_rate:float,
+                      rate:float) -> np.ndarray:
+    """
+    fractional index in a stream at stream_rate of each frame of the timeline
+    """
+    return np.arange(length) * (stream_rate / rate)
+
+def resampleFrames(x,
+                   stream_rate:float,
+                   rate:float,
+                   length:int,
+                   how:str = "nearest") -> np.ndarray:
+    """
+    gather length frames of the timeline at rate from features x of shape
+    (num_frames, ...) at stream_rate
+
+    Parameters
+    ----------
+    how: string, optional
+        "nearest" gathers the closest frame and keeps the dtype, as needed
+        for labels. "linear" interpolates between the two closest frames
+        and returns floating point features.
+    """
+    x = np.asarray(x)
+    if length == 0 or len(x) == 0:
+        return x[:0]
+    position = getSourcePosition(length, stream_rate, rate)
+    last = len(x) - 1
+    if how == "nearest":
+        return x[np.minimum(np.floor(position + 0.5).astype(np.int64), last)]
+    elif how == "linear":
+        lower = np.minimum(np.floor(position).astype(np.int64), last)
+        upper = np.minimum(lower + 1, last)
+        weight = (position - lower).reshape((length, ) + (1, ) * (x.ndim - 1))
+        dtype = np.result_type(x.dtype, np.float32)
+        return (x[lower] * (1 - weight) + x[upper] * weight).astype(dtype, copy=False)
+    raise ValueError("unknown resampling method: {0}".format(how))
+
+def getWordIndex(num_sample:int,
+                 num_words:int,
+                 window_size:int,
+                 shift:int,
+                 word_starts = None) -> np.ndarray:
+    """
+    index of the word of each window of a file
+
+    Parameters
+    ----------
+    word_starts: array, optional
+        start of every word in frames of the windowed timeline. A window
+        is mapped to the word spoken at its center frame. Without it,
+        window i is mapped to word i * num_words // num_sample.
+    """
+    if num_words == 0:
+        raise ValueError("text features of a file have no word")
+    if word_starts is None:
+        return np.arange(num_sample, dtype=np.int64) * num_words // max(num_sample, 1)
+    centers = np.arange(num_sample) * shift + window_size / 2
+    index = np.searchsorted(np.asarray(word_starts), centers, side="right") - 1
+    return np.clip(index, 0, num_words - 1)
+
+def getContextIndex(word_index:np.ndarray,
+                    num_word:int,
+                    num_words:int) -> np.ndarray:
+    """
+    indices of shape (num_sample, num_word) of num_word consecutive words
+    centered on each word of word_index, repeating the first and last
+    words at the edges of the file
+    """
+    offsets = np.arange(num_word) - (num_word - 1) // 2
+    return np.clip(word_index[:, np.newaxis] + offsets, 0, num_words - 1)
@@ -1,19 +1,166 @@
+import hashlib
+import itertools
+import threading
+import time
+from collections import deque
 import numpy as np
-import soundfile as sf
-import cv2
+
+from util.lazy_import import lazyImport
+sf = lazyImport("soundfile")
+cv2 = lazyImport("cv2")
 
 # Machine Learning Libraries
-import dlib
-from imutils import face_utils
+dlib = lazyImport("dlib")
 
 # signal processing
-from librosa.feature import mfcc
+mfcc = lazyImport("librosa.feature", "mfcc")
 
 from featureExtractor import featureExtractor
 
+class replayCapture():
+    """
+    cv2.VideoCapture-like source which replays a video file or a sequence
+    of frames at a fixed FPS, as a stand-in of a live camera
+    """
+    def __init__(self,
+                 source,
+                 fps:float = 30.0,
+                 loop:bool = False):
+        """
+        source: video file path or sequence of frames
+        """
+        if isinstance(source, str):
+            cap = cv2.VideoCapture(source)
+            source = []
+            while cap.isOpened():
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                source.append(frame)
+            cap.release()
+        self.frames = source
+        self.interval = 1.0 / fps
+        self.loop = loop
+        self.idx_frame = 0
+        self.next_time = None
+        self.opened = len(self.frames) > 0
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self):
+        if not self.opened or (self.idx_frame >= len(self.frames) and not self.loop):
+            return False, None
+        # wait for the capture time of the next frame
+        now = time.perf_counter()
+        if self.next_time is None:
+            self.next_time = now
+        elif now < self.next_time:
+            time.sleep(self.next_time - now)
+        self.next_time += self.interval
+
+        frame = self.frames[self.idx_frame % len(self.frames)]
+        self.idx_frame += 1
+        return True, frame
+
+    def release(self):
+        self.opened = False
+
 def getShapeListArray(list_array):
     return (len(list_array),) + list_array[0].shape
 
+# subsets of the 68 dlib landmarks
+LANDMARK_SUBSETS = {
+    "mouth": list(range(48, 68)),
+    "outer_lip": list(range(48, 60)),
+    "inner_lip": list(range(60, 68)),
+    "mouth_keypoints": [48, 54, 62, 66],
+}
+
+# derived geometry of a frame: name -> (point index A, point index B, axis), value is B - A
+LANDMARK_GEOMETRIES = {
+    "mouth_width": (48, 54, 0),
+    "mouth_open": (62, 66, 1),
+}
+
+def projectLandmarks(landmarks_frames,
+                     subset = None,
+                     geometry:list = None):
+    """
+    Project landmarks of shape (frames, 68, 2) onto a subset of points
+    of shape (frames, len(subset), 2) or derived geometry of shape
+    (frames, len(geometry))
+
+    subset: string or list of int, optional
+        name in LANDMARK_SUBSETS or dlib point indices
+    geometry: list of string, optional
+        names in LANDMARK_GEOMETRIES
+    """
+    if subset is not None and geometry is not None:
+        raise ValueError("either subset or geometry can be specified")
+    if geometry is not None:
+        a, b, axis = np.array([LANDMARK_GEOMETRIES[name] for name in geometry]).T
+        return landmarks_frames[:, b, axis] - landmarks_frames[:, a, axis]
+    if subset is not None:
+        if isinstance(subset, str):
+            subset = LANDMARK_SUBSETS[subset]
+        return landmarks_frames[:, subset]
+    return landmarks_frames
+
+# selection of one face among the faces detected in a frame
+FACE_POLICIES = ["largest", "central", "tracked"]
+
+def rectsToArray(rects) -> np.ndarray:
+    """
+    (left, top, right, bottom) of dlib rectangles as an array of shape (num_faces, 4)
+    """
+    return np.array([(rect.left(), rect.top(), rect.right(), rect.bottom()) for rect in rects],
+                    dtype=np.int64).reshape(-1, 4)
+
+def selectFace(boxes:np.ndarray,
+               policy:str = "largest",
+               frame_shape:tuple = None,
+               previous:np.ndarray = None) -> int:
+    """
+    index of the face to be predicted among boxes of rectsToArray
+
+    policy: string, optional
+        "largest" face, the most "central" one in a frame of frame_shape,
+        or the one overlapping most the previous box when "tracked". A
+        tracked face without previous box or overlap falls back to the
+        largest one.
+    """
+    if policy not in FACE_POLICIES:
+        raise ValueError("unknown face policy: {0}".format(policy))
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    if policy == "tracked" and previous is not None:
+        width = np.minimum(boxes[:, 2], previous[2]) - np.maximum(boxes[:, 0], previous[0])
+        height = np.minimum(boxes[:, 3], previous[3]) - np.maximum(boxes[:, 1], previous[1])
+        intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+        union = area + (previous[2] - previous[0]) * (previous[3] - previous[1]) - intersection
+        iou = intersection / np.maximum(union, 1)
+        if iou.max() > 0:
+            return int(np.argmax(iou))
+    elif policy == "central" and frame_shape is not None:
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        frame_center = np.array([frame_shape[1], frame_shape[0]]) / 2
+        return int(np.argmin(np.sum((centers - frame_center)**2, axis=1)))
+    return int(np.argmax(area))
+
+def shapeToArray(shape,
+                 dtype = int) -> np.ndarray:
+    """
+    coordinates of shape (num_parts, 2) of a dlib.full_object_detection
+
+    Same result as imutils.face_utils.shape_to_np, kept to drop the
+    imutils dependency. It is not a vectorized conversion: dlib exposes no
+    buffer of the points, so that one point object and one tuple are still
+    created per point. On a dlib-like stand-in it takes about 45 us per
+    face against 110 us for shape_to_np, small next to the prediction.
+    """
+    coords = itertools.chain.from_iterable((point.x, point.y) for point in shape.parts())
+    return np.fromiter(coords, dtype=dtype, count=2 * shape.num_parts).reshape(shape.num_parts, 2)
+
 class landmarksExtractor(featureExtractor):
     """
     Reference
@@ -27,29 +174,256 @@ class landmarksExtractor(featureExtractor):
     DLIB_LOWERLIP_INDEX = 66
     DLIB_MOUTH_CORNER_RIGHT = 48
     DLIB_MOUTH_CORNER_lEFT = 54
+    # landmark offsets from the nose are small integers close between frames.
+    # float16 keeps about 3 significant digits of MFCCs.
+    COMPACT_CACHE_ENCODING = {
+        "visual": "int16+delta+deflate",
+        "audio": "float16+deflate",
+    }
+    # FPS of video files is described in the original paper:
+    # https://asa.scitation.org/doi/10.1121/1.5042758
+    # The default MFCC hop follows it, so that audio frames match video frames.
+    VIDEO_FPS = 23.93
 
     def __init__(self,
                  shape_predictor:str,
                  cache_dir:str = DEFAULT_CACHE_PATH,
-                 visualize_window:bool = False):
+                 visualize_window:bool = False,
+                 landmark_subset = None,
+                 landmark_geometry:list = None,
+                 mmap_mode:str = None,
+                 cache_encoding = None,
+                 audio_hop_length:int = None,
+                 face_policy:str = "largest"):
         """
         :param fileName: If this argument is not a string, video stream will be opened.
+        :param landmark_subset: name in LANDMARK_SUBSETS or list of dlib point indices
+            to be kept on visual modality
+        :param landmark_geometry: list of names in LANDMARK_GEOMETRIES to be computed
+            on visual modality instead of the landmarks
+        :param mmap_mode: If "r", cached features are memory-mapped
+        :param cache_encoding: encoding of cached features, e.g. COMPACT_CACHE_ENCODING
+        :param audio_hop_length: native MFCC hop in samples, independent of the video
+            frame rate. MFCCs are then cached apart and aligned to the video by
+            batchExtractor with align="nearest" or "linear".
+        :param face_policy: face predicted when several ones are detected in
+            a frame, one of FACE_POLICIES. See selectFace.
         """
-        super().__init__(cache_dir=cache_dir)
+        super().__init__(cache_dir=cache_dir, mmap_mode=mmap_mode, cache_encoding=cache_encoding)
         self.visualize_window = visualize_window
+        if landmark_subset is not None and landmark_geometry is not None:
+            raise ValueError("either landmark_subset or landmark_geometry can be specified")
+        self.landmark_subset = landmark_subset
+        self.landmark_geometry = landmark_geometry
+        self.audio_hop_length = audio_hop_length
+        if face_policy not in FACE_POLICIES:
+            raise ValueError("unknown face policy: {0}".format(face_policy))
+        self.face_policy = face_policy
+        self._trackedBox = None
+
+        # dlib's face detector (HOG-based) and the facial landmark predictor
+        # are created on first use, and can be replaced for testing
+        self.shape_predictor = shape_predictor
+        self._detector = None
+        self._predictor = None
+
+    @property
+    def detector(self):
+        if self._detector is None:
+            self._detector = dlib.get_frontal_face_detector()
+        return self._detector
 
-        # initialize dlib's face detector (HOG-based) and then create
-        # the facial landmark predictor
-        self.detector = dlib.get_frontal_face_detector()
-        self.predictor = dlib.shape_predictor(shape_predictor)
+    @detector.setter
+    def detector(self, detector):
+        self._detector = detector
+
+    @property
+    def predictor(self):
+        if self._predictor is None:
+            self._predictor = dlib.shape_predictor(self.shape_predictor)
+        return self._predictor
+
+    @predictor.setter
+    def predictor(self, predictor):
+        self._predictor = predictor
 
     def getDim(self, modality):
         if modality == "audio":
             dim = 20
         elif modality == "visual":
-            dim = 68*2
+            if self.landmark_geometry is not None:
+                dim = len(self.landmark_geometry)
+            elif isinstance(self.landmark_subset, str):
+                dim = len(LANDMARK_SUBSETS[self.landmark_subset])*2
+            elif self.landmark_subset is not None:
+                dim = len(self.landmark_subset)*2
+            else:
+                dim = 68*2
         return dim
 
+    def getCacheTag(self,
+                    modality:str = "") -> str:
+        """
+        projected landmarks are cached apart from the full 68 points, and
+        MFCCs of a native hop apart from the ones at the video frame rate.
+        Visual caches are tagged with the face policy, so that caches of
+        every detected face, written before faces were selected, are not
+        served as single-face ones and are extracted again.
+        """
+        if modality == "audio" and self.audio_hop_length is not None:
+            return "_hop{0}".format(self.audio_hop_length)
+        if modality != "visual":
+            return ""
+        tag = ""
+        if self.landmark_geometry is not None:
+            tag = "_" + "-".join(self.landmark_geometry)
+        elif isinstance(self.landmark_subset, str):
+            tag = "_" + self.landmark_subset
+        elif self.landmark_subset is not None:
+            tag = "_" + hashlib.md5(str(list(self.landmark_subset)).encode()).hexdigest()[:8]
+        return tag + "_" + self.face_policy
+
+    def getAudioHopLength(self,
+                          samplerate:int) -> int:
+        """
+        MFCC hop in samples of an audio file
+        """
+        if self.audio_hop_length is not None:
+            return self.audio_hop_length
+        return int(samplerate/self.VIDEO_FPS)
+
+    def getFrameRate(self,
+                     fileName:str,
+                     modality:str = "") -> float:
+        """
+        CAP_PROP_FPS of a video, or sample rate over MFCC hop of an audio file
+        """
+        if not isinstance(fileName, str):
+            return None
+        if modality == "visual":
+            cap = cv2.VideoCapture(fileName)
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            cap.release()
+            return fps if fps > 0 else None
+        elif modality == "audio":
+            samplerate = sf.info(fileName).samplerate
+            return samplerate / self.getAudioHopLength(samplerate)
+        return None
+
+    def _detectLandmarks(self,
+                         gray):
+        """
+        absolute landmarks of shape (68, 2) of the face selected by
+        face_policy in a gray frame, or None when no face is detected
+        """
+        with self.profiler.stage("face_detect"):
+            rects = self.detector(gray, 0)
+        self.profiler.count("faces", len(rects))
+        if len(rects) == 0:
+            return None
+        # one prediction per frame, whatever the number of faces
+        faceIdx = 0
+        if len(rects) > 1 or self.face_policy == "tracked":
+            boxes = rectsToArray(rects)
+            faceIdx = selectFace(boxes, self.face_policy, gray.shape, self._trackedBox)
+            self._trackedBox = boxes[faceIdx]
+        # Make the prediction and transfom it to numpy array
+        with self.profiler.stage("shape_predict"):
+            return shapeToArray(self.predictor(gray, rects[faceIdx]))
+
+    def streamLandmarks(self,
+                        source = 0,
+                        max_queue:int = 2,
+                        verbose:int = 0):
+        """
+        Generator of landmarks of a live capture, frame by frame
+
+        Frames are read on a background thread into a bounded queue. When
+        landmark prediction falls behind the capture, the oldest frames
+        are dropped so that the latency stays bounded.
+
+        Parameters
+        ----------
+        source: int, string or capture object, optional, default=0
+            camera index or file path opened with cv2.VideoCapture, or an
+            object with the same read/isOpened/release interface such as
+            replayCapture
+        max_queue: int, optional
+            maximum number of frames waiting for prediction
+
+        Return
+        ------
+        generator of dictionary with the following keys:
+            "frame_index": index of the frame in the capture
+            "landmarks": landmarks relative to the nose as cached by getXy,
+                or None when no face is detected
+            "capture_time": time.perf_counter() when the frame was read
+            "latency": seconds from capture to the end of prediction
+            "dropped": number of frames dropped so far
+        """
+        cap = cv2.VideoCapture(source) if isinstance(source, (int, str)) else source
+        if not cap.isOpened():
+            raise IOError("Error opening video stream or file: {0}".format(source))
+
+        self._trackedBox = None
+        frames = deque(maxlen=max(1, max_queue))
+        available = threading.Condition()
+        stop = threading.Event()
+        state = {"finished": False, "dropped": 0}
+
+        def capture():
+            idx_frame = 0
+            try:
+                while not stop.is_set() and cap.isOpened():
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    with available:
+                        if len(frames) == frames.maxlen:
+                            # drop the oldest frame
+                            state["dropped"] += 1
+                        frames.append((idx_frame, time.perf_counter(), frame))
+                        available.notify()
+                    idx_frame += 1
+            finally:
+                with available:
+                    state["finished"] = True
+                    available.notify()
+
+        thread = threading.Thread(target=capture, daemon=True)
+        thread.start()
+        try:
+            while True:
+                with available:
+                    while len(frames) == 0 and not state["finished"]:
+                        available.wait()
+                    if len(frames) == 0:
+                        break
+                    idx_frame, capture_time, frame = frames.popleft()
+                    dropped = state["dropped"]
+
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+                landmarks = self._detectLandmarks(gray)
+                if landmarks is not None:
+                    landmarks = landmarks - landmarks[self.DLIB_CENTER_INDEX]
+                    landmarks = projectLandmarks(landmarks[np.newaxis],
+                                                 subset=self.landmark_subset,
+                                                 geometry=self.landmark_geometry)[0]
+                result = {
+                    "frame_index": idx_frame,
+                    "landmarks": landmarks,
+                    "capture_time": capture_time,
+                    "latency": time.perf_counter() - capture_time,
+                    "dropped": dropped,
+                }
+                if verbose > 0:
+                    print("frame:{0} latency:{1:.3f}s dropped:{2}".format(idx_frame, result["latency"], dropped))
+                yield result
+        finally:
+            stop.set()
+            thread.join()
+            cap.release()
+
     def _extractFeature(self,
                         fileName:str,
                         modality:str = "",
@@ -66,28 +440,25 @@ class landmarksExtractor(featureExtractor):
                 print("Error opening video stream or file")
 
             idx_frame = 0
+            landmarks_frames = []
+            self._trackedBox = None
+            profiler = self.profiler
+            showWindow = verbose > 1 and self.visualize_window
             # Read until video is completed
             while(cap.isOpened()):
                 # Capture frame-by-frame
-                ret, frame = cap.read()
+                with profiler.stage("video_decode"):
+                    ret, frame = cap.read()
                 if ret:
+                    profiler.count("frames")
                     # Converting the image to gray scale
                     gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                    rects = self.detector(gray, 0)
-
-                    # For each detected face, find the landmark.
-                    for (i, rect) in enumerate(rects):
-                        # Make the prediction and transfom it to numpy array
-                        landmarks = self.predictor(gray, rect)
-                        landmarks = face_utils.shape_to_np(landmarks)
-                        if "landmarks_frames" in locals():
-                            next_frame = np.expand_dims(landmarks - landmarks[self.DLIB_CENTER_INDEX], 0)
-                            landmarks_frames = np.concatenate([landmarks_frames, next_frame], axis=0)
-                            assert next_frame.shape == firstframe_shape
-                        else:
-                            landmarks_frames = landmarks - landmarks[self.DLIB_CENTER_INDEX]
-                            landmarks_frames = np.expand_dims(landmarks_frames, 0)
-                            firstframe_shape = landmarks_frames.shape
+
+                    # find the landmarks of the selected face
+                    landmarks = self._detectLandmarks(gray)
+                    if landmarks is not None:
+                        landmarks_frames.append(landmarks - landmarks[self.DLIB_CENTER_INDEX])
+                        assert landmarks_frames[-1].shape == landmarks_frames[0].shape
 
                         # Draw on our image, all the finded cordinate points (x,y)
                         if verbose > 0:
@@ -106,7 +477,8 @@ class landmarksExtractor(featureExtractor):
                             idx_frame += 1
 
                     # Press Q on keyboard to  exit
-                    if cv2.waitKey(25) & 0xFF == ord('q'):
+                    # waitKey blocks 25 ms per frame, so that it is only called with a window
+                    if showWindow and cv2.waitKey(25) & 0xFF == ord('q'):
                         break 
                     # Break the loop
                 else: 
@@ -116,16 +488,19 @@ class landmarksExtractor(featureExtractor):
             cap.release()
         
             # Closes all the frames
-            cv2.destroyAllWindows()
+            if showWindow:
+                cv2.destroyAllWindows()
 
-            return landmarks_frames
+            return projectLandmarks(np.stack(landmarks_frames),
+                                    subset=self.landmark_subset,
+                                    geometry=self.landmark_geometry)
 
         elif modality == "audio":
-            # FPS of video files is described in the original paper:
-            # https://asa.scitation.org/doi/10.1121/1.5042758
-            VIDEO_FPS = 23.93
-            signal, samplerate = sf.read(fileName)
-            mfccs = mfcc(y=signal, sr=samplerate, hop_length=int(samplerate/VIDEO_FPS))
+            with self.profiler.stage("audio_decode"):
+                signal, samplerate = sf.read(fileName)
+            self.profiler.count("audio_samples", len(signal))
+            with self.profiler.stage("mfcc"):
+                mfccs = mfcc(y=signal, sr=samplerate, hop_length=self.getAudioHopLength(samplerate))
 
             return mfccs.T
         elif modality == "label":
@@ -0,0 +1,208 @@
+"""
+Latent space inspection of variational autoencoders
+
+Encoding, projection and manifold decoding are vectorized so that the
+inspection of 100k points takes seconds: points are subsampled per class
+before any plotting, a linear PCA projection is used instead of or before
+t-SNE, and the manifold grid is decoded in a single batched call.
+"""
+import numpy as np
+
+from util.lazy_import import lazyImport
+TSNE = lazyImport("sklearn.manifold", "TSNE")
+plt = lazyImport("matplotlib.pyplot")
+
+PROJECTIONS = ["pca", "tsne", "pca+tsne"]
+
+def encodeMean(encoder,
+               x:np.ndarray,
+               batch_size:int = 4096) -> np.ndarray:
+    """
+    z_mean of a keras encoder of build_vae or a vaeNumpy.numpyVae
+    """
+    if hasattr(encoder, "encode"):
+        return encoder.encode(x, batch_size=batch_size)[0]
+    return encoder.predict(x, batch_size=batch_size, verbose=0)[0]
+
+def decodeLatent(decoder,
+                 z:np.ndarray,
+                 batch_size:int = 4096) -> np.ndarray:
+    """
+    output of a keras decoder of build_vae or a vaeNumpy.numpyVae
+    """
+    if hasattr(decoder, "decode"):
+        return decoder.decode(z, batch_size=batch_size)
+    return decoder.predict(z, batch_size=batch_size, verbose=0)
+
+def stratifiedSubsample(labels:np.ndarray,
+                        max_points:int,
+                        seed:int = 0) -> np.ndarray:
+    """
+    indices of at most max_points samples keeping the class proportions
+
+    Parameters
+    ----------
+    labels: array of shape (n, ) or one-hot array of shape (n, num_class)
+    max_points: int
+        every class keeps at least one sample, so the result may exceed
+        max_points when there are more classes than points
+
+    Return
+    ------
+    sorted array of indices
+    """
+    rng = np.random.RandomState(seed)
+    labels = np.asarray(labels)
+    if labels.ndim > 1:
+        labels = np.argmax(labels, axis=1)
+    num_points = len(labels)
+    if num_points <= max_points:
+        return np.arange(num_points)
+
+    # random order, then stable sort by class: each class is a random permutation
+    order = rng.permutation(num_points)
+    order = order[np.argsort(labels[order], kind="stable")]
+    classes, starts, counts = np.unique(labels[order], return_index=True, return_counts=True)
+    quota = np.maximum(1, np.floor(counts * max_points / num_points)).astype(int)
+    rank = np.arange(num_points) - np.repeat(starts, counts)
+    return np.sort(order[rank < np.repeat(quota, counts)])
+
+def pcaProject(z:np.ndarray,
+               n_components:int = 2) -> np.ndarray:
+    """
+    project onto the leading principal axes
+
+    The axes are the eigenvectors of the (dim, dim) covariance matrix, so
+    the cost is linear in the number of points.
+    """
+    z = np.asarray(z, dtype=np.float64)
+    centered = z - z.mean(axis=0)
+    eigval, eigvec = np.linalg.eigh(centered.T @ centered)
+    axes = eigvec[:, ::-1][:, :n_components]
+    # deterministic sign: largest loading of each axis is positive
+    axes *= np.sign(axes[np.argmax(np.abs(axes), axis=0), np.arange(axes.shape[1])])
+    return centered @ axes
+
+def projectLatent(z:np.ndarray,
+                  method:str = "pca",
+                  n_components:int = 2,
+                  pca_components:int = 50,
+                  seed:int = 0) -> np.ndarray:
+    """
+    project latent vectors to n_components dimensions for plotting
+
+    Parameters
+    ----------
+    method: string
+        "pca": linear projection
+        "tsne": exact t-SNE, quadratic in the number of points
+        "pca+tsne": t-SNE on the leading pca_components principal components
+    """
+    if method not in PROJECTIONS:
+        raise ValueError("unknown projection: {0}, must be one of {1}".format(method, PROJECTIONS))
+    if z.shape[1] <= n_components:
+        return np.asarray(z)
+    if method == "pca":
+        return pcaProject(z, n_components)
+    if method == "pca+tsne" and z.shape[1] > pca_components:
+        z = pcaProject(z, pca_components)
+    return TSNE(n_components=n_components, random_state=seed).fit_transform(z)
+
+def latentGrid(grid_size:int = 30,
+               extent:float = 4.0,
+               latent_dim:int = 2):
+    """
+    (grid_size**2, latent_dim) latent vectors in row-major order of the
+    image, top row first. Dimensions beyond the first two are set to 0.
+    """
+    grid_x = np.linspace(-extent, extent, grid_size)
+    grid_y = np.linspace(-extent, extent, grid_size)[::-1]
+    z = np.zeros((grid_size * grid_size, latent_dim))
+    z[:, 0] = np.tile(grid_x, grid_size)
+    z[:, 1] = np.repeat(grid_y, grid_size)
+    return z, grid_x, grid_y
+
+def decodeManifold(decoder,
+                   grid_size:int = 30,
+                   extent:float = 4.0,
+                   latent_dim:int = 2,
+                   image_shape:tuple = None,
+                   batch_size:int = 4096):
+    """
+    decode a grid over the first two latent dimensions in one batched call
+
+    Parameters
+    ----------
+    image_shape: tuple, optional
+        (height, width) of a decoded sample. Inferred as a square when the
+        decoder output is flat.
+
+    Return
+    ------
+    figure: (grid_size * height, grid_size * width) array of tiled samples
+    grid_x, grid_y: latent coordinates of the columns and rows
+    """
+    z, grid_x, grid_y = latentGrid(grid_size, extent, latent_dim)
+    decoded = np.asarray(decodeLatent(decoder, z.astype(np.float32), batch_size=batch_size))
+    if image_shape is None:
+        if decoded.ndim == 2:
+            side = int(np.sqrt(decoded.shape[1]))
+            image_shape = (side, side)
+        else:
+            image_shape = decoded.shape[1:3]
+    height, width = image_shape
+    figure = decoded.reshape(grid_size, grid_size, height, width) \
+                    .transpose(0, 2, 1, 3) \
+                    .reshape(grid_size * height, grid_size * width)
+    return figure, grid_x, grid_y
+
+def _render(fig,
+            filename:str,
+            show:bool):
+    if filename is not None:
+        fig.savefig(filename)
+    if show:
+        plt.show()
+    plt.close(fig)
+
+def plotLatent(z:np.ndarray,
+               labels:np.ndarray = None,
+               filename:str = None,
+               show:bool = False):
+    """
+    scatter plot of 2D projected latent vectors colored by labels
+    """
+    if labels is not None and np.ndim(labels) > 1:
+        labels = np.argmax(labels, axis=1)
+    fig, ax = plt.subplots(figsize=(12, 10))
+    scatter = ax.scatter(z[:, 0], z[:, 1], c=labels, s=4)
+    if labels is not None:
+        fig.colorbar(scatter)
+    ax.set_xlabel("z[0]")
+    ax.set_ylabel("z[1]")
+    _render(fig, filename, show)
+
+def plotManifold(figure:np.ndarray,
+                 grid_x:np.ndarray,
+                 grid_y:np.ndarray,
+                 filename:str = None,
+                 show:bool = False):
+    """
+    image of decodeManifold with latent coordinates as ticks
+    """
+    grid_size = len(grid_x)
+    sample_size = figure.shape[1] // grid_size
+    fig, ax = plt.subplots(figsize=(10, 10))
+    start_range = sample_size // 2
+    end_range = (grid_size - 1) * sample_size + start_range + 1
+    pixel_range = np.arange(start_range, end_range, sample_size)
+    # label at most 10 ticks per axis
+    step = max(1, grid_size // 10)
+    ax.set_xticks(pixel_range[::step])
+    ax.set_xticklabels(np.round(grid_x, 1)[::step])
+    ax.set_yticks(pixel_range[::step])
+    ax.set_yticklabels(np.round(grid_y, 1)[::step])
+    ax.set_xlabel("z[0]")
+    ax.set_ylabel("z[1]")
+    ax.imshow(figure, cmap='Greys_r')
+    _render(fig, filename, show)
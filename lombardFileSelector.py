@@ -7,17 +7,36 @@ class lombardFileSelector(fileSelector):
 
     def getFileList(self,
                     domain:str,
-                    verbose:int = 1):
+                    verbose:int = 1,
+                    shard:tuple = None,
+                    groupBySpeaker:bool = False):
+        """
+        shard: tuple, optional
+            (index, num_shards) to return only the files of one shard
+        """
         if domain == "visual":
             domain = "front"
             ext = "mov"
         else:
             ext = "wav"
         path = self.base_dir + domain + "/*." + ext
-        g = glob(path)
+        g = sorted(glob(path))
+        if shard is not None:
+            g = self.shard(g, *shard, groupBySpeaker=groupBySpeaker)
 
         if verbose > 0:
             print("search pattern: {0}".format(path))
             print("{0} files have been detected.".format(len(g)))
 
-        return g
\ No newline at end of file
+        return g
+
+    def getSpeaker(self,
+                   fileName:str) -> str:
+        """
+        Lombard GRID file names start with the speaker id, e.g. s2_l_bbim3a
+        """
+        return getFileKey(fileName).split("_")[0]
+
+    def getGroupKey(self,
+                    fileName:str) -> str:
+        return self.getSpeaker(fileName)
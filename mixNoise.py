@@ -2,8 +2,10 @@ import os
 import subprocess
 import numpy as np
 import math
-import matplotlib.pyplot as plt
-import seaborn as sns
+
+from util.lazy_import import lazyImport
+plt = lazyImport("matplotlib.pyplot")
+sns = lazyImport("seaborn")
 
 def load_fromYoutube(youtubeID, dtype):
     """fetch video data and extract raw audio (pcm)
@@ -0,0 +1,225 @@
+"""
+Bulk precompute of per-file feature caches
+
+    mlbase-precompute ../media/lombardgrid/ --modalities visual audio \
+        --shape_predictor shape_predictor_68_face_landmarks.dat --workers 8
+
+Every file is extracted through featureExtractor.getXy in a pool of worker
+processes, each holding its own extractor. The outcome of every file is
+appended to a json lines journal, so that an interrupted run started
+again with the same arguments skips the files already done.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+import multiprocessing
+from datetime import datetime
+
+from util.lazy_import import lazyImport
+tqdm = lazyImport("tqdm", "tqdm")
+Fore = lazyImport("colorama", "Fore")
+Style = lazyImport("colorama", "Style")
+
+JOURNAL_NAME = "precompute.jsonl"
+
+def loadJournal(path:str) -> dict:
+    """
+    last journal entry of every (file, modality)
+    """
+    entries = dict()
+    if not os.path.exists(path):
+        return entries
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # line truncated by an interruption
+                continue
+            entries[(entry["file"], entry["modality"])] = entry
+    return entries
+
+def getPendingJobs(jobs:list,
+                   journal:dict,
+                   extractor,
+                   retry_failed:bool = True) -> list:
+    """
+    jobs to be run: not in the journal, done into another cache path (e.g.
+    other landmark settings) or whose cache file has been removed since,
+    and failed ones if retry_failed
+    """
+    pending = []
+    for job in jobs:
+        entry = journal.get(job)
+        if entry is None:
+            pending.append(job)
+        elif entry["status"] == "failed":
+            if retry_failed:
+                pending.append(job)
+        else:
+            cachePath = extractor.makeCachePath(*job)
+            if entry.get("cache") != cachePath or not os.path.exists(cachePath):
+                pending.append(job)
+    return pending
+
+_extractor = None
+
+def _initWorker(createExtractor):
+    global _extractor
+    _extractor = createExtractor()
+
+def _precomputeFile(job:tuple) -> dict:
+    fileName, modality = job
+    start = time.perf_counter()
+    entry = {"file": fileName, "modality": modality, "cache": _extractor.makeCachePath(fileName, modality)}
+    try:
+        features = _extractor.getXy(fileName=fileName, modality=modality)
+        entry.update(status="done", length=len(features))
+    except Exception as e:
+        entry.update(status="failed", error="{0}: {1}".format(type(e).__name__, e),
+                     traceback=traceback.format_exc(limit=3))
+    entry.update(seconds=time.perf_counter() - start, time=datetime.now().isoformat())
+    return entry
+
+def precompute(jobs:list,
+               createExtractor,
+               journal_path:str,
+               num_workers:int = 0,
+               retry_failed:bool = True,
+               verbose:int = 1) -> dict:
+    """
+    extract and cache every (fileName, modality) job not yet in the journal
+
+    Parameters
+    ----------
+    jobs: list of (fileName, modality) tuples
+    createExtractor: callable without arguments returning a featureExtractor.
+        It is called once in every worker process, so that extractors
+        holding unpicklable models such as dlib are never sent to workers,
+        and once on the calling process to resolve cache paths.
+    journal_path: string
+        json lines file recording the outcome of every job
+    num_workers: int, optional
+        number of worker processes. 0 extracts on the calling process.
+    retry_failed: bool, optional
+        If False, files which failed in a previous run are skipped too.
+
+    Return
+    ------
+    dictionary of the number of "done", "failed" and "skipped" jobs
+    """
+    pending = getPendingJobs(jobs, loadJournal(journal_path), createExtractor(), retry_failed=retry_failed)
+    result = {"done": 0, "failed": 0, "skipped": len(jobs) - len(pending)}
+    if verbose > 0:
+        print(Fore.CYAN + "{0} files to extract, {1} already in {2}".format(
+            len(pending), result["skipped"], journal_path) + Style.RESET_ALL)
+    if len(pending) == 0:
+        return result
+
+    os.makedirs(os.path.dirname(os.path.abspath(journal_path)), exist_ok=True)
+    if num_workers > 0:
+        pool = multiprocessing.Pool(num_workers, initializer=_initWorker, initargs=(createExtractor, ))
+        entries = pool.imap_unordered(_precomputeFile, pending)
+    else:
+        pool = None
+        _initWorker(createExtractor)
+        entries = map(_precomputeFile, pending)
+
+    progress = tqdm(total=len(pending), ascii=True, desc="precompute", unit="file", disable=verbose <= 0)
+    try:
+        with open(journal_path, "a+b") as journal:
+            # terminate a line truncated by an interruption before appending
+            if journal.tell() > 0:
+                journal.seek(-1, os.SEEK_END)
+                if journal.read(1) != b"\n":
+                    journal.write(b"\n")
+            for entry in entries:
+                # one line per file, flushed so that an interruption loses nothing
+                journal.write((json.dumps(entry) + "\n").encode())
+                journal.flush()
+                result[entry["status"]] += 1
+                if entry["status"] == "failed" and verbose > 0:
+                    progress.write(Fore.RED + "failed {0} ({1}): {2}".format(
+                        entry["file"], entry["modality"], entry["error"]) + Style.RESET_ALL)
+                progress.set_postfix(failed=result["failed"], refresh=False)
+                progress.update(1)
+    finally:
+        progress.close()
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return result
+
+class landmarksExtractorFactory():
+    """
+    picklable callable creating a landmarksExtractor in worker processes
+    """
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    def __call__(self):
+        from landmarkExtractor import landmarksExtractor
+        return landmarksExtractor(**self.kwargs)
+
+def getArgumentParser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="precompute per-file feature caches of a lombard grid corpus")
+    parser.add_argument("corpus_root", help="directory containing front/ and audio/")
+    parser.add_argument("--modalities", nargs="+", default=["visual", "audio"])
+    parser.add_argument("--shape_predictor", default="shape_predictor_68_face_landmarks.dat")
+    parser.add_argument("--cache_dir", default="./cache/")
+    parser.add_argument("--landmark_subset", default=None, help="name in LANDMARK_SUBSETS")
+    parser.add_argument("--landmark_geometry", nargs="+", default=None, help="names in LANDMARK_GEOMETRIES")
+    parser.add_argument("--face_policy", default="largest", choices=["largest", "central", "tracked"],
+                        help="face whose landmarks are predicted when several are detected")
+    parser.add_argument("--audio_hop_length", type=int, default=None,
+                        help="native MFCC hop in samples instead of the video frame period")
+    parser.add_argument("--compact_cache", action="store_true",
+                        help="encode caches with landmarksExtractor.COMPACT_CACHE_ENCODING")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--shard", default=None, help="index/num_shards, e.g. 0/4")
+    parser.add_argument("--group_by_speaker", action="store_true")
+    parser.add_argument("--journal", default=None, help="default: <cache_dir>/" + JOURNAL_NAME)
+    parser.add_argument("--skip_failed", action="store_true", help="do not retry files failed in a previous run")
+    parser.add_argument("--verbose", type=int, default=1)
+    return parser
+
+def main(argv=None) -> int:
+    args = getArgumentParser().parse_args(argv)
+    from lombardFileSelector import lombardFileSelector
+
+    base_dir = os.path.join(args.corpus_root, "")
+    cache_dir = os.path.join(args.cache_dir, "")
+    shard = None
+    if args.shard is not None:
+        shard = tuple(int(i) for i in args.shard.split("/"))
+
+    selector = lombardFileSelector(base_dir)
+    jobs = [(fileName, modality)
+            for modality in args.modalities
+            for fileName in selector.getFileList(modality, verbose=args.verbose, shard=shard,
+                                                 groupBySpeaker=args.group_by_speaker)]
+    cache_encoding = None
+    if args.compact_cache:
+        from landmarkExtractor import landmarksExtractor
+        cache_encoding = landmarksExtractor.COMPACT_CACHE_ENCODING
+    createExtractor = landmarksExtractorFactory(shape_predictor=args.shape_predictor,
+                                                cache_dir=cache_dir,
+                                                cache_encoding=cache_encoding,
+                                                landmark_subset=args.landmark_subset,
+                                                landmark_geometry=args.landmark_geometry,
+                                                audio_hop_length=args.audio_hop_length,
+                                                face_policy=args.face_policy)
+    journal_path = args.journal if args.journal is not None else cache_dir + JOURNAL_NAME
+    result = precompute(jobs, createExtractor, journal_path,
+                        num_workers=args.workers,
+                        retry_failed=not args.skip_failed,
+                        verbose=args.verbose)
+    if args.verbose > 0:
+        print("done: {done} failed: {failed} skipped: {skipped}".format(**result))
+    return 1 if result["failed"] > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Per-stage timers and counters of feature extraction
+
+Extractors hold a profiler and wrap their stages with
+
+    with self.profiler.stage("face_detect"):
+        ...
+    self.profiler.count("frames")
+
+The default NULL_PROFILER does nothing, so that instrumented code costs a
+method call per stage when profiling is disabled. A stageProfiler records
+every stage as a complete event, and exports a JSON summary or a trace
+file readable by chrome://tracing and Perfetto.
+"""
+import os
+import json
+import time
+import threading
+from collections import defaultdict
+
+class _nullStage():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+class nullProfiler():
+    """
+    profiler interface doing nothing
+    """
+    enabled = False
+    _stage = _nullStage()
+
+    def stage(self,
+              name:str,
+              **args):
+        return self._stage
+
+    def count(self,
+              name:str,
+              value = 1):
+        pass
+
+NULL_PROFILER = nullProfiler()
+
+class _stage():
+    __slots__ = ("profiler", "name", "args", "start")
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler._record(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+class stageProfiler(nullProfiler):
+    """
+    records nested stages of any thread and named counters
+
+    Parameters
+    ----------
+    max_events: int, optional
+        number of stage events kept for the trace. The summary keeps
+        counting beyond it.
+    """
+    enabled = True
+
+    def __init__(self,
+                 max_events:int = 1000000):
+        self.max_events = max_events
+        self.reset()
+
+    def reset(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.counter_events = []
+        self.stages = defaultdict(lambda: [0, 0.0, 0.0])
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def stage(self,
+              name:str,
+              **args):
+        """
+        context manager timing a stage, args are shown in the trace
+        """
+        return _stage(self, name, args)
+
+    def count(self,
+              name:str,
+              value = 1):
+        """
+        add value to a counter such as frames, faces or bytes
+        """
+        with self._lock:
+            self.counters[name] += value
+            if len(self.counter_events) < self.max_events:
+                self.counter_events.append((name, time.perf_counter(), self.counters[name]))
+
+    def _record(self, name, start, end, args):
+        duration = end - start
+        with self._lock:
+            stat = self.stages[name]
+            stat[0] += 1
+            stat[1] += duration
+            stat[2] = max(stat[2], duration)
+            if len(self.events) < self.max_events:
+                self.events.append((name, threading.get_ident(), start, duration, args))
+
+    def summary(self) -> dict:
+        """
+        Return
+        ------
+        dictionary
+            "stages": {name: {"count", "total", "mean", "max"}} in seconds
+            "counters": {name: value}
+            "wall": seconds since creation or reset
+        """
+        with self._lock:
+            stages = {name: {"count": count, "total": total, "mean": total / count, "max": maximum}
+                      for name, (count, total, maximum) in self.stages.items()}
+            counters = dict(self.counters)
+        return {
+            "stages": dict(sorted(stages.items(), key=lambda item: -item[1]["total"])),
+            "counters": counters,
+            "wall": time.perf_counter() - self.origin,
+        }
+
+    def saveSummary(self,
+                    path:str):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def getTrace(self) -> dict:
+        """
+        Chrome trace event format: complete events ("X") for stages and
+        counter events ("C") for counters, times in microseconds
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            counter_events = list(self.counter_events)
+        threads = {tid: idx for idx, tid in enumerate(dict.fromkeys(e[1] for e in events))}
+        trace = [{"name": name, "ph": "X", "pid": pid, "tid": threads[tid],
+                  "ts": (start - self.origin) * 1e6, "dur": duration * 1e6,
+                  "args": {key: str(value) for key, value in args.items()}}
+                 for name, tid, start, duration, args in events]
+        trace += [{"name": name, "ph": "C", "pid": pid, "ts": (t - self.origin) * 1e6, "args": {name: value}}
+                  for name, t, value in counter_events]
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def saveTrace(self,
+                  path:str):
+        with open(path, "w") as f:
+            json.dump(self.getTrace(), f)
+
+    def printSummary(self):
+        summary = self.summary()
+        print("{0:<24} {1:>8} {2:>12} {3:>12}".format("stage", "count", "total [s]", "mean [ms]"))
+        for name, stat in summary["stages"].items():
+            print("{0:<24} {1:>8} {2:>12.4f} {3:>12.3f}".format(name, stat["count"], stat["total"], stat["mean"] * 1e3))
+        for name, value in summary["counters"].items():
+            print("{0:<24} {1:>8}".format(name, value))
@@ -0,0 +1,169 @@
+import numpy as np
+
+class raggedArray():
+    """
+    Variable-length sequences stored as flat values plus offsets
+
+    Sequence i is values[offsets[i]:offsets[i + 1]]. Memory is proportional
+    to the total length instead of the longest sequence times the number
+    of sequences, and padding is done on demand per batch.
+    """
+    def __init__(self,
+                 values,
+                 offsets):
+        """
+        values: array of shape (total length, ...)
+        offsets: int array of shape (number of sequences + 1, ), starting with 0
+        """
+        self.values = np.asarray(values)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        if len(self.offsets) == 0 or self.offsets[0] != 0 or self.offsets[-1] != len(self.values):
+            raise ValueError("offsets must start with 0 and end with the length of values")
+
+    @classmethod
+    def fromList(cls,
+                 arrays:list):
+        arrays = [np.asarray(a) for a in arrays]
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        np.cumsum([len(a) for a in arrays], out=offsets[1:])
+        if len(arrays) == 0:
+            return cls(np.zeros(0), offsets)
+        return cls(np.concatenate(arrays), offsets)
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def feature_shape(self):
+        return self.values.shape[1:]
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _gatherIndex(self,
+                     indices):
+        """
+        positions in values of the frames of the selected sequences
+        """
+        starts = self.offsets[indices]
+        lengths = self.offsets[indices + 1] - starts
+        base = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return base + np.arange(lengths.sum()), lengths
+
+    def __getitem__(self,
+                    key):
+        """
+        an integer returns a view of one sequence, and a slice or an index
+        array returns a raggedArray
+        """
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            return self.values[self.offsets[key]:self.offsets[key + 1]]
+        if isinstance(key, slice) and key.step in [None, 1]:
+            start, stop, _ = key.indices(len(self))
+            stop = max(start, stop)
+            return raggedArray(self.values[self.offsets[start]:self.offsets[stop]],
+                               self.offsets[start:stop + 1] - self.offsets[start])
+        indices = np.arange(len(self))[key]
+        position, lengths = self._gatherIndex(indices)
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return raggedArray(self.values[position], offsets)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def toList(self) -> list:
+        return list(self)
+
+    def toPadded(self,
+                 indices = None,
+                 max_length:int = None,
+                 pad_value = 0,
+                 dtype = None):
+        """
+        dense array of shape (number of sequences, max_length, ...)
+
+        Parameters
+        ----------
+        indices: array of int, optional
+            sequences to be padded, all of them by default
+        max_length: int, optional
+            length of the padded axis. Defaults to the longest selected
+            sequence, and longer sequences are truncated.
+        """
+        if indices is None:
+            indices = np.arange(len(self))
+        indices = np.asarray(indices, dtype=np.int64)
+        position, lengths = self._gatherIndex(indices)
+        if max_length is None:
+            max_length = int(lengths.max()) if len(lengths) > 0 else 0
+        padded = np.full((len(indices), max_length) + self.feature_shape, pad_value,
+                         dtype=self.dtype if dtype is None else dtype)
+
+        row = np.repeat(np.arange(len(indices)), lengths)
+        col = np.arange(len(position)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        keep = col < max_length
+        padded[row[keep], col[keep]] = self.values[position[keep]]
+        return padded
+
+    def iterBuckets(self,
+                    batch_size:int,
+                    boundaries:list = None,
+                    shuffle:bool = False,
+                    drop_last:bool = False,
+                    seed:int = None):
+        """
+        batches of sequences of similar length, padded to the longest
+        sequence of each batch
+
+        Parameters
+        ----------
+        boundaries: list of int, optional
+            length boundaries of the buckets. By default sequences are sorted
+            by length and consecutive sequences make a batch.
+        shuffle: bool, optional
+            shuffle sequences within buckets and the order of batches
+
+        Return
+        ------
+        generator of (indices, padded array)
+        """
+        rng = np.random.RandomState(seed)
+        lengths = self.lengths
+        order = rng.permutation(len(self)) if shuffle else np.arange(len(self))
+        if boundaries is None:
+            buckets = [order[np.argsort(lengths[order], kind="stable")]]
+        else:
+            bucket_ids = np.digitize(lengths[order], boundaries)
+            buckets = [order[bucket_ids == b] for b in np.unique(bucket_ids)]
+
+        batches = []
+        for bucket in buckets:
+            for start in range(0, len(bucket), batch_size):
+                batch = bucket[start:start + batch_size]
+                if len(batch) < batch_size and drop_last:
+                    continue
+                batches.append(batch)
+        if shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+
+        for batch in batches:
+            yield batch, self.toPadded(batch)
+
+    def save(self,
+             path:str):
+        np.savez(path, values=self.values, offsets=self.offsets)
+
+    @classmethod
+    def load(cls,
+             path:str):
+        with np.load(path) as data:
+            return cls(data["values"], data["offsets"])
@@ -4,6 +4,15 @@ setup(
     name="mlbase",
     version="0.1",
     packages=find_packages(),
+    py_modules=["featureExtractor", "landmarkExtractor", "fileSelector", "lombardFileSelector",
+                "slidingWindow", "raggedArray", "profiler", "precompute", "embeddingExtractor",
+                "latentAnalysis", "vae", "vaeNumpy", "mixNoise", "cacheEncoding",
+                "fileSampler", "torchDataset", "frameAlignment"],
+    entry_points={
+        "console_scripts": [
+            "mlbase-precompute=precompute:main",
+        ],
+    },
     description=("machine learning"),
     author="M.T"
-)
\ No newline at end of file
+)
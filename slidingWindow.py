@@ -0,0 +1,127 @@
+"""
+Windowed reductions of frame-wise features
+
+All the functions take features of shape (num_frames, ...) and return one
+value per window of shape (num_sample, ...), where window i covers the
+frames [i * shift, i * shift + window_size). They run in one vectorized
+pass per file instead of one call per window.
+"""
+import numpy as np
+
+from util.lazy_import import lazyImport
+stats = lazyImport("scipy.stats")
+maximum_filter1d = lazyImport("scipy.ndimage", "maximum_filter1d")
+
+# above this number of count cells, slidingMode falls back to sorting windows
+MAX_COUNT_CELLS = 2**24
+
+def getNumSample(length:int,
+                 window_size:int,
+                 shift:int) -> int:
+    return max(0, int( (length - window_size) / shift))
+
+def _prepare(x, window_size, shift, num_sample):
+    x = np.asarray(x)
+    if num_sample is None:
+        num_sample = getNumSample(len(x), window_size, shift)
+    starts = np.arange(num_sample) * shift
+    return x.reshape(len(x), int(np.prod(x.shape[1:]))), x.shape[1:], starts
+
+def _windowSum(x2d, starts, window_size):
+    cum = np.zeros((len(x2d) + 1, ) + x2d.shape[1:], dtype=np.float64 if x2d.dtype.kind == "f" else np.int64)
+    np.cumsum(x2d, axis=0, out=cum[1:])
+    return cum[starts + window_size] - cum[starts]
+
+def _modeCount(column, starts, window_size):
+    """
+    mode and its count of a single column of labels
+    """
+    values, inverse = np.unique(column, return_inverse=True)
+    if len(values) * (len(column) + 1) <= MAX_COUNT_CELLS:
+        # running counts of each label value, differenced at window edges
+        onehot = np.zeros((len(column), len(values)), dtype=np.int32)
+        onehot[np.arange(len(column)), inverse] = 1
+        counts = _windowSum(onehot, starts, window_size)
+        # argmax returns the smallest value among ties as scipy.stats.mode
+        idx = np.argmax(counts, axis=1)
+        return values[idx], counts[np.arange(len(starts)), idx]
+    windows = np.lib.stride_tricks.sliding_window_view(inverse, window_size)[starts]
+    mode_idx, mode_num = stats.mode(windows, axis=-1, keepdims=False)
+    return values[mode_idx], mode_num
+
+def slidingMode(x,
+                window_size:int,
+                shift:int,
+                num_sample:int = None):
+    """
+    most frequent value of each window, the smallest one among ties
+    """
+    x2d, feature_shape, starts = _prepare(x, window_size, shift, num_sample)
+    modes = np.zeros((len(starts), x2d.shape[1]), dtype=x2d.dtype)
+    if len(starts) > 0:
+        for col in range(x2d.shape[1]):
+            modes[:, col], _ = _modeCount(x2d[:, col], starts, window_size)
+    return modes.reshape((len(starts), ) + feature_shape)
+
+def slidingMajority(x,
+                    window_size:int,
+                    shift:int,
+                    threshold:float = 0.5,
+                    fill = -1,
+                    num_sample:int = None):
+    """
+    mode of each window if it covers at least threshold of the window,
+    otherwise fill
+    """
+    x2d, feature_shape, starts = _prepare(x, window_size, shift, num_sample)
+    majority = np.full((len(starts), x2d.shape[1]), fill, dtype=np.result_type(x2d.dtype, np.min_scalar_type(fill)))
+    if len(starts) > 0:
+        for col in range(x2d.shape[1]):
+            mode_val, mode_num = _modeCount(x2d[:, col], starts, window_size)
+            isMajority = mode_num >= threshold * window_size
+            majority[isMajority, col] = mode_val[isMajority]
+    return majority.reshape((len(starts), ) + feature_shape)
+
+def slidingMean(x,
+                window_size:int,
+                shift:int,
+                num_sample:int = None):
+    x2d, feature_shape, starts = _prepare(x, window_size, shift, num_sample)
+    mean = _windowSum(x2d.astype(np.float64, copy=False), starts, window_size) / window_size
+    return mean.reshape((len(starts), ) + feature_shape)
+
+def slidingMax(x,
+               window_size:int,
+               shift:int,
+               num_sample:int = None):
+    x2d, feature_shape, starts = _prepare(x, window_size, shift, num_sample)
+    if len(starts) == 0:
+        return np.zeros((0, ) + feature_shape, dtype=x2d.dtype)
+    # centered filter of an O(n) running maximum, read at the window centers
+    maximum = maximum_filter1d(x2d, size=window_size, axis=0)[starts + window_size // 2]
+    return maximum.reshape((len(starts), ) + feature_shape)
+
+REDUCTIONS = {
+    "mode": slidingMode,
+    "majority": slidingMajority,
+    "mean": slidingMean,
+    "max": slidingMax,
+}
+
+def slidingReduce(x,
+                  window_size:int,
+                  shift:int,
+                  how:str = "mode",
+                  num_sample:int = None,
+                  **kwargs):
+    """
+    Parameters
+    ----------
+    how: string, optional, default="mode"
+        one of mode, majority, mean and max
+    kwargs:
+        threshold and fill of slidingMajority
+    """
+    if how not in REDUCTIONS:
+        raise ValueError("unknown reduction: {0}".format(how))
+    return REDUCTIONS[how](x, window_size, shift, num_sample=num_sample, **kwargs)
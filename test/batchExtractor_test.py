@@ -0,0 +1,370 @@
+import os
+import sys
+sys.path.insert(0, os.getcwd())
+
+import numpy as np
+import pytest
+
+from featureExtractor import *
+from syntheticExtractor import syntheticExtractor
+
+@pytest.fixture
+def recipe():
+    fileList = ["utt{0}".format(i) for i in range(5)]
+    return {
+        "visual": [f + ".mov" for f in fileList],
+        "audio": [f + ".wav" for f in fileList],
+    }
+
+@pytest.mark.parametrize("isFlattened", [False, True])
+@pytest.mark.parametrize("sample_shift", [1, 4])
+def test_batch_synthetic(tmp_path, recipe, isFlattened, sample_shift):
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    window_size = fextractor.getDim("audio")
+    be = batchExtractor(fextractor, window_size=window_size, cache_dir=str(tmp_path) + "/", sample_shift=sample_shift)
+    Xy = be.getXy(recipe=recipe, isFlattened=isFlattened, isOnehot=False)
+
+    # compare with plain slicing of the aligned per-file features
+    visual = fextractor.getXy(recipe["visual"][0], modality="visual")
+    if isFlattened:
+        assert Xy["visual"].shape[1] == fextractor.getDim("visual") * window_size
+        np.testing.assert_array_equal(Xy["visual"][1], visual[sample_shift:sample_shift + window_size].flatten())
+    else:
+        assert Xy["visual"].shape[1] == window_size
+        np.testing.assert_array_equal(Xy["visual"][1], visual[sample_shift:sample_shift + window_size])
+    assert len(Xy["visual"]) == len(Xy["audio"])
+
+@pytest.mark.parametrize("shuffle_buffer", [0, 50])
+@pytest.mark.parametrize("drop_last", [False, True])
+def test_iter_batches(tmp_path, recipe, shuffle_buffer, drop_last):
+    batch_size = 16
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4)
+    Xy = be.getXy(recipe=dict(recipe), isFlattened=True, isOnehot=False)
+
+    batches = list(be.iter_batches(recipe, batch_size=batch_size, shuffle_buffer=shuffle_buffer,
+                                   isFlattened=True, drop_last=drop_last, seed=0))
+    for batch in batches[:-1]:
+        assert len(batch["visual"]) == batch_size
+    streamed = {modality: np.concatenate([batch[modality] for batch in batches]) for modality in recipe.keys()}
+
+    num_total_sample = len(Xy["visual"])
+    if drop_last:
+        assert len(streamed["visual"]) == num_total_sample // batch_size * batch_size
+    else:
+        assert len(streamed["visual"]) == num_total_sample
+
+    if shuffle_buffer == 0:
+        for modality in recipe.keys():
+            np.testing.assert_allclose(streamed[modality], Xy[modality][:len(streamed[modality])])
+    elif not drop_last:
+        # the same samples are emitted in a different order
+        order = np.lexsort(streamed["visual"].T)
+        expected = np.lexsort(Xy["visual"].T)
+        np.testing.assert_allclose(streamed["visual"][order], Xy["visual"][expected])
+
+@pytest.mark.parametrize("lookahead", [1, 3])
+def test_prefetch_workers(tmp_path, recipe, lookahead):
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    serial = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/serial/", sample_shift=4)
+    Xy = serial.getXy(recipe=dict(recipe), isFlattened=False, isOnehot=False)
+
+    # the per-file caches are warm now and are read by the thread pool
+    pooled = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/pooled/", sample_shift=4,
+                            num_workers=2, lookahead=lookahead)
+    pooledXy = pooled.getXy(recipe=dict(recipe), isFlattened=False, isOnehot=False)
+    for modality in recipe.keys():
+        np.testing.assert_array_equal(Xy[modality], pooledXy[modality])
+
+def test_cache_catalog(tmp_path, recipe):
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    assert fextractor.getCacheInfo(recipe["visual"][0], "visual") is None
+
+    visual = fextractor.getXy(recipe["visual"][0], modality="visual")
+    info = fextractor.getCacheInfo(recipe["visual"][0], "visual")
+    assert info["shape"] == list(visual.shape)
+    assert info["length"] == len(visual)
+    assert np.dtype(info["dtype"]) == visual.dtype
+    assert os.path.exists(str(tmp_path / "visual" / featureExtractor.CATALOG_NAME))
+
+    # a catalog lost by a crash is recovered from the npy headers
+    os.remove(str(tmp_path / "visual" / featureExtractor.CATALOG_NAME))
+    assert syntheticExtractor(cache_dir=str(tmp_path) + "/").getCacheInfo(recipe["visual"][0], "visual") == info
+
+def test_plan_recipe(tmp_path, recipe):
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4)
+    plan = be.planRecipe(dict(recipe))
+    assert plan["feature_shape"] == {"visual": (68, 2), "audio": (20, )}
+    Xy = be.getXy(recipe=dict(recipe), isFlattened=False, isOnehot=False)
+    for modality in recipe.keys():
+        assert len(Xy[modality]) == plan["num_total_sample"][modality]
+
+def test_dtype_policy(tmp_path, recipe):
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    reference = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4)
+    Xy = reference.getXy(recipe=dict(recipe), isFlattened=False, isOnehot=False)
+    assert Xy["visual"].dtype == np.float64
+
+    be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4,
+                        dtype=batchExtractor.COMPACT_DTYPE_POLICY)
+    report = be.planMemory(dict(recipe), isFlattened=False)
+    assert report["visual"]["nbytes"] * 4 == Xy["visual"].nbytes
+    assert report["total"] == report["visual"]["nbytes"] + report["audio"]["nbytes"]
+
+    compactXy = be.getXy(recipe=dict(recipe), isFlattened=False, isOnehot=False)
+    assert compactXy["visual"].dtype == np.int16
+    assert compactXy["audio"].dtype == np.float32
+    np.testing.assert_array_equal(compactXy["visual"], Xy["visual"])
+
+@pytest.mark.parametrize("useCache", [False, True])
+def test_memory_budget(tmp_path, recipe, useCache):
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4,
+                        memory_budget=1024)
+    with pytest.raises(MemoryError):
+        be.getXy(recipe=dict(recipe), useCache=useCache, isFlattened=False, isOnehot=False)
+
+    reference = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/reference/", sample_shift=4)
+    Xy = reference.getXy(recipe=dict(recipe), isFlattened=False, isOnehot=False)
+
+    be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4,
+                        memory_budget=1024, on_budget="memmap")
+    for _ in range(2):
+        # the second call reopens the memmap from the cache
+        memmapXy = be.getXy(recipe=dict(recipe), useCache=useCache, isFlattened=False, isOnehot=False)
+        assert isinstance(memmapXy["visual"], np.memmap)
+        np.testing.assert_array_equal(memmapXy["visual"], Xy["visual"])
+
+@pytest.mark.parametrize("label_reduction", ["mode", "majority", "max"])
+def test_label_reduction(tmp_path, recipe, label_reduction):
+    recipe["label"] = [f.replace(".wav", ".lab") for f in recipe["audio"]]
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4,
+                        label_reduction=label_reduction)
+    Xy = be.getXy(recipe=dict(recipe), isFlattened=True, isOnehot=False)
+    assert Xy["label"].shape == (len(Xy["audio"]), )
+
+    # the first file is the first block of samples
+    labels = fextractor.getXy(recipe["label"][0], modality="label")
+    expected = slidingReduce(labels, 20, 4, how=label_reduction)
+    np.testing.assert_array_equal(Xy["label"][:len(expected)], expected)
+
+@pytest.mark.parametrize("useCache", [False, True])
+def test_ragged_cache(tmp_path, recipe, useCache):
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=0)
+    Xy = be.getXy(recipe=dict(recipe), isFlattened=False, isOnehot=False)
+
+    for _ in range(2):
+        raggedXy = be.getXy(recipe=dict(recipe), useCache=useCache, isFlattened=False, isOnehot=False, isRagged=True)
+        for modality in recipe.keys():
+            assert isinstance(raggedXy[modality], raggedArray)
+            for a, b in zip(raggedXy[modality], Xy[modality]):
+                np.testing.assert_array_equal(a, b)
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_streaming_normalization(tmp_path, recipe, num_workers):
+    from util.cv_util import groupedNorm
+
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    scaler = groupedNorm().fitCache(fextractor, recipe["audio"], modality="audio", num_workers=num_workers)
+    audio = np.concatenate([fextractor.getXy(f, modality="audio") for f in recipe["audio"]])
+    np.testing.assert_allclose(scaler.mean, audio.mean(axis=0), rtol=1e-5)
+    np.testing.assert_allclose(scaler.max, audio.max(axis=0))
+
+    be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4)
+    batches = list(be.iter_batches(recipe, batch_size=16, scalers={"audio": scaler}))
+    streamed = np.concatenate([batch["audio"] for batch in batches])
+    assert streamed.min() >= 0 and streamed.max() <= 1
+
+def test_memmap_cache(tmp_path, recipe):
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    expected = fextractor.getXy(recipe["visual"][0], modality="visual")
+
+    mmapExtractor = syntheticExtractor(cache_dir=str(tmp_path) + "/", mmap_mode="r")
+    features = mmapExtractor.getXy(recipe["visual"][0], modality="visual")
+    assert isinstance(features, np.memmap)
+    np.testing.assert_array_equal(features, expected)
+
+    # compressed members fall back to np.load
+    np.savez_compressed(str(tmp_path / "compressed.npz"), features=expected)
+    assert readCacheMemmap(str(tmp_path / "compressed.npz")) is None
+
+    be = batchExtractor(mmapExtractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4)
+    reference = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4)
+    for a, b in zip(be.iter_batches(recipe, batch_size=16), reference.iter_batches(recipe, batch_size=16)):
+        for modality in recipe.keys():
+            np.testing.assert_array_equal(a[modality], b[modality])
+
+def test_checkpoint_resume(tmp_path, recipe, monkeypatch):
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    reference = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/ref/", sample_shift=4)
+    expected = reference.getXy(recipe=dict(recipe), isFlattened=True, isOnehot=False)
+
+    def createExtractor(crash_at=None):
+        be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4,
+                            checkpoint=True)
+        windowFile = be._windowFile
+        be.windowed = []
+        def crashingWindowFile(features_per_file, modality, num_sample, isFlattened, **kwargs):
+            if modality == "visual":
+                if len(be.windowed) == crash_at:
+                    raise MemoryError("killed")
+                be.windowed.append(num_sample)
+            return windowFile(features_per_file, modality, num_sample, isFlattened, **kwargs)
+        be._windowFile = crashingWindowFile
+        return be
+
+    be = createExtractor(crash_at=3)
+    with pytest.raises(MemoryError):
+        be.getXy(recipe=dict(recipe), isFlattened=True, isOnehot=False)
+    partial = os.path.splitext(be.cachePath)[0] + ".partial"
+    assert len([f for f in os.listdir(partial) if f.endswith(".npz")]) == 3
+
+    # the final save fails: the checkpoint is kept
+    monkeypatch.setattr(featureExtractor, "_saveToCache", lambda self, features_list, verbose=0, **arrays: None)
+    be = createExtractor()
+    Xy = be.getXy(recipe=dict(recipe), isFlattened=True, isOnehot=False)
+    assert len(be.windowed) == len(recipe["visual"]) - 3
+    assert os.path.exists(partial) and not os.path.exists(be.cachePath)
+    monkeypatch.undo()
+
+    # every file is restored from the checkpoint, which is removed once the cache is saved
+    be = createExtractor()
+    Xy = be.getXy(recipe=dict(recipe), isFlattened=True, isOnehot=False)
+    assert be.windowed == []
+    assert os.path.exists(be.cachePath) and not os.path.exists(partial)
+    for modality in recipe.keys():
+        np.testing.assert_array_equal(Xy[modality], expected[modality])
+
+def test_checkpoint_settings(tmp_path, recipe):
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4, checkpoint=True)
+    be.getCachePath("batch", "")
+    plan = be.planRecipe(recipe)
+    checkpoint = be._openCheckpoint(plan, isFlattened=True)
+    checkpoint.save(0, {"visual": np.zeros(3)})
+    checkpoint.close()
+    assert be._openCheckpoint(plan, isFlattened=True).done == {0}
+    # segments of another setting are discarded
+    assert be._openCheckpoint(plan, isFlattened=False).done == set()
+
+class multiRateExtractor(syntheticExtractor):
+    """
+    visual frames at 25 FPS and audio frames at 100 frames per second
+    """
+    FRAME_RATES = {"visual": 25.0, "audio": 100.0}
+
+    def getFrameRate(self, fileName, modality=""):
+        return self.FRAME_RATES.get(modality)
+
+    def _extractFeature(self, fileName, modality="", verbose=0, **kwargs):
+        features = super()._extractFeature(fileName, modality=modality, verbose=verbose, **kwargs)
+        if modality == "audio":
+            # frame t of the timeline is the audio frame 4 * t
+            features = np.repeat(features, 4, axis=0) * np.arange(4 * len(features))[:, np.newaxis]
+        return features
+
+@pytest.mark.parametrize("align", ["nearest", "linear"])
+def test_multi_rate_align(tmp_path, recipe, align):
+    fextractor = multiRateExtractor(cache_dir=str(tmp_path) + "/")
+    be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4, align=align)
+    Xy = be.getXy(recipe=dict(recipe), isFlattened=False, isOnehot=False)
+
+    # frame rates are recorded in the catalog
+    info = fextractor.getCacheInfo(recipe["audio"][0], "audio")
+    assert info["frame_rate"] == 100.0
+    plan = be.planRecipe(dict(recipe))
+    assert plan["frame_rate"][0] == {"visual": 25.0, "audio": 100.0}
+
+    visual = fextractor.getXy(recipe["visual"][0], modality="visual")
+    audio = fextractor.getXy(recipe["audio"][0], modality="audio")
+    assert plan["min_length"][0] == min(len(visual), len(audio) // 4)
+    np.testing.assert_array_equal(Xy["visual"][1], visual[4:24])
+    np.testing.assert_allclose(Xy["audio"][1], audio[16:96:4])
+    assert len(Xy["visual"]) == len(Xy["audio"]) == sum(plan["num_sample"])
+
+    # the streaming path aligns the same way
+    batches = list(be.iter_batches(recipe, batch_size=16))
+    for modality in recipe.keys():
+        np.testing.assert_allclose(np.concatenate([batch[modality] for batch in batches]), Xy[modality])
+
+def test_align_truncate_unknown_rate(tmp_path, recipe):
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    truncated = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/truncate/", sample_shift=4)
+    resampled = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/linear/", sample_shift=4,
+                               align="linear")
+    Xy = truncated.getXy(recipe=dict(recipe), isFlattened=True, isOnehot=False)
+    # without frame rates, files are truncated to the shortest modality
+    alignedXy = resampled.getXy(recipe=dict(recipe), isFlattened=True, isOnehot=False)
+    for modality in recipe.keys():
+        np.testing.assert_array_equal(Xy[modality], alignedXy[modality])
+    with pytest.raises(ValueError):
+        batchExtractor(fextractor, window_size=20, align="cubic")
+
+class textExtractor(multiRateExtractor):
+    """
+    one vector per word, whose first value is the word index
+    """
+    NUM_WORDS = 6
+
+    def getWordTimings(self, fileName, modality="text"):
+        return np.stack([np.arange(self.NUM_WORDS) * 0.5, np.arange(1, self.NUM_WORDS + 1) * 0.5], axis=1)
+
+    def _extractFeature(self, fileName, modality="", verbose=0, **kwargs):
+        if modality == "text":
+            return np.repeat(np.arange(self.NUM_WORDS, dtype=np.float32)[:, np.newaxis], 8, axis=1)
+        return super()._extractFeature(fileName, modality=modality, verbose=verbose, **kwargs)
+
+@pytest.mark.parametrize("timings", [False, True])
+@pytest.mark.parametrize("num_word", [1, 3])
+def test_text_windows(tmp_path, recipe, monkeypatch, timings, num_word):
+    if not timings:
+        monkeypatch.setattr(textExtractor, "getWordTimings", lambda self, fileName, modality="text": None)
+    fextractor = textExtractor(cache_dir=str(tmp_path) + "/")
+    be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4)
+    recipe = dict(recipe, text=[f.replace(".mov", ".txt") for f in recipe["visual"]])
+    Xy = be.getXy(recipe=dict(recipe), isFlattened=False, isOnehot=False, num_word=num_word)
+    plan = be.planRecipe(dict(recipe))
+    report = be.planMemory(plan=plan, num_word=num_word)
+    assert Xy["text"].shape == report["text"]["shape"]
+
+    num_sample = plan["num_sample"][0]
+    if timings:
+        # 25 FPS video frames: words start every 12.5 frames
+        expected = np.minimum((np.arange(num_sample) * 4 + 10) // 12.5, textExtractor.NUM_WORDS - 1)
+    else:
+        expected = np.arange(num_sample) * textExtractor.NUM_WORDS // num_sample
+    words = Xy["text"][:num_sample, ..., 0]
+    if num_word == 1:
+        np.testing.assert_array_equal(words, expected)
+    else:
+        np.testing.assert_array_equal(words[:, 1], expected)
+        np.testing.assert_array_equal(words[:, 0], np.maximum(expected - 1, 0))
+
+    # the text windows do not depend on the order of the modalities
+    reordered = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/reordered/", sample_shift=4)
+    streamed = list(reordered.iter_batches({"text": recipe["text"], "visual": recipe["visual"], "audio": recipe["audio"]},
+                                           batch_size=1000, num_word=num_word))
+    np.testing.assert_array_equal(streamed[0]["text"], Xy["text"])
+
+def test_multi_rate_align_label(tmp_path, recipe):
+    # labels have no frame rate and are taken at the 25 FPS of the timeline
+    fextractor = multiRateExtractor(cache_dir=str(tmp_path) + "/")
+    be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4, align="nearest")
+    recipe = dict(recipe, label=[f.replace(".mov", ".lab") for f in recipe["visual"]])
+    Xy = be.getXy(recipe=dict(recipe), isFlattened=False, isOnehot=False)
+    plan = be.planRecipe(dict(recipe))
+    assert plan["frame_rate"][0] == {"visual": 25.0, "audio": 100.0, "label": None}
+
+    visual = fextractor.getXy(recipe["visual"][0], modality="visual")
+    audio = fextractor.getXy(recipe["audio"][0], modality="audio")
+    label = fextractor.getXy(recipe["label"][0], modality="label")
+    length = min(len(visual), len(audio) // 4, len(label))
+    assert plan["min_length"][0] == length
+    # the audio is still resampled
+    np.testing.assert_allclose(Xy["audio"][1], audio[16:96:4])
+    num_sample = plan["num_sample"][0]
+    np.testing.assert_array_equal(Xy["label"][:num_sample],
+                                  be._windowFile(label[:length], modality="label", num_sample=num_sample))
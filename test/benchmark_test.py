@@ -0,0 +1,44 @@
+import os
+import sys
+sys.path.insert(0, os.getcwd())
+
+import json
+
+from benchUtil import compareBaseline
+import featureBenchmark
+
+def test_compare_baseline():
+    baseline = {"results": {"a": {"seconds": 1.0, "peak_bytes": 100}, "b": {"seconds": 1.0, "peak_bytes": 100}}}
+    results = {"results": {"a": {"seconds": 1.1, "peak_bytes": 100},
+                           "b": {"seconds": 1.0, "peak_bytes": 200},
+                           "c": {"seconds": 9.0, "peak_bytes": 100}}}
+    regressions = compareBaseline(results, baseline, tolerance=0.2)
+    assert [(r["name"], r["key"]) for r in regressions] == [("b", "peak_bytes")]
+
+def test_feature_benchmark(tmp_path):
+    output = str(tmp_path / "result.json")
+    assert featureBenchmark.main(["--num_files", "4", "--repeat", "1", "--output", output]) == 0
+    with open(output) as f:
+        results = json.load(f)
+    assert {"cache_save", "cache_load", "window_w20_s4", "padStack", "mixNoise"} <= set(results["results"].keys())
+    for result in results["results"].values():
+        assert result["seconds"] > 0 and result["items_per_second"] > 0
+    # a run compared with itself at a generous tolerance has no regression
+    assert featureBenchmark.main(["--num_files", "4", "--repeat", "1", "--filter", "padStack",
+                                  "--baseline", output, "--tolerance", "100"]) == 0
+
+def test_vae_benchmark(tmp_path):
+    import vaeBenchmark
+
+    output = str(tmp_path / "vae.json")
+    assert vaeBenchmark.main(["--input_shapes", "16", "--latent_dims", "2", "--intermediate_dims", "8", "32",
+                              "--batch_sizes", "8", "--intra_op", "1", "--steps", "3", "--warmup", "1",
+                              "--output", output]) == 0
+    with open(output) as f:
+        results = json.load(f)["results"]
+    assert set(results.keys()) == {"vae_16_z2_h8_b8_intra1_inter0", "vae_16_z2_h32_b8_intra1_inter0"}
+    small, large = results["vae_16_z2_h8_b8_intra1_inter0"], results["vae_16_z2_h32_b8_intra1_inter0"]
+    assert small["num_params"] < large["num_params"]
+    assert small["intra_op"] == 1 and small["items"] == 3 * 8
+    assert small["seconds"] <= small["p90_seconds"] <= small["p99_seconds"]
+    assert small["peak_bytes"] > 0 and small["items_per_second"] > 0
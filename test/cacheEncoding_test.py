@@ -0,0 +1,76 @@
+import os
+import sys
+sys.path.insert(0, os.getcwd())
+
+import numpy as np
+import pytest
+
+from cacheEncoding import *
+from featureExtractor import batchExtractor, readCacheMemmap
+from batchExtractor_test import syntheticExtractor, recipe
+
+def randomWalk(length, seed=0):
+    rng = np.random.RandomState(seed)
+    return np.cumsum(rng.randint(-2, 3, size=(length, 68, 2)), axis=0) + rng.randint(-100, 100, size=(68, 2))
+
+@pytest.mark.parametrize("spec, stored", [("int16", "<i2"),
+                                          ("int8", "<i2"),
+                                          ("int8+delta", "|i1"),
+                                          ("delta+deflate", "|i1"),
+                                          ("int32", "<i4")])
+def test_integer_encoding(spec, stored):
+    landmarks = randomWalk(200)
+    encoded, meta = encodeArray(landmarks, spec)
+    assert meta["stored"] == stored
+    decoded = decodeArray(encoded, meta)
+    assert decoded.dtype == landmarks.dtype
+    np.testing.assert_array_equal(decoded, landmarks)
+
+def test_lossless_fallback():
+    # real values are neither cast to integers nor delta encoded
+    geometry = np.random.rand(50, 2) * 30
+    encoded, meta = encodeArray(geometry, "int8+delta")
+    assert meta["stored"] == geometry.dtype.str and not meta["delta"]
+    np.testing.assert_array_equal(decodeArray(encoded, meta), geometry)
+    # float landmarks holding integers are
+    encoded, meta = encodeArray(randomWalk(10).astype(np.float64), "int16+delta")
+    assert meta["delta"] and decodeArray(encoded, meta).dtype == np.float64
+    with pytest.raises(ValueError):
+        parseEncoding("int16+zstd")
+
+def test_float16():
+    mfcc = np.random.randn(100, 20).astype(np.float32) * 50
+    encoded, meta = encodeArray(mfcc, "float16")
+    decoded = decodeArray(encoded, meta)
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, mfcc, rtol=1e-3)
+
+def test_encoded_cache(tmp_path, recipe):
+    encodings = {"visual": "int16+delta+deflate", "audio": "float16+deflate"}
+    plain = syntheticExtractor(cache_dir=str(tmp_path) + "/plain/")
+    compact = syntheticExtractor(cache_dir=str(tmp_path) + "/compact/", cache_encoding=encodings, mmap_mode="r")
+    for modality in recipe.keys():
+        for fileName in recipe[modality]:
+            expected = plain.getXy(fileName, modality=modality)
+            features = compact.getXy(fileName, modality=modality)
+            # decoded on load, memory mapping is not possible
+            assert not isinstance(features, np.memmap)
+            assert features.dtype == expected.dtype
+            np.testing.assert_allclose(compact.getXy(fileName, modality=modality), expected, rtol=1e-3)
+
+            info = compact.getCacheInfo(fileName, modality)
+            assert info["dtype"] == expected.dtype.str and info["shape"] == list(expected.shape)
+            assert info["encoding"]["deflate"]
+            assert readCacheMemmap(compact.makeCachePath(fileName, modality)) is None
+            ratio = os.path.getsize(compact.makeCachePath(fileName, modality)) \
+                / os.path.getsize(plain.makeCachePath(fileName, modality))
+            # int64 landmarks to int16, float32 MFCCs to float16
+            assert ratio < (0.3 if modality == "visual" else 0.6)
+
+    # batches are built from encoded caches as from plain ones
+    Xy = batchExtractor(plain, window_size=20, cache_dir=str(tmp_path) + "/plain/", sample_shift=4) \
+        .getXy(recipe=dict(recipe), isFlattened=True, isOnehot=False)
+    compactXy = batchExtractor(compact, window_size=20, cache_dir=str(tmp_path) + "/compact/", sample_shift=4) \
+        .getXy(recipe=dict(recipe), isFlattened=True, isOnehot=False)
+    np.testing.assert_array_equal(compactXy["visual"], Xy["visual"])
+    np.testing.assert_allclose(compactXy["audio"], Xy["audio"], rtol=1e-3)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# modules of benchmark/ are imported by the tests as the benchmark scripts import them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmark"))
@@ -0,0 +1,90 @@
+import os
+import sys
+import warnings
+sys.path.insert(0, os.getcwd())
+warnings.filterwarnings('ignore', category=DeprecationWarning)
+warnings.filterwarnings('ignore', category=FutureWarning)
+
+import numpy as np
+import pytest
+
+from batchExtractor_test import syntheticExtractor, recipe
+from embeddingExtractor import *
+from vae import build_vae
+from vaeNumpy import export_vae, numpyVae
+
+@pytest.fixture
+def encoders(tmp_path):
+    window_size = 4
+    vae, encoder, decoder, vae_loss = build_vae((window_size * 20, ), latent_dim=3)
+    export_vae(encoder, decoder, str(tmp_path / "vae.npz"))
+    return encoder, numpyVae(str(tmp_path / "vae.npz"))
+
+def test_embedding_cache(tmp_path, recipe, encoders):
+    encoder, numpy_encoder = encoders
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    be = batchExtractor(fextractor, window_size=4, cache_dir=str(tmp_path) + "/", sample_shift=2)
+    Xy = be.getXy(recipe=dict(recipe), isFlattened=True, isOnehot=False)
+
+    ee = embeddingExtractor(be, encoder, modality="audio", batch_size=100, cache_dir=str(tmp_path) + "/")
+    embeddings = ee.getXy(recipe)
+    assert len(embeddings) == len(recipe["audio"])
+    z_mean, _, _ = encoder.predict(Xy["audio"])
+    np.testing.assert_allclose(embeddings.values, z_mean, atol=1e-5)
+
+    # the numpy runtime shares the fingerprint, thus the cache
+    numpy_ee = embeddingExtractor(be, numpy_encoder, modality="audio", cache_dir=str(tmp_path) + "/")
+    assert numpy_ee.fingerprint == ee.fingerprint
+    numpy_ee._encode = None
+    np.testing.assert_array_equal(numpy_ee.getXy(recipe).values, embeddings.values)
+
+    # only the changed file is encoded again
+    encoded = []
+    numpy_ee = embeddingExtractor(be, numpy_encoder, modality="audio", cache_dir=str(tmp_path) + "/")
+    encode = numpy_ee._encode
+    numpy_ee._encode = lambda windows: encoded.append(len(windows)) or encode(windows)
+    fextractor.getXy(recipe["audio"][2], modality="audio", useCache=False)
+    os.utime(fextractor.makeCachePath(recipe["audio"][2], "audio"), ns=(0, 0))
+    numpy_ee.getXy(recipe)
+    assert encoded == [len(embeddings[2])]
+
+def test_latent_index(tmp_path, recipe, encoders):
+    encoder, numpy_encoder = encoders
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    be = batchExtractor(fextractor, window_size=4, cache_dir=str(tmp_path) + "/", sample_shift=2)
+    index = embeddingExtractor(be, numpy_encoder, modality="audio", cache_dir=str(tmp_path) + "/").getIndex(recipe)
+
+    queries = index.vectors[[5, 40]]
+    for metric in ["cosine", "euclidean"]:
+        indices, scores = index.query(queries, k=3, metric=metric)
+        assert indices.shape == (2, 3)
+        np.testing.assert_array_equal(indices[:, 0], [5, 40])
+    fileIdx, windowIdx = index.fileIdx[40], index.windowIdx[40]
+    np.testing.assert_array_equal(index.embeddings[fileIdx][windowIdx], index.vectors[40])
+
+class shortExtractor(syntheticExtractor):
+    """
+    the first file is shorter than a window
+    """
+    def _extractFeature(self, fileName, modality="", verbose=0, **kwargs):
+        features = super()._extractFeature(fileName, modality=modality, verbose=verbose, **kwargs)
+        return features[:3] if fileName.startswith("utt0") else features
+
+@pytest.mark.parametrize("batch_size", [1, 100])
+def test_embedding_short_file(tmp_path, recipe, encoders, batch_size):
+    encoder, numpy_encoder = encoders
+    fextractor = shortExtractor(cache_dir=str(tmp_path) + "/")
+    be = batchExtractor(fextractor, window_size=4, cache_dir=str(tmp_path) + "/", sample_shift=2)
+    Xy = be.getXy(recipe=dict(recipe), isFlattened=True, isOnehot=False)
+
+    for model in [encoder, numpy_encoder]:
+        ee = embeddingExtractor(be, model, modality="audio", batch_size=batch_size, cache_dir=str(tmp_path) + "/")
+        embeddings = ee.getXy(recipe)
+        assert embeddings[0].shape == (0, 3)
+        assert len(embeddings.values) == len(Xy["audio"])
+        assert os.path.exists(ee.makeCachePath(recipe["audio"][0], "audio"))
+
+    # a recipe of short files only is encoded without any window
+    ee = embeddingExtractor(be, numpy_encoder, modality="audio", cache_dir=str(tmp_path) + "/short/")
+    embeddings = ee.getXy({modality: files[:1] for modality, files in recipe.items()})
+    assert embeddings[0].shape == (0, 3)
@@ -0,0 +1,69 @@
+import os
+import sys
+sys.path.insert(0, os.getcwd())
+
+import numpy as np
+import pytest
+
+from fileSampler import *
+from featureExtractor import batchExtractor
+from batchExtractor_test import syntheticExtractor, recipe
+
+class recordingExtractor(syntheticExtractor):
+    """
+    records the files read through getXy
+    """
+    def getXy(self, fileName, modality="", **kwargs):
+        self.read.append(fileName)
+        return super().getXy(fileName, modality=modality, **kwargs)
+
+def test_file_order():
+    order = getFileOrder(10, epoch=0, seed=1)
+    np.testing.assert_array_equal(order, getFileOrder(10, epoch=0, seed=1))
+    assert not np.array_equal(order, getFileOrder(10, epoch=1, seed=1))
+    np.testing.assert_array_equal(np.sort(order), np.arange(10))
+    np.testing.assert_array_equal(getFileOrder(10, shuffle=False), np.arange(10))
+
+    # groups are kept together in their original order
+    groups = ["s1", "s1", "s2", "s3", "s2", "s3", "s1"]
+    order = getFileOrder(len(groups), epoch=3, groups=groups)
+    for group in set(groups):
+        positions = [i for i, f in enumerate(order) if groups[f] == group]
+        assert positions == list(range(positions[0], positions[0] + len(positions)))
+        assert list(order[positions]) == sorted(order[positions])
+
+def test_shuffle_buffer():
+    rng = np.random.RandomState(0)
+    shuffled = list(shuffleBuffer(range(100), 10, rng))
+    assert sorted(shuffled) == list(range(100))
+    assert shuffled != list(range(100))
+    # a sample is never drawn more than buffer_size positions early
+    assert all(i - 10 <= position for position, i in enumerate(shuffled) if i >= 10)
+    assert list(shuffleBuffer(range(5), 0, rng)) == list(range(5))
+
+@pytest.mark.parametrize("num_workers", [1, 3])
+def test_file_sampler(tmp_path, recipe, num_workers):
+    recipe = {modality: files * 2 for modality, files in recipe.items()}
+    fextractor = recordingExtractor(cache_dir=str(tmp_path) + "/")
+    fextractor.read = []
+    be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4)
+    Xy = be.getXy(recipe=dict(recipe), isFlattened=True, isOnehot=False)
+
+    sampler = fileSampler(be, recipe, isFlattened=True, shuffle_buffer=16, seed=5)
+    streamed = []
+    for worker_id in range(num_workers):
+        fextractor.read = []
+        samples = list(sampler.iterate(epoch=2, worker_id=worker_id, num_workers=num_workers))
+        # each worker reads only its own files, in sequence
+        files = sampler.getWorkerFiles(epoch=2, worker_id=worker_id, num_workers=num_workers)
+        assert fextractor.read == [recipe[modality][f] for f in files for modality in recipe.keys()]
+        # the same epoch gives the same stream
+        assert all(np.array_equal(a["audio"], b["audio"])
+                   for a, b in zip(samples, sampler.iterate(epoch=2, worker_id=worker_id, num_workers=num_workers)))
+        streamed += samples
+
+    # every window of the epoch exactly once
+    for modality in recipe.keys():
+        rows = np.stack([sample[modality] for sample in streamed])
+        expected = Xy[modality].astype(rows.dtype)
+        np.testing.assert_array_equal(rows[np.lexsort(rows.T)], expected[np.lexsort(expected.T)])
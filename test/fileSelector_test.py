@@ -0,0 +1,52 @@
+import os
+import sys
+sys.path.insert(0, os.getcwd())
+
+import pytest
+
+from featureExtractor import shardRecipe
+from lombardFileSelector import *
+
+@pytest.fixture
+def lombardCorpus(tmp_path):
+    for domain, ext in [("front", "mov"), ("audio", "wav")]:
+        os.makedirs(str(tmp_path / domain))
+        for speaker in range(8):
+            for utterance in range(5):
+                (tmp_path / domain / "s{0}_l_utt{1}.{2}".format(speaker, utterance, ext)).touch()
+    return lombardFileSelector(base_dir=str(tmp_path) + "/")
+
+@pytest.mark.parametrize("num_shards", [1, 3, 4])
+@pytest.mark.parametrize("groupBySpeaker", [False, True])
+def test_shard_partition(lombardCorpus, num_shards, groupBySpeaker):
+    fileList = lombardCorpus.getFileList("audio", verbose=0)
+    shards = [lombardCorpus.shard(fileList, i, num_shards, groupBySpeaker=groupBySpeaker)
+              for i in range(num_shards)]
+
+    # every file belongs to exactly one shard
+    assert sorted(sum(shards, [])) == sorted(fileList)
+
+    if groupBySpeaker:
+        speakers = [set(lombardCorpus.getSpeaker(f) for f in s) for s in shards]
+        for i in range(num_shards):
+            for j in range(i + 1, num_shards):
+                assert speakers[i].isdisjoint(speakers[j])
+
+def test_shard_stable(lombardCorpus, tmp_path):
+    before = lombardCorpus.getFileList("audio", verbose=0, shard=(1, 3))
+    (tmp_path / "audio" / "s9_l_new.wav").touch()
+    after = lombardCorpus.getFileList("audio", verbose=0, shard=(1, 3))
+    assert set(before) <= set(after)
+
+def test_shard_recipe(lombardCorpus):
+    recipe = {
+        "visual": lombardCorpus.getFileList("visual", verbose=0),
+        "audio": lombardCorpus.getFileList("audio", verbose=0),
+    }
+    sharded = shardRecipe(recipe, 0, 2, keyFunc=lombardCorpus.getSpeaker)
+    assert len(sharded["visual"]) == len(sharded["audio"])
+    for v, a in zip(sharded["visual"], sharded["audio"]):
+        assert getFileKey(v) == getFileKey(a)
+
+    with pytest.raises(ValueError):
+        shardRecipe(recipe, 2, 2)
@@ -0,0 +1,60 @@
+import os
+import sys
+sys.path.insert(0, os.getcwd())
+
+import numpy as np
+import pytest
+
+from frameAlignment import *
+
+def test_aligned_length():
+    # 4 s of video at 25 FPS and 3.9 s of MFCCs at 100 frames per second
+    assert getAlignedLength([100, 390], [25.0, 100.0], 25.0) == 97
+    assert getAlignedLength([100, 390], [25.0, 100.0], 100.0) == 390
+    assert getAlignedLength([0, 390], [25.0, 100.0], 25.0) == 0
+
+@pytest.mark.parametrize("how", ["nearest", "linear"])
+def test_resample_same_rate(how):
+    x = np.arange(30).reshape(10, 3)
+    np.testing.assert_array_equal(resampleFrames(x, 25.0, 25.0, 8, how=how), x[:8])
+
+def test_resample_nearest():
+    labels = np.arange(100)
+    y = resampleFrames(labels, 100.0, 25.0, 25, how="nearest")
+    assert y.dtype == labels.dtype
+    np.testing.assert_array_equal(y, np.arange(0, 100, 4))
+    # upsampling repeats frames and never reads past the end
+    y = resampleFrames(np.arange(4), 2.0, 3.0, 6, how="nearest")
+    np.testing.assert_array_equal(y, [0, 1, 1, 2, 3, 3])
+
+def test_resample_linear():
+    t = np.arange(50) / 20.0
+    x = np.stack([3 * t, -t], axis=1)
+    y = resampleFrames(x, 20.0, 30.0, 70, how="linear")
+    expected = np.arange(70) / 30.0
+    np.testing.assert_allclose(y[:, 0], 3 * expected, atol=1e-12)
+    np.testing.assert_allclose(y[:, 1], -expected, atol=1e-12)
+    # integer landmarks are interpolated into floats
+    assert resampleFrames(np.zeros((5, 2, 2), dtype=np.int16), 2.0, 3.0, 6, how="linear").dtype == np.float32
+
+def test_resample_unknown():
+    with pytest.raises(ValueError):
+        resampleFrames(np.zeros(5), 1.0, 2.0, 4, how="cubic")
+
+def test_word_index_proportional():
+    num_sample, num_words = 37, 9
+    expected = [int(i / num_sample * num_words) for i in range(num_sample)]
+    np.testing.assert_array_equal(getWordIndex(num_sample, num_words, 20, 4), expected)
+
+def test_word_index_timings():
+    # words starting at frames 0, 30 and 50: window centers 10, 14, ..., 58
+    index = getWordIndex(13, 3, 20, 4, word_starts=[0, 30, 50])
+    centers = np.arange(13) * 4 + 10
+    np.testing.assert_array_equal(index, np.where(centers < 30, 0, np.where(centers < 50, 1, 2)))
+    # windows before the first word are mapped to it
+    np.testing.assert_array_equal(getWordIndex(2, 2, 4, 1, word_starts=[10, 20]), [0, 0])
+
+def test_context_index():
+    context = getContextIndex(np.array([0, 2, 4]), 3, 5)
+    np.testing.assert_array_equal(context, [[0, 0, 1], [1, 2, 3], [3, 4, 4]])
+    np.testing.assert_array_equal(getContextIndex(np.array([1, 3]), 1, 5), [[1], [3]])
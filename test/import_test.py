@@ -0,0 +1,37 @@
+import os
+import sys
+import json
+import subprocess
+sys.path.insert(0, os.getcwd())
+
+import pytest
+
+# dependencies which must not be imported until they are used
+HEAVY_MODULES = ["cv2", "scipy", "tqdm", "colorama", "dlib", "imutils", "librosa", "soundfile",
+                 "keras", "tensorflow", "sklearn", "matplotlib", "seaborn", "torch"]
+
+# generous bound of the import time on top of numpy
+MAX_IMPORT_SECONDS = 2.0
+
+def measureImport(module:str) -> dict:
+    code = """
+import sys, time, json
+start = time.perf_counter()
+import {0}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": sorted(sys.modules.keys())}}))
+""".format(module)
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=os.getcwd())
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+@pytest.mark.parametrize("module", ["featureExtractor", "landmarkExtractor", "vae", "mixNoise",
+                                    "fileSelector", "lombardFileSelector", "slidingWindow",
+                                    "raggedArray", "util.cv_util", "vaeNumpy", "embeddingExtractor",
+                                    "latentAnalysis", "profiler", "precompute",
+                                    "cacheEncoding", "fileSampler", "frameAlignment"])
+def test_import_time(module):
+    result = measureImport(module)
+    loaded = [m for m in HEAVY_MODULES if m in result["modules"]]
+    print("{0}: {1:.3f}s".format(module, result["seconds"]))
+    assert loaded == []
+    assert result["seconds"] < MAX_IMPORT_SECONDS
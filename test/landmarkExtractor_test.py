@@ -0,0 +1,204 @@
+import os
+import sys
+import time
+sys.path.insert(0, os.getcwd())
+
+import numpy as np
+import pytest
+
+from landmarkExtractor import *
+
+class fakeShape():
+    """
+    dlib.full_object_detection-like result of fakePredictor
+    """
+    def __init__(self, points):
+        self.points = points
+        self.num_parts = len(points)
+
+    def part(self, i):
+        class point():
+            x, y = self.points[i]
+        return point
+
+    def parts(self):
+        return [self.part(i) for i in range(self.num_parts)]
+
+class fakeRect():
+    """
+    dlib.rectangle-like box
+    """
+    def __init__(self, left, top, right, bottom):
+        self.box = (left, top, right, bottom)
+
+    def left(self):
+        return self.box[0]
+
+    def top(self):
+        return self.box[1]
+
+    def right(self):
+        return self.box[2]
+
+    def bottom(self):
+        return self.box[3]
+
+class fakeDetector():
+    def __init__(self, rects:list = None):
+        self.rects = rects if rects is not None else [fakeRect(0, 0, 4, 4)]
+
+    def __call__(self, gray, upsample):
+        # faces on frames whose first pixel is not zero
+        return self.rects if gray[0, 0] > 0 else []
+
+class fakePredictor():
+    def __init__(self, delay:float = 0.0):
+        self.delay = delay
+
+    def __call__(self, gray, rect):
+        time.sleep(self.delay)
+        points = np.arange(68*2).reshape(68, 2) + int(gray[0, 0])
+        return fakeShape(points)
+
+@pytest.fixture
+def fakeExtractor(tmp_path):
+    def create(delay=0.0, **kwargs):
+        le = landmarksExtractor("unused.dat", cache_dir=str(tmp_path) + "/", **kwargs)
+        le.detector = fakeDetector()
+        le.predictor = fakePredictor(delay)
+        return le
+    return create
+
+def createFrames(num_frames):
+    return [np.full((8, 8), i % 5, dtype=np.uint8) for i in range(num_frames)]
+
+@pytest.mark.parametrize("subset, geometry, dim", [(None, None, 68*2),
+                                                   ("mouth", None, 20*2),
+                                                   ([30, 48, 54], None, 3*2),
+                                                   (None, ["mouth_width", "mouth_open"], 2)])
+def test_landmark_projection(fakeExtractor, subset, geometry, dim):
+    le = fakeExtractor(landmark_subset=subset, landmark_geometry=geometry)
+    assert le.getDim("visual") == dim
+    if subset is None and geometry is None:
+        assert le.getCacheTag("visual") == "_largest"
+    else:
+        assert le.getCacheTag("visual") not in ["", "_largest"]
+    assert le.getCacheTag("audio") == ""
+
+    landmarks = np.random.RandomState(0).randint(-50, 50, size=(10, 68, 2))
+    projected = projectLandmarks(landmarks, subset=subset, geometry=geometry)
+    assert projected[0].size == dim
+    if geometry is not None:
+        np.testing.assert_array_equal(projected[:, 0], landmarks[:, 54, 0] - landmarks[:, 48, 0])
+        np.testing.assert_array_equal(projected[:, 1], landmarks[:, 66, 1] - landmarks[:, 62, 1])
+
+def test_stream_landmarks(fakeExtractor):
+    le = fakeExtractor()
+    results = list(le.streamLandmarks(replayCapture(createFrames(10), fps=200), max_queue=16))
+    assert [r["frame_index"] for r in results] == list(range(10))
+    assert results[0]["landmarks"] is None
+    assert results[1]["landmarks"].shape == (68, 2)
+    assert np.all(results[1]["landmarks"][landmarksExtractor.DLIB_CENTER_INDEX] == 0)
+    assert all(r["latency"] >= 0 for r in results)
+
+def test_stream_drop_oldest(fakeExtractor):
+    # prediction is 5 times slower than the capture
+    le = fakeExtractor(delay=0.025)
+    results = list(le.streamLandmarks(replayCapture(createFrames(60), fps=200), max_queue=2))
+    indices = [r["frame_index"] for r in results]
+    assert indices == sorted(indices)
+    assert results[-1]["dropped"] > 0
+    assert len(results) + results[-1]["dropped"] <= 60
+    # the latency does not grow with the number of frames behind
+    assert max(r["latency"] for r in results) < 0.5
+
+def test_profile_video(tmp_path, fakeExtractor):
+    from profiler import stageProfiler
+
+    fileName = str(tmp_path / "utt.avi")
+    writer = cv2.VideoWriter(fileName, cv2.VideoWriter_fourcc(*"MJPG"), 25, (32, 32))
+    for i in range(12):
+        writer.write(np.full((32, 32, 3), 100, dtype=np.uint8))
+    writer.release()
+
+    le = fakeExtractor()
+    profiler = stageProfiler()
+    le.setProfiler(profiler)
+    features = le.getXy(fileName, modality="visual")
+    assert features.shape == (12, 68, 2)
+
+    summary = profiler.summary()
+    assert summary["counters"]["frames"] == 12
+    assert summary["counters"]["faces"] == 12
+    assert summary["stages"]["face_detect"]["count"] == 12
+    assert summary["stages"]["shape_predict"]["count"] == 12
+    # one more read detects the end of the video
+    assert summary["stages"]["video_decode"]["count"] == 13
+    assert summary["stages"]["extract"]["total"] >= summary["stages"]["face_detect"]["total"]
+
+def test_video_frame_rate(tmp_path, fakeExtractor):
+    fileName = str(tmp_path / "utt.avi")
+    writer = cv2.VideoWriter(fileName, cv2.VideoWriter_fourcc(*"MJPG"), 29.97, (32, 32))
+    for i in range(6):
+        writer.write(np.full((32, 32, 3), 100, dtype=np.uint8))
+    writer.release()
+
+    le = fakeExtractor()
+    le.getXy(fileName, modality="visual")
+    assert le.getFrameRate(fileName, "visual") == pytest.approx(29.97, abs=0.01)
+    assert le.getCacheInfo(fileName, "visual")["frame_rate"] == pytest.approx(29.97, abs=0.01)
+
+def test_audio_hop(fakeExtractor):
+    le = fakeExtractor()
+    assert le.getAudioHopLength(16000) == int(16000 / le.VIDEO_FPS)
+    assert le.getCacheTag("audio") == ""
+    native = fakeExtractor(audio_hop_length=160)
+    assert native.getAudioHopLength(16000) == 160
+    # MFCCs of a native hop are cached apart
+    assert native.makeCachePath("utt.wav", "audio") != le.makeCachePath("utt.wav", "audio")
+
+@pytest.mark.parametrize("policy, expected", [("largest", 0), ("central", 1), ("tracked", 2)])
+def test_select_face(policy, expected):
+    boxes = np.array([[0, 0, 40, 40], [45, 45, 55, 55], [70, 70, 95, 95]])
+    assert selectFace(boxes, policy, frame_shape=(100, 100), previous=np.array([72, 72, 96, 96])) == expected
+    # nothing to track yet
+    assert selectFace(boxes, "tracked") == 0
+    with pytest.raises(ValueError):
+        selectFace(boxes, "first")
+
+def test_shape_to_array():
+    points = np.arange(68*2).reshape(68, 2)
+    np.testing.assert_array_equal(shapeToArray(fakeShape(points)), points)
+
+class countingPredictor(fakePredictor):
+    def __init__(self):
+        super().__init__()
+        self.rects = []
+
+    def __call__(self, gray, rect):
+        self.rects.append(rect)
+        return super().__call__(gray, rect)
+
+@pytest.mark.parametrize("policy", ["largest", "central", "tracked"])
+def test_multiple_faces(tmp_path, fakeExtractor, policy):
+    fileName = str(tmp_path / "utt.avi")
+    writer = cv2.VideoWriter(fileName, cv2.VideoWriter_fourcc(*"MJPG"), 25, (32, 32))
+    for i in range(5):
+        writer.write(np.full((32, 32, 3), 100, dtype=np.uint8))
+    writer.release()
+
+    le = fakeExtractor(face_policy=policy)
+    rects = [fakeRect(0, 0, 12, 12), fakeRect(14, 14, 18, 18)]
+    le.detector = fakeDetector(rects)
+    le.predictor = countingPredictor()
+    features = le.getXy(fileName, modality="visual")
+    # one prediction and one frame of landmarks per frame
+    assert features.shape == (5, 68, 2)
+    assert le.predictor.rects == [rects[1] if policy == "central" else rects[0]] * 5
+
+def test_face_policy_cache_tag(fakeExtractor):
+    # caches of every detected face, written without a face policy, are not reused
+    paths = {policy: fakeExtractor(face_policy=policy).makeCachePath("utt.mov", "visual")
+             for policy in ["largest", "central", "tracked"]}
+    assert len(set(paths.values())) == 3
+    assert all("/visual/" not in path for path in paths.values())
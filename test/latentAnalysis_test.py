@@ -0,0 +1,65 @@
+import os
+import sys
+import warnings
+sys.path.insert(0, os.getcwd())
+warnings.filterwarnings('ignore', category=DeprecationWarning)
+warnings.filterwarnings('ignore', category=FutureWarning)
+
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import pytest
+
+from latentAnalysis import *
+
+def test_stratified_subsample():
+    labels = np.repeat([0, 1, 2], [9000, 900, 100])
+    idx = stratifiedSubsample(labels, max_points=1000, seed=0)
+    assert len(np.unique(idx)) == len(idx)
+    np.testing.assert_array_equal(np.bincount(labels[idx]), [900, 90, 10])
+    # one-hot labels and small inputs
+    np.testing.assert_array_equal(stratifiedSubsample(np.eye(3)[labels], 1000), idx)
+    np.testing.assert_array_equal(stratifiedSubsample(labels[:10], 1000), np.arange(10))
+
+def test_pca_project():
+    rng = np.random.RandomState(0)
+    z = rng.randn(5000, 8) * np.array([10, 5, 1, 1, 1, 1, 1, 1])
+    projected = projectLatent(z, method="pca")
+    assert projected.shape == (5000, 2)
+    # the projection keeps the two dominant directions
+    np.testing.assert_allclose(np.abs(projected[:, 0]), np.abs(z[:, 0] - z[:, 0].mean()), atol=0.5)
+    assert projected[:, 0].var() > projected[:, 1].var()
+    with pytest.raises(ValueError):
+        projectLatent(z, method="umap")
+
+class gridDecoder():
+    """
+    decoder whose output encodes its latent input, counting predict calls
+    """
+    def __init__(self):
+        self.num_calls = 0
+
+    def predict(self, z, batch_size=32, verbose=0):
+        self.num_calls += 1
+        return np.repeat(z[:, :2], 8, axis=1)
+
+def test_decode_manifold():
+    decoder = gridDecoder()
+    figure, grid_x, grid_y = decodeManifold(decoder, grid_size=7, latent_dim=3, image_shape=(4, 4))
+    assert decoder.num_calls == 1
+    assert figure.shape == (7 * 4, 7 * 4)
+    # tile of row i and column j is the sample decoded from (grid_x[j], grid_y[i])
+    tile = figure[2*4:3*4, 5*4:6*4].reshape(-1)
+    np.testing.assert_allclose(tile[:8], grid_x[5])
+    np.testing.assert_allclose(tile[8:], grid_y[2])
+
+def test_plot_results(tmp_path):
+    from vae import build_vae, plot_results
+
+    vae, encoder, decoder, loss = build_vae((16, ), latent_dim=3)
+    x = np.random.rand(500, 16).astype(np.float32)
+    y = np.random.randint(0, 4, size=500)
+    model_name = str(tmp_path / "vae")
+    plot_results((encoder, decoder), (x, y), model_name=model_name, grid_size=5, max_points=100)
+    assert os.path.exists(os.path.join(model_name, "vae_mean.png"))
+    assert os.path.exists(os.path.join(model_name, "digits_over_latent.png"))
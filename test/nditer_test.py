@@ -40,3 +40,20 @@ def test_grouped_minmaxScaler(createArray):
     array, n = createArray
     gn = groupedNorm()
     gn.computeScaler(array, grouped_dim=n)
+
+def test_grouped_merge():
+    rng = np.random.RandomState(0)
+    data = rng.randn(50, 4, 3) * 10 + 5
+
+    full = groupedNorm().computeScaler(data, grouped_dim=1)
+    merged = groupedNorm()
+    for chunk in np.array_split(data, [3, 20, 21]):
+        merged.merge(groupedNorm().computeScaler(chunk, grouped_dim=1))
+
+    np.testing.assert_allclose(merged.mean, data.mean(axis=0))
+    np.testing.assert_allclose(merged.var, data.var(axis=0))
+    np.testing.assert_allclose(merged.min, full.min)
+    np.testing.assert_allclose(merged.max, full.max)
+    scaled = merged.transform(data)
+    assert scaled.min() == 0 and scaled.max() == 1
+    np.testing.assert_allclose(merged.inverseTransform(scaled), data)
@@ -0,0 +1,61 @@
+import os
+import sys
+sys.path.insert(0, os.getcwd())
+
+import numpy as np
+import pytest
+
+from precompute import *
+from batchExtractor_test import syntheticExtractor
+
+class flakyExtractor(syntheticExtractor):
+    """
+    fails on the files listed in a marker file, which tests edit between runs
+    """
+    def _extractFeature(self,
+                        fileName:str,
+                        modality:str = "",
+                        verbose:int = 0,
+                        **kwargs):
+        marker = self.cache_dir + "fail.txt"
+        if os.path.exists(marker) and fileName in open(marker).read().split():
+            raise IOError("cannot decode {0}".format(fileName))
+        return super()._extractFeature(fileName, modality=modality, verbose=verbose, **kwargs)
+
+class flakyFactory():
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def __call__(self):
+        return flakyExtractor(cache_dir=self.cache_dir)
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_precompute_resume(tmp_path, num_workers):
+    cache_dir = str(tmp_path) + "/"
+    jobs = [("utt{0}.wav".format(i), "audio") for i in range(6)] + [("utt0.mov", "visual")]
+    journal_path = cache_dir + JOURNAL_NAME
+    with open(cache_dir + "fail.txt", "w") as f:
+        f.write("utt3.wav")
+
+    result = precompute(jobs, flakyFactory(cache_dir), journal_path, num_workers=num_workers, verbose=0)
+    assert result == {"done": 6, "failed": 1, "skipped": 0}
+    journal = loadJournal(journal_path)
+    assert journal[("utt3.wav", "audio")]["status"] == "failed"
+    assert "cannot decode" in journal[("utt3.wav", "audio")]["error"]
+    extractor = flakyExtractor(cache_dir=cache_dir)
+    assert os.path.exists(extractor.makeCachePath("utt0.mov", "visual"))
+
+    # failed files are skipped on request, retried by default
+    result = precompute(jobs, flakyFactory(cache_dir), journal_path, num_workers=num_workers,
+                        retry_failed=False, verbose=0)
+    assert result == {"done": 0, "failed": 0, "skipped": 7}
+    os.remove(cache_dir + "fail.txt")
+    # a removed cache file is extracted again, as well as a truncated last line
+    os.remove(extractor.makeCachePath("utt1.wav", "audio"))
+    with open(journal_path, "a") as f:
+        f.write('{"file": "utt2')
+    result = precompute(jobs, flakyFactory(cache_dir), journal_path, num_workers=num_workers, verbose=0)
+    assert result == {"done": 2, "failed": 0, "skipped": 5}
+    assert all(entry["status"] == "done" for entry in loadJournal(journal_path).values())
+    np.testing.assert_array_equal(extractor.getXy("utt3.wav", modality="audio"),
+                                  extractor._extractFeature("utt3.wav", modality="audio"))
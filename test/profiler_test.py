@@ -0,0 +1,71 @@
+import os
+import sys
+sys.path.insert(0, os.getcwd())
+
+import json
+import threading
+import pytest
+
+from profiler import *
+from featureExtractor import batchExtractor
+from batchExtractor_test import syntheticExtractor, recipe
+
+def test_stage_profiler():
+    profiler = stageProfiler()
+    def work():
+        for _ in range(3):
+            with profiler.stage("outer", fileName="a.mov"):
+                with profiler.stage("inner"):
+                    pass
+                profiler.count("frames", 2)
+    threads = [threading.Thread(target=work) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    summary = profiler.summary()
+    assert summary["stages"]["outer"]["count"] == 6
+    assert summary["stages"]["inner"]["count"] == 6
+    assert summary["stages"]["outer"]["total"] >= summary["stages"]["inner"]["total"]
+    assert summary["counters"] == {"frames": 12}
+
+    trace = profiler.getTrace()["traceEvents"]
+    stages = [e for e in trace if e["ph"] == "X"]
+    assert len(stages) == 12
+    assert len({e["tid"] for e in stages}) == 2
+    assert [e["args"]["frames"] for e in trace if e["ph"] == "C"][-1] == 12
+
+def test_null_profiler():
+    with NULL_PROFILER.stage("anything", key=1):
+        NULL_PROFILER.count("frames")
+    assert not NULL_PROFILER.enabled
+    assert not hasattr(NULL_PROFILER, "summary")
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_profile_batch(tmp_path, recipe, num_workers):
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4,
+                        num_workers=num_workers)
+    profiler = stageProfiler()
+    be.setProfiler(profiler)
+    assert fextractor.profiler is profiler
+
+    Xy = be.getXy(recipe=dict(recipe), isFlattened=True, isOnehot=False)
+    Xy = be.getXy(recipe=dict(recipe), useCache=False, isFlattened=True, isOnehot=False)
+    summary = profiler.summary()
+    num_files = len(recipe["visual"]) * len(recipe.keys())
+    # planning of the first build extracts every file, which is then loaded for windowing.
+    # The second build loads the files again and rebuilds the batch.
+    assert summary["counters"]["cache_misses"] == num_files + 2
+    assert summary["counters"]["cache_hits"] == 2 * num_files
+    assert summary["counters"]["samples"] == 2 * len(Xy["visual"])
+    assert summary["counters"]["cache_bytes_written"] > 0
+    for name in ["extract", "cache_save", "cache_load", "plan", "allocate", "window"]:
+        assert summary["stages"][name]["count"] > 0
+
+    profiler.saveSummary(str(tmp_path / "summary.json"))
+    profiler.saveTrace(str(tmp_path / "trace.json"))
+    with open(str(tmp_path / "trace.json")) as f:
+        trace = json.load(f)
+    assert {e["name"] for e in trace["traceEvents"] if e["ph"] == "X"} >= {"extract", "window"}
@@ -0,0 +1,65 @@
+import os
+import sys
+sys.path.insert(0, os.getcwd())
+
+import numpy as np
+import pytest
+
+from raggedArray import raggedArray
+from featureExtractor import padStack
+
+@pytest.fixture(params=[(), (3, 2)])
+def sequences(request):
+    rng = np.random.RandomState(0)
+    return [rng.randn(length, *request.param) for length in [5, 0, 12, 7, 1, 9]]
+
+def test_ragged_roundtrip(sequences, tmp_path):
+    ra = raggedArray.fromList(sequences)
+    assert len(ra) == len(sequences)
+    np.testing.assert_array_equal(ra.lengths, [len(s) for s in sequences])
+    for i, s in enumerate(sequences):
+        np.testing.assert_array_equal(ra[i], s)
+    np.testing.assert_array_equal(ra[-1], sequences[-1])
+
+    ra.save(str(tmp_path / "ragged.npz"))
+    loaded = raggedArray.load(str(tmp_path / "ragged.npz"))
+    for a, b in zip(loaded, sequences):
+        np.testing.assert_array_equal(a, b)
+
+@pytest.mark.parametrize("key", [slice(1, 4), slice(None, None, 2), [4, 0, 2]])
+def test_ragged_slicing(sequences, key):
+    ra = raggedArray.fromList(sequences)
+    expected = np.array(sequences, dtype=object)[key]
+    sliced = ra[key]
+    assert len(sliced) == len(expected)
+    for a, b in zip(sliced, expected):
+        np.testing.assert_array_equal(a, b)
+
+def test_ragged_padding(sequences):
+    ra = raggedArray.fromList(sequences)
+    padded = ra.toPadded(pad_value=-1)
+    assert padded.shape[:2] == (len(sequences), 12)
+    for i, s in enumerate(sequences):
+        np.testing.assert_array_equal(padded[i, :len(s)], s)
+        assert np.all(padded[i, len(s):] == -1)
+
+    # truncated to max_length
+    padded = ra.toPadded(indices=[2, 3], max_length=6)
+    np.testing.assert_array_equal(padded[0], sequences[2][:6])
+
+def test_ragged_buckets(sequences):
+    ra = raggedArray.fromList(sequences)
+    seen = []
+    for indices, padded in ra.iterBuckets(batch_size=2, shuffle=True, seed=0):
+        assert padded.shape[1] == ra.lengths[indices].max()
+        seen.extend(indices)
+    assert sorted(seen) == list(range(len(sequences)))
+
+    for indices, padded in ra.iterBuckets(batch_size=4, boundaries=[6]):
+        assert len(set(ra.lengths[indices] < 6)) == 1
+
+def test_padStack():
+    a = [np.arange(3), np.arange(5), np.arange(1)]
+    b = padStack(a)
+    assert b.dtype == np.float64
+    np.testing.assert_array_equal(b, [[0, 1, 2, 0, 0], [0, 1, 2, 3, 4], [0, 0, 0, 0, 0]])
@@ -0,0 +1,42 @@
+import os
+import sys
+sys.path.insert(0, os.getcwd())
+
+import numpy as np
+import scipy.stats as stats
+import pytest
+
+from slidingWindow import *
+
+@pytest.fixture(params=[(), (3, )])
+def labels(request):
+    rng = np.random.RandomState(0)
+    return rng.randint(0, 4, size=(200, ) + request.param)
+
+@pytest.mark.parametrize("window_size", [1, 7, 20])
+@pytest.mark.parametrize("shift", [1, 3])
+def test_sliding_reductions(labels, window_size, shift):
+    num_sample = getNumSample(len(labels), window_size, shift)
+    windows = [labels[i * shift:i * shift + window_size] for i in range(num_sample)]
+
+    expected = np.array([stats.mode(w, keepdims=False)[0] for w in windows])
+    np.testing.assert_array_equal(slidingMode(labels, window_size, shift), expected)
+    np.testing.assert_allclose(slidingMean(labels, window_size, shift), np.array([w.mean(axis=0) for w in windows]))
+    np.testing.assert_array_equal(slidingMax(labels, window_size, shift), np.array([w.max(axis=0) for w in windows]))
+
+    majority = slidingMajority(labels, window_size, shift, threshold=0.6, fill=-1)
+    counts = np.array([stats.mode(w, keepdims=False)[1] for w in windows])
+    np.testing.assert_array_equal(majority, np.where(counts >= 0.6 * window_size, expected, -1))
+
+def test_sliding_mode_sorting_fallback(monkeypatch):
+    rng = np.random.RandomState(1)
+    x = rng.randint(0, 1000, size=300)
+    expected = slidingMode(x, 10, 2)
+    monkeypatch.setattr(sys.modules["slidingWindow"], "MAX_COUNT_CELLS", 0)
+    np.testing.assert_array_equal(slidingMode(x, 10, 2), expected)
+
+def test_sliding_empty():
+    assert slidingMode(np.zeros(5), 10, 2).shape == (0, )
+    assert slidingReduce(np.zeros((5, 2)), 10, 2, how="max").shape == (0, 2)
+    with pytest.raises(ValueError):
+        slidingReduce(np.zeros(5), 2, 1, how="median")
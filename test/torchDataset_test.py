@@ -0,0 +1,48 @@
+import os
+import sys
+sys.path.insert(0, os.getcwd())
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from torchDataset import *
+from featureExtractor import batchExtractor
+from batchExtractor_test import syntheticExtractor, recipe
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_cache_dataset(tmp_path, recipe, num_workers):
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4)
+    num_sample = len(be.getXy(recipe=dict(recipe), isFlattened=True, isOnehot=False)["audio"])
+
+    dataset = cacheDataset(be, recipe, isFlattened=True, shuffle_buffer=16, seed=0)
+    loader = torch.utils.data.DataLoader(dataset, batch_size=8, num_workers=num_workers, drop_last=True)
+
+    def run(epoch):
+        dataset.set_epoch(epoch)
+        return [batch["audio"] for batch in loader]
+
+    batches = run(0)
+    assert all(batch.shape[0] == 8 for batch in batches)
+    # drop_last drops at most one partial batch per worker
+    assert num_sample - max(num_workers, 1) * 8 < 8 * len(batches) <= num_sample
+    assert all(torch.equal(a, b) for a, b in zip(batches, run(0)))
+    assert not all(torch.equal(a, b) for a, b in zip(batches, run(1)))
+
+def test_persistent_workers(tmp_path, recipe):
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/")
+    be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4)
+    be.getXy(recipe=dict(recipe), isFlattened=True, isOnehot=False)
+
+    dataset = cacheDataset(be, recipe, isFlattened=True, shuffle_buffer=16, seed=0)
+    loader = torch.utils.data.DataLoader(dataset, batch_size=8, num_workers=2, persistent_workers=True)
+
+    def run(epoch):
+        dataset.set_epoch(epoch)
+        return torch.cat([batch["audio"] for batch in loader])
+
+    # the workers started by the first epoch read the epoch of the next ones
+    first, second, again = run(0), run(1), run(0)
+    assert not torch.equal(first, second)
+    assert torch.equal(first, again)
@@ -0,0 +1,39 @@
+import os
+import sys
+import warnings
+sys.path.insert(0, os.getcwd())
+warnings.filterwarnings('ignore', category=DeprecationWarning)
+warnings.filterwarnings('ignore', category=FutureWarning)
+
+import numpy as np
+import pytest
+
+from vae import *
+from vaeNumpy import *
+
+@pytest.mark.parametrize("input_shape", [(30, ), (28, 28, 1)])
+def test_numpy_vae(tmp_path, input_shape):
+    latent_dim = 3
+    vae, encoder, decoder, vae_loss = build_vae(input_shape, latent_dim=latent_dim)
+    # random biases as well as kernels
+    rng = np.random.RandomState(0)
+    for model in [encoder, decoder]:
+        for layer in model.layers:
+            weights = layer.get_weights()
+            if len(weights) > 0:
+                layer.set_weights([rng.randn(*w.shape).astype(np.float32) * 0.1 for w in weights])
+
+    path = str(tmp_path / "vae.npz")
+    export_vae(encoder, decoder, path)
+    numpy_vae = numpyVae(path)
+
+    x = rng.rand(37, *input_shape).astype(np.float32)
+    z_mean, z_log_var, _ = encoder.predict(x)
+    numpy_z_mean, numpy_z_log_var = numpy_vae.encode(x, batch_size=16)
+    assert numpy_z_mean.dtype == np.float32
+    np.testing.assert_allclose(numpy_z_mean, z_mean, atol=1e-5)
+    np.testing.assert_allclose(numpy_z_log_var, z_log_var, atol=1e-5)
+
+    z = rng.randn(37, latent_dim).astype(np.float32)
+    np.testing.assert_allclose(numpy_vae.decode(z, batch_size=10), decoder.predict(z), atol=1e-5)
+    assert numpy_vae.predict(x).shape == (37, ) + input_shape
@@ -0,0 +1,42 @@
+import os
+import sys
+import warnings
+sys.path.insert(0, os.getcwd())
+warnings.filterwarnings('ignore', category=DeprecationWarning)
+warnings.filterwarnings('ignore', category=FutureWarning)
+
+import numpy as np
+import pytest
+
+from vae import *
+from featureExtractor import batchExtractor
+from util.cv_util import groupedNorm
+from batchExtractor_test import syntheticExtractor, recipe
+
+@pytest.mark.parametrize("input_shape", [(20*20, ), (20, 20, 1)])
+def test_cache_batch_generator(tmp_path, recipe, input_shape):
+    fextractor = syntheticExtractor(cache_dir=str(tmp_path) + "/", mmap_mode="r")
+    be = batchExtractor(fextractor, window_size=20, cache_dir=str(tmp_path) + "/", sample_shift=4)
+    scaler = groupedNorm().fitCache(fextractor, recipe["audio"], modality="audio")
+    batch_size = 8
+
+    steps = cache_steps_per_epoch(be, recipe, modality="audio", batch_size=batch_size)
+    generator = cache_batch_generator(be, recipe, modality="audio", batch_size=batch_size,
+                                      input_shape=input_shape, scaler=scaler,
+                                      shuffle_buffer=32, epochs=2, seed=1)
+    batches = list(generator)
+    assert len(batches) == 2 * steps
+    for x, y in batches:
+        assert x is y
+        assert x.shape == (batch_size, ) + input_shape and x.dtype == np.float32
+        assert x.min() >= 0 and x.max() <= 1
+    # reshuffled between epochs
+    assert not np.array_equal(batches[0][0], batches[steps][0])
+
+    vae, encoder, decoder, loss = build_vae(input_shape, latent_dim=2)
+    # vae_loss closes over symbolic tensors of graph mode keras, the generator is what is tested here
+    vae.compile(optimizer="adam", loss="mse")
+    generator = cache_batch_generator(be, recipe, modality="audio", batch_size=batch_size,
+                                      input_shape=input_shape, scaler=scaler, seed=1)
+    history = vae.fit(generator, steps_per_epoch=steps, epochs=2, verbose=0)
+    assert np.all(np.isfinite(history.history["loss"]))
@@ -0,0 +1,58 @@
+"""
+PyTorch adapter of fileSampler
+
+    dataset = cacheDataset(be, recipe, shuffle_buffer=4096, groups=speakers)
+    loader = torch.utils.data.DataLoader(dataset, batch_size=128, num_workers=4, drop_last=True)
+    for epoch in range(num_epochs):
+        dataset.set_epoch(epoch)
+        for batch in loader:
+            ...
+
+Every DataLoader worker streams its own block of files, so nothing but the
+recipe is sent to the workers and their memory does not grow with the
+dataset. Do not pass shuffle=True or a sampler to the DataLoader: the order
+is given by the dataset from its seed and epoch. The epoch is shared with
+the worker processes, so that persistent_workers=True is supported.
+"""
+import multiprocessing
+
+import torch
+
+from fileSampler import fileSampler
+
+class cacheDataset(torch.utils.data.IterableDataset):
+    """
+    Iterable dataset of windowed samples read from the feature cache
+
+    Parameters are those of fileSampler. Samples are dictionaries of NumPy
+    arrays converted to tensors by the default collate function.
+    """
+    def __init__(self,
+                 batch_extractor,
+                 recipe:dict,
+                 **kwargs):
+        super().__init__()
+        self.sampler = fileSampler(batch_extractor, recipe, **kwargs)
+        # shared memory read by the workers, which keep their own copy of
+        # the dataset across epochs with persistent_workers
+        self._epoch = multiprocessing.Value("q", 0, lock=False)
+
+    @property
+    def epoch(self) -> int:
+        return self._epoch.value
+
+    def set_epoch(self,
+                  epoch:int):
+        """
+        select the file order and shuffling of an epoch, to be called in
+        the main process before iterating the DataLoader
+        """
+        self._epoch.value = epoch
+
+    def __iter__(self):
+        worker_info = torch.utils.data.get_worker_info()
+        if worker_info is None:
+            worker_id, num_workers = 0, 1
+        else:
+            worker_id, num_workers = worker_info.id, worker_info.num_workers
+        return self.sampler.iterate(self.epoch, worker_id=worker_id, num_workers=num_workers)
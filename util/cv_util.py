@@ -0,0 +1,172 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+class groupedNorm():
+    """
+    Grouped scaler with single-pass, mergeable statistics
+
+    The leading grouped_dim axes of an array index the samples, and
+    min, max, mean and variance are computed for each element of the
+    remaining axes. For example, landmarks of shape (frames, 68, 2) with
+    grouped_dim=1 give statistics of shape (68, 2).
+
+    Mean and variance are accumulated with Welford's algorithm in the
+    parallel form of Chan et al., so that partial statistics of chunks,
+    files or workers can be merged exactly without keeping the data.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.grouped_dim = None
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+        self.min = None
+        self.max = None
+        return self
+
+    @property
+    def var(self):
+        return self.m2 / self.count
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    def _merge(self,
+               count:int,
+               mean,
+               m2,
+               min,
+               max):
+        if count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2, self.min, self.max = count, mean, m2, min, max
+            return self
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + delta**2 * (self.count * count / total)
+        self.min = np.minimum(self.min, min)
+        self.max = np.maximum(self.max, max)
+        self.count = total
+        return self
+
+    def partialFit(self,
+                   array,
+                   grouped_dim:int = 1):
+        """
+        update the statistics with a chunk of samples
+        """
+        if self.grouped_dim is not None and self.grouped_dim != grouped_dim:
+            raise ValueError("grouped_dim {0} differs from the fitted {1}".format(grouped_dim, self.grouped_dim))
+        self.grouped_dim = grouped_dim
+        array = np.asarray(array, dtype=np.float64)
+        array = array.reshape((-1, ) + array.shape[grouped_dim:])
+        if len(array) == 0:
+            return self
+        mean = array.mean(axis=0)
+        m2 = np.square(array - mean).sum(axis=0)
+        return self._merge(len(array), mean, m2, array.min(axis=0), array.max(axis=0))
+
+    def computeScaler(self,
+                      array,
+                      grouped_dim:int = 1):
+        """
+        compute the statistics of an array from scratch
+        """
+        return self.reset().partialFit(array, grouped_dim=grouped_dim)
+
+    def merge(self,
+              other):
+        """
+        merge the statistics computed by another groupedNorm
+        """
+        if other.count == 0:
+            return self
+        if self.grouped_dim is not None and self.grouped_dim != other.grouped_dim:
+            raise ValueError("grouped_dim {0} differs from {1}".format(other.grouped_dim, self.grouped_dim))
+        self.grouped_dim = other.grouped_dim
+        return self._merge(other.count, other.mean, other.m2, other.min, other.max)
+
+    def fitCache(self,
+                 extractor,
+                 fileList:list,
+                 modality:str = "",
+                 num_workers:int = 0,
+                 verbose:int = 0):
+        """
+        stream over the per-file caches of a featureExtractor
+
+        Each file is reduced to partial statistics, computed on a thread
+        pool when num_workers is positive, and merged in file order.
+        Only num_workers files are held in memory at a time.
+        Files which are not cached yet are extracted on the calling thread.
+        """
+        def partial(fileName):
+            try:
+                features = extractor.loadCacheFile(extractor.makeCachePath(fileName, modality))
+            except FileNotFoundError:
+                return None
+            return groupedNorm().computeScaler(features, grouped_dim=1)
+
+        def merge(fileName, stats):
+            if stats is None:
+                features = extractor.getXy(fileName=fileName, modality=modality, verbose=verbose)
+                stats = groupedNorm().computeScaler(features, grouped_dim=1)
+            self.merge(stats)
+
+        if num_workers > 0:
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                for fileName, stats in zip(fileList, executor.map(partial, fileList)):
+                    merge(fileName, stats)
+        else:
+            for fileName in fileList:
+                merge(fileName, partial(fileName))
+        return self
+
+    def transform(self,
+                  array,
+                  how:str = "minmax",
+                  eps:float = 1e-8):
+        """
+        normalize an array of shape (..., *statistics shape)
+
+        how: string, optional, default="minmax"
+            "minmax" scales into [0, 1] and "standard" to zero mean and unit variance
+        """
+        if self.count == 0:
+            raise ValueError("groupedNorm has not been fitted")
+        if how == "minmax":
+            return (array - self.min) / np.maximum(self.max - self.min, eps)
+        elif how == "standard":
+            return (array - self.mean) / np.maximum(self.std, eps)
+        raise ValueError("unknown normalization: {0}".format(how))
+
+    def inverseTransform(self,
+                         array,
+                         how:str = "minmax",
+                         eps:float = 1e-8):
+        if how == "minmax":
+            return array * np.maximum(self.max - self.min, eps) + self.min
+        elif how == "standard":
+            return array * np.maximum(self.std, eps) + self.mean
+        raise ValueError("unknown normalization: {0}".format(how))
+
+    def save(self,
+             path:str):
+        np.savez(path, grouped_dim=self.grouped_dim, count=self.count,
+                 mean=self.mean, m2=self.m2, min=self.min, max=self.max)
+
+    @classmethod
+    def load(cls,
+             path:str):
+        gn = cls()
+        with np.load(path) as data:
+            gn.grouped_dim = int(data["grouped_dim"])
+            gn.count = int(data["count"])
+            gn.mean, gn.m2, gn.min, gn.max = data["mean"], data["m2"], data["min"], data["max"]
+        return gn
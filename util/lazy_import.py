@@ -0,0 +1,37 @@
+import importlib
+
+class lazyImport():
+    """
+    Proxy of a module, or of an attribute of a module, imported on first use
+
+    >>> cv2 = lazyImport("cv2")
+    >>> tqdm = lazyImport("tqdm", "tqdm")
+
+    The import happens when an attribute of the proxy is accessed or the
+    proxy is called, so that modules which only read cached features do
+    not pay for heavy dependencies at import time.
+    """
+    def __init__(self,
+                 module:str,
+                 attribute:str = None):
+        self._module = module
+        self._attribute = attribute
+        self._target = None
+
+    def _resolve(self):
+        if self._target is None:
+            target = importlib.import_module(self._module)
+            if self._attribute is not None:
+                target = getattr(target, self._attribute)
+            self._target = target
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        name = self._module if self._attribute is None else self._module + "." + self._attribute
+        return "<lazyImport {0}>".format(name)
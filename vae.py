@@ -5,21 +5,27 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from sklearn.manifold import TSNE
-
-from keras.layers import Lambda, Input, Dense, Conv2D, Conv2DTranspose, Flatten, Reshape
-from keras.models import Model
-from keras.datasets import mnist
-from keras.losses import mse, binary_crossentropy
-from keras.utils import plot_model
-from keras import backend as K
-
 import itertools
 import numpy as np
-import matplotlib.pyplot as plt
 import argparse
 import os
 
+# keras, sklearn and matplotlib are imported on first use
+from util.lazy_import import lazyImport
+Lambda = lazyImport("keras.layers", "Lambda")
+Input = lazyImport("keras.layers", "Input")
+Dense = lazyImport("keras.layers", "Dense")
+Conv2D = lazyImport("keras.layers", "Conv2D")
+Conv2DTranspose = lazyImport("keras.layers", "Conv2DTranspose")
+Flatten = lazyImport("keras.layers", "Flatten")
+Reshape = lazyImport("keras.layers", "Reshape")
+Model = lazyImport("keras.models", "Model")
+mnist = lazyImport("keras.datasets.mnist")
+mse = lazyImport("keras.losses", "mse")
+binary_crossentropy = lazyImport("keras.losses", "binary_crossentropy")
+plot_model = lazyImport("keras.utils", "plot_model")
+K = lazyImport("keras.backend")
+
 # reparameterization trick
 # instead of sampling from Q(z|X), sample epsilon = N(0,I)
 # z = z_mean + sqrt(var) * epsilon
@@ -44,7 +50,11 @@ def sampling(args):
 def plot_results(models,
                  data,
                  batch_size=128,
-                 model_name="vae_mnist"):
+                 model_name="vae_mnist",
+                 grid_size=30,
+                 max_points=10000,
+                 projection="pca",
+                 show=False):
     """Plots labels and MNIST digits as a function of the 2D latent vector
 
     # Arguments
@@ -52,65 +62,31 @@ def plot_results(models,
         data (tuple): test data and label
         batch_size (int): prediction batch size
         model_name (string): which model is using this function
+        grid_size (int): number of decoded samples along each axis of the manifold
+        max_points (int): test data is subsampled per label to this many points
+        projection (string): "pca", "tsne" or "pca+tsne" when latent_dim > 2
+        show (bool): open a window in addition to saving the figures
     """
+    from latentAnalysis import encodeMean, stratifiedSubsample, projectLatent, \
+        decodeManifold, plotLatent, plotManifold
 
     encoder, decoder = models
     x_test, y_test = data
     os.makedirs(model_name, exist_ok=True)
 
-    filename = os.path.join(model_name, "vae_mean.png")
     # display a 2D plot of the digit classes in the latent space
-    z_mean, _, _ = encoder.predict(x_test,
-                                   batch_size=batch_size)
-
-    plt.figure(figsize=(12, 10))
-
-    if len(y_test.shape) > 1:
-        colormap = np.argmax(y_test, axis=1)
-    else:
-        colormap = y_test
-
-    if z_mean.shape[1] > 2:
-        z_mean = TSNE(n_components=2).fit_transform(z_mean)
-    plt.scatter(z_mean[:, 0], z_mean[:, 1], c=colormap)
-
-    plt.colorbar()
-    plt.xlabel("z[0]")
-    plt.ylabel("z[1]")
-    plt.savefig(filename)
-    plt.show()
-
-    filename = os.path.join(model_name, "digits_over_latent.png")
-    # display a 30x30 2D manifold of digits
-    n = 30
-    digit_size = 28
-    figure = np.zeros((digit_size * n, digit_size * n))
-    # linearly spaced coordinates corresponding to the 2D plot
-    # of digit classes in the latent space
-    grid_x = np.linspace(-4, 4, n)
-    grid_y = np.linspace(-4, 4, n)[::-1]
-
-    for i, yi in enumerate(grid_y):
-        for j, xi in enumerate(grid_x):
-            z_sample = np.array([[xi, yi]])
-            x_decoded = decoder.predict(z_sample)
-            digit = x_decoded[0].reshape(digit_size, digit_size)
-            figure[i * digit_size: (i + 1) * digit_size,
-                   j * digit_size: (j + 1) * digit_size] = digit
-
-    plt.figure(figsize=(10, 10))
-    start_range = digit_size // 2
-    end_range = (n - 1) * digit_size + start_range + 1
-    pixel_range = np.arange(start_range, end_range, digit_size)
-    sample_range_x = np.round(grid_x, 1)
-    sample_range_y = np.round(grid_y, 1)
-    plt.xticks(pixel_range, sample_range_x)
-    plt.yticks(pixel_range, sample_range_y)
-    plt.xlabel("z[0]")
-    plt.ylabel("z[1]")
-    plt.imshow(figure, cmap='Greys_r')
-    plt.savefig(filename)
-    plt.show()
+    idx = stratifiedSubsample(y_test, max_points)
+    z_mean = encodeMean(encoder, x_test[idx], batch_size=batch_size)
+    plotLatent(projectLatent(z_mean, method=projection), y_test[idx],
+               filename=os.path.join(model_name, "vae_mean.png"), show=show)
+
+    # display a 2D manifold of digits
+    figure, grid_x, grid_y = decodeManifold(decoder,
+                                            grid_size=grid_size,
+                                            latent_dim=z_mean.shape[1],
+                                            batch_size=max(batch_size, grid_size * grid_size))
+    plotManifold(figure, grid_x, grid_y,
+                 filename=os.path.join(model_name, "digits_over_latent.png"), show=show)
 
 # Define custom loss
 def vae_loss(enable_mse, beta, original_dim, z_mean, z_log_var):
@@ -155,8 +131,8 @@ def build_vae(input_shape: tuple,
               beta: float = 1.0,
               enable_mse: bool = False,
               enable_graph: bool = False,
-              verbose: int = 0):
-    intermediate_dim = 512
+              verbose: int = 0,
+              intermediate_dim: int = 512):
     original_dim = np.prod(input_shape)
     
     if verbose > 0:
@@ -231,3 +207,74 @@ def build_vae(input_shape: tuple,
     vae = Model(inputs, outputs, name='vae_mlp')
 
     return vae, encoder, decoder, vae_loss(enable_mse, beta, original_dim, z_mean, z_log_var)
+
+def cache_steps_per_epoch(batch_extractor,
+                          recipe: dict,
+                          modality: str = "visual",
+                          batch_size: int = 128):
+    """Number of full minibatches per epoch of cache_batch_generator
+
+    # Arguments
+        batch_extractor: featureExtractor.batchExtractor
+        recipe: dictionary of file lists as in batchExtractor.getXy
+
+    # Returns
+        steps_per_epoch passed to Model.fit
+    """
+    plan = batch_extractor.planRecipe({modality: recipe[modality]})
+    return int(plan["num_total_sample"][modality] // batch_size)
+
+def cache_batch_generator(batch_extractor,
+                          recipe: dict,
+                          modality: str = "visual",
+                          batch_size: int = 128,
+                          input_shape: tuple = None,
+                          scaler = None,
+                          scale_how: str = "minmax",
+                          shuffle_buffer: int = 4096,
+                          epochs: int = None,
+                          seed: int = 0,
+                          prefetch: int = 2):
+    """Streams (x, x) minibatches of windowed features from the cache into Model.fit
+
+    The whole dataset is never materialized: files are read one by one
+    through batchExtractor.iter_batches on a background thread, normalized
+    per file with the fitted scaler and windowed on the fly. The file order
+    is reshuffled every epoch and windows of consecutive files are mixed
+    in a shuffle buffer, so minibatches are not dominated by one speaker.
+    Combined with featureExtractor(mmap_mode="r"), only the frames being
+    windowed are read from uncompressed cache files.
+
+    # Arguments
+        batch_extractor: featureExtractor.batchExtractor with positive sample_shift
+        recipe: dictionary of file lists, only recipe[modality] is used
+        input_shape: shape of a sample given to build_vae, e.g. (window, dim, 1).
+            Samples are flattened when it is one dimensional.
+        scaler: util.cv_util.groupedNorm fitted on the per-frame features
+        shuffle_buffer: number of windows mixed across files
+        epochs: number of passes over the recipe, None repeats forever
+        seed: base seed, epoch e uses seed + e for a reproducible order
+
+    # Returns
+        generator of (x, x) float32 minibatches of batch_size samples
+    """
+    fileList = recipe[modality]
+    isFlattened = input_shape is not None and len(input_shape) == 1
+    scalers = None if scaler is None else {modality: scaler}
+    epoch = 0
+    while epochs is None or epoch < epochs:
+        order = np.random.RandomState(seed + epoch).permutation(len(fileList))
+        for batch in batch_extractor.iter_batches({modality: [fileList[i] for i in order]},
+                                                  batch_size=batch_size,
+                                                  shuffle_buffer=shuffle_buffer,
+                                                  isFlattened=isFlattened,
+                                                  drop_last=True,
+                                                  prefetch=prefetch,
+                                                  seed=seed + epoch,
+                                                  scalers=scalers,
+                                                  scale_how=scale_how):
+            x = batch[modality].astype(np.float32, copy=False)
+            if input_shape is not None:
+                x = x.reshape((len(x), ) + tuple(input_shape))
+            yield x, x
+        epoch += 1
@@ -0,0 +1,204 @@
+# NumPy-only inference of encoders and decoders built by vae.build_vae
+#
+# export_vae() pulls the weights out of the keras models once, and
+# numpyVae runs z_mean / z_log_var / decode without importing keras or
+# tensorflow, with float32 math and buffers reused across batches.
+
+import json
+import numpy as np
+
+# layers of build_vae which are computed by numpyVae
+SUPPORTED_LAYERS = ["Dense", "Conv2D", "Conv2DTranspose", "Flatten", "Reshape"]
+# layers which have nothing to compute at inference
+SKIPPED_LAYERS = ["InputLayer", "Lambda"]
+
+def _exportLayers(layers, arrays, prefix):
+    meta = []
+    for layer in layers:
+        kind = layer.__class__.__name__
+        if kind in SKIPPED_LAYERS:
+            continue
+        if kind not in SUPPORTED_LAYERS:
+            raise ValueError("layer {0} of type {1} is not supported".format(layer.name, kind))
+        config = layer.get_config()
+        entry = {"type": kind, "name": layer.name}
+        if kind in ["Dense", "Conv2D", "Conv2DTranspose"]:
+            kernel, bias = layer.get_weights()
+            key = "{0}/{1}".format(prefix, len(meta))
+            arrays[key + "/kernel"] = kernel.astype(np.float32)
+            arrays[key + "/bias"] = bias.astype(np.float32)
+            entry.update(key=key, activation=config["activation"])
+        if kind in ["Conv2D", "Conv2DTranspose"]:
+            entry.update(strides=list(config["strides"]), padding=config["padding"])
+        if kind == "Reshape":
+            entry.update(target_shape=list(config["target_shape"]))
+        meta.append(entry)
+    return meta
+
+def export_vae(encoder,
+               decoder,
+               path:str):
+    """Export the weights of build_vae encoder and decoder into a npz file
+
+    # Arguments
+        encoder (Model): encoder returned by build_vae
+        decoder (Model): decoder returned by build_vae
+        path (string): output npz file
+    """
+    arrays = dict()
+    heads = [layer for layer in encoder.layers if layer.name in ["z_mean", "z_log_var"]]
+    trunk = [layer for layer in encoder.layers if layer.name not in ["z_mean", "z_log_var"]]
+    meta = {
+        "input_shape": list(encoder.input_shape[1:]),
+        "encoder": _exportLayers(trunk, arrays, "encoder"),
+        "heads": _exportLayers(heads, arrays, "heads"),
+        "decoder": _exportLayers(decoder.layers, arrays, "decoder"),
+    }
+    np.savez(path, meta=json.dumps(meta), **arrays)
+
+def _activate(x, activation):
+    if activation == "relu":
+        np.maximum(x, 0, out=x)
+    elif activation == "sigmoid":
+        with np.errstate(over="ignore"):
+            np.negative(x, out=x)
+            np.exp(x, out=x)
+            x += 1
+            np.reciprocal(x, out=x)
+    elif activation != "linear":
+        raise ValueError("activation {0} is not supported".format(activation))
+    return x
+
+def _samePadding(size, kernel, stride):
+    out = -(-size // stride)
+    total = max((out - 1) * stride + kernel - size, 0)
+    return out, total // 2, total - total // 2
+
+class _layer():
+    def __init__(self, entry, arrays):
+        self.entry = entry
+        self.kind = entry["type"]
+        if "key" in entry:
+            self.kernel = arrays[entry["key"] + "/kernel"]
+            self.bias = arrays[entry["key"] + "/bias"]
+        self.buffers = dict()
+
+    def _buffer(self, name, shape):
+        """
+        buffer reused while the batch shape does not change
+        """
+        if name not in self.buffers or self.buffers[name].shape != shape:
+            self.buffers[name] = np.empty(shape, dtype=np.float32)
+        return self.buffers[name]
+
+    def forward(self, x):
+        if self.kind == "Dense":
+            out = self._buffer("out", (len(x), self.kernel.shape[1]))
+            np.matmul(x, self.kernel, out=out)
+            out += self.bias
+            return _activate(out, self.entry["activation"])
+        elif self.kind == "Flatten":
+            return x.reshape(len(x), -1)
+        elif self.kind == "Reshape":
+            return x.reshape((len(x), ) + tuple(self.entry["target_shape"]))
+        elif self.kind == "Conv2D":
+            return self._conv2d(x)
+        else:
+            return self._conv2dTranspose(x)
+
+    def _conv2d(self, x):
+        kh, kw, channels, filters = self.kernel.shape
+        sh, sw = self.entry["strides"]
+        n, h, w, _ = x.shape
+        if self.entry["padding"] == "same":
+            ho, top, bottom = _samePadding(h, kh, sh)
+            wo, left, right = _samePadding(w, kw, sw)
+            x = np.pad(x, ((0, 0), (top, bottom), (left, right), (0, 0)))
+        else:
+            ho, wo = (h - kh) // sh + 1, (w - kw) // sw + 1
+        # im2col: (n, ho, wo, kh, kw, channels) patches against the kernel
+        patches = np.lib.stride_tricks.sliding_window_view(x, (kh, kw), axis=(1, 2))[:, ::sh, ::sw][:, :ho, :wo]
+        columns = self._buffer("columns", (n, ho, wo, kh, kw, channels))
+        np.copyto(columns, patches.transpose(0, 1, 2, 4, 5, 3))
+        out = self._buffer("out", (n * ho * wo, filters))
+        np.matmul(columns.reshape(n * ho * wo, -1), self.kernel.reshape(-1, filters), out=out)
+        out += self.bias
+        return _activate(out, self.entry["activation"]).reshape(n, ho, wo, filters)
+
+    def _conv2dTranspose(self, x):
+        kh, kw, filters, channels = self.kernel.shape
+        sh, sw = self.entry["strides"]
+        n, h, w, _ = x.shape
+        # scatter every input pixel through the kernel onto the full output
+        full = self._buffer("full", (n, (h - 1) * sh + kh, (w - 1) * sw + kw, filters))
+        full.fill(0)
+        contribution = self._buffer("contribution", (n, h, w, filters))
+        for a in range(kh):
+            for b in range(kw):
+                np.matmul(x, self.kernel[a, b].T, out=contribution)
+                full[:, a:a + (h - 1) * sh + 1:sh, b:b + (w - 1) * sw + 1:sw] += contribution
+        if self.entry["padding"] == "same":
+            # crop as the gradient of a "same" convolution from (h * sh, w * sw)
+            top = max(kh - sh, 0) // 2
+            left = max(kw - sw, 0) // 2
+            full = full[:, top:top + h * sh, left:left + w * sw]
+        out = full + self.bias
+        return _activate(out, self.entry["activation"])
+
+class numpyVae():
+    """
+    Inference runtime of a VAE exported by export_vae
+
+    Outputs match keras within float32 tolerance.
+    """
+    def __init__(self,
+                 path:str):
+        with np.load(path) as data:
+            arrays = {key: data[key] for key in data.files if key != "meta"}
+            meta = json.loads(str(data["meta"]))
+        self.input_shape = tuple(meta["input_shape"])
+        self.encoder = [_layer(entry, arrays) for entry in meta["encoder"]]
+        self.heads = {entry["name"]: _layer(entry, arrays) for entry in meta["heads"]}
+        self.decoder = [_layer(entry, arrays) for entry in meta["decoder"]]
+        self.latent_dim = self.heads["z_mean"].kernel.shape[1]
+
+    def _run(self, layers, x):
+        for layer in layers:
+            x = layer.forward(x)
+        return x
+
+    def encode(self,
+               x,
+               batch_size:int = 1024):
+        """
+        z_mean and z_log_var of x of shape (samples, *input_shape)
+        """
+        x = np.asarray(x, dtype=np.float32).reshape((-1, ) + self.input_shape)
+        z_mean = np.empty((len(x), self.latent_dim), dtype=np.float32)
+        z_log_var = np.empty((len(x), self.latent_dim), dtype=np.float32)
+        for start in range(0, len(x), batch_size):
+            h = self._run(self.encoder, x[start:start + batch_size])
+            z_mean[start:start + batch_size] = self.heads["z_mean"].forward(h)
+            z_log_var[start:start + batch_size] = self.heads["z_log_var"].forward(h)
+        return z_mean, z_log_var
+
+    def decode(self,
+               z,
+               batch_size:int = 1024):
+        z = np.asarray(z, dtype=np.float32).reshape(-1, self.latent_dim)
+        outputs = None
+        for start in range(0, len(z), batch_size):
+            decoded = self._run(self.decoder, z[start:start + batch_size])
+            if outputs is None:
+                outputs = np.empty((len(z), ) + decoded.shape[1:], dtype=np.float32)
+            outputs[start:start + batch_size] = decoded
+        return outputs
+
+    def predict(self,
+                x,
+                batch_size:int = 1024):
+        """
+        reconstruction of x decoded from z_mean
+        """
+        z_mean, _ = self.encode(x, batch_size=batch_size)
+        return self.decode(z_mean, batch_size=batch_size)